@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""! Micro-benchmark of transports used to send events from connection process to host
+
+Usage: python benchmarks/event_transport.py [number_of_events]
+
+Producer process sends '__rxd_line' events (as connection process does) and host
+process reads them with EventQueueReader. Each transport is measured with and
+without event batching. Producer CPU time includes multiprocessing.Queue feeder thread.
+"""
+
+import sys
+import resource
+from time import time
+from multiprocessing import Process
+from mbed_host_tests.host_tests_conn_proxy.conn_queue import EventBatcher
+from mbed_host_tests.host_tests_conn_proxy.conn_queue import EventQueueReader
+from mbed_host_tests.host_tests_conn_proxy.conn_queue import create_event_queue
+
+
+def producer(event_queue, count, batch_size):
+    event_batcher = EventBatcher(event_queue, batch_size=batch_size)
+    line = "[1479734218.45][CONN][RXD] >>> Running case #1: 'Basic'..."
+    for i in range(count):
+        event_batcher.put(('__rxd_line', line, time()))
+    event_batcher.flush()
+
+
+def benchmark(transport, count, batch_size):
+    """! Measure how many events per second host receives using given transport
+    @return Tuple with events per second and producer CPU time in microseconds per event
+    """
+    event_queue = create_event_queue(transport)
+    event_reader = EventQueueReader(event_queue)
+    p = Process(target=producer, args=(event_queue, count, batch_size))
+    rusage_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time()
+    p.start()
+    for _ in range(count):
+        event_reader.get(timeout=10)
+    elapsed = time() - start
+    p.join()
+    rusage_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_time = (rusage_end.ru_utime + rusage_end.ru_stime) - (rusage_start.ru_utime + rusage_start.ru_stime)
+    return count / elapsed, cpu_time * 1e6 / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print "%-10s %-10s %15s %20s"% ('transport', 'batch', 'events/sec', 'producer us/event')
+    for transport in ['queue', 'shm']:
+        for batch_size in [1, 64]:
+            events_per_sec, cpu_per_event = benchmark(transport, count, batch_size)
+            print "%-10s %-10d %15.0f %20.2f"% (transport, batch_size, events_per_sec, cpu_per_event)
+
+
+if __name__ == '__main__':
+    main()
@@ -164,8 +164,9 @@ def enum_host_tests(path, verbose=False):
                                     print "HOST: Registering '%s' as '%s'"% (str(host_test_cls), host_test_name)
                                 HOSTREGISTRY.register_host_test(host_test_name, host_test_cls())
 
-def init_host_test_cli_params():
+def init_host_test_cli_params(args=None):
     """! Function creates CLI parser object and returns populated options object.
+    @param args List of command line arguments, sys.argv[1:] is used when None
     @return Function returns 'options' object returned from OptionParser class
     @details Options object later can be used to populate host test selector script.
     """
@@ -236,6 +237,104 @@ def init_host_test_cli_params():
                       type="float",
                       help="This sets the maximum time in seconds to wait for an internal process to start. This mostly only affects machines under heavy load (Default is 60 seconds)")
 
+    parser.add_option("--event-batch-size",
+                      dest="event_batch_size",
+                      default=1,
+                      metavar="NUMBER",
+                      type="int",
+                      help="Maximum number of events connection process sends to host in one batch. Batches are flushed when DUT goes idle. Value 1 disables batching (Default is 1)")
+
+    parser.add_option("--event-queue-size",
+                      dest="event_queue_size",
+                      default=0,
+                      metavar="NUMBER",
+                      type="int",
+                      help="Maximum number of events (or batches of events) waiting for host test. When host test can't keep up with DUT --overflow-policy is applied (Default is 0, unbounded)")
+
+    parser.add_option("--overflow-policy",
+                      dest="overflow_policy",
+                      default='block',
+                      type="choice",
+                      choices=['block', 'drop', 'sample'],
+                      help="What to do when event queue is full: 'block' - stop reading from DUT until host test reads events, 'drop' - drop oldest __rxd_line events, 'sample' - pass only every N-th __rxd_line event (see --overflow-sample-rate). Key-Value events are never dropped (Default is 'block')")
+
+    parser.add_option("--overflow-sample-rate",
+                      dest="overflow_sample_rate",
+                      default=10,
+                      metavar="N",
+                      type="int",
+                      help="Every N-th __rxd_line event is passed to host test when event queue is full and --overflow-policy=sample is used (Default is 10)")
+
+    parser.add_option("--event-transport",
+                      dest="event_transport",
+                      default='queue',
+                      type="choice",
+                      choices=['queue', 'shm'],
+                      help="Transport used to send events from connection process to host: 'queue' - multiprocessing.Queue, 'shm' - shared memory ring buffer, POSIX only (Default is 'queue')")
+
+    parser.add_option("--conn-engine",
+                      dest="conn_engine",
+                      default='threads',
+                      type="choice",
+                      choices=['threads', 'evented'],
+                      help="Connection process engine: 'threads' - separate reader and writer threads, 'evented' - single threaded select() event loop, POSIX only (Default is 'threads')")
+
+    parser.add_option("--metrics-period",
+                      dest="metrics_period",
+                      default=0,
+                      metavar="SEC",
+                      type="float",
+                      help="Every SEC seconds report event queue depths, event and byte rates and maximum event age as __metrics event. Summary is always printed at the end of test (Default is 0, periodic reports disabled)")
+
+    parser.add_option("--coverage-dir",
+                      dest="coverage_dir",
+                      default=None,
+                      metavar="DIR",
+                      help="Stream code coverage dumps sent by DUT directly to files in DIR instead of passing them to host test as __coverage_start events")
+
+    parser.add_option("--timing-json",
+                      dest="timing_json",
+                      default=None,
+                      metavar="FILE",
+                      help="Write time spent in each test phase (flashing, reset, sync, test, teardown, ...) to FILE in JSON format")
+
+    parser.add_option("--batch",
+                      dest="batch",
+                      default=None,
+                      metavar="FILE",
+                      help="Run all tests listed in JSON manifest FILE one after another on the same DUT, reusing host process, plugins and connection process. Each test is a dictionary with 'image_path' and optional 'name', 'enum_host_tests', 'copy_method', 'program_cycle_s' and 'skip_flashing' which override command line options")
+
+    parser.add_option("--devices",
+                      dest="devices",
+                      default=None,
+                      metavar="FILE",
+                      help="Run tests on all DUTs listed in JSON manifest FILE in parallel from one process. Each DUT is a dictionary with 'port' and optional 'name', 'disk', 'target_id', 'micro', 'image_path', 'batch', 'copy_method', 'program_cycle_s', 'forced_reset_type' and 'timing_json' which override command line options")
+
+    parser.add_option("--jobs",
+                      dest="jobs",
+                      default=None,
+                      metavar="FILE",
+                      help="Run tests listed in JSON manifest FILE on pool of DUTs listed with --devices option or detected with mbed-ls. Each test is a dictionary with 'image_path', 'platform_name' (or -m option) and optional 'name', 'enum_host_tests', 'copy_method' and 'program_cycle_s'. Tests are sharded across DUTs of the same platform, DUT which already has test's image is preferred")
+
+    parser.add_option("--job-retries",
+                      dest="job_retries",
+                      default=1,
+                      type="int",
+                      metavar="NUMBER",
+                      help="How many times test from --jobs manifest is retried on other DUT after copy, disk or serial port error, default: 1")
+
+    parser.add_option("--stage-workers",
+                      dest="stage_workers",
+                      default=None,
+                      metavar="LIST",
+                      help="Number of workers of --jobs pipeline stages as comma separated STAGE=NUMBER list, e.g. 'flash=2'. Stages are: flash, wait_ready, supervise and teardown, by default each stage has one worker per DUT")
+
+    parser.add_option("--serve",
+                      dest="serve",
+                      default=None,
+                      metavar="SOCK",
+                      help="Run as server accepting mbedhtrun jobs on Unix socket SOCK (POSIX only). Modules, plugins and host tests (including ones from -e directory) are loaded once, each job is run in process forked from server. Use mbedhtrun-client to send jobs")
+
     parser.add_option("-e", "--enum-host-tests",
                       dest="enum_host_tests",
                       help="Define directory with local host tests")
@@ -311,5 +410,5 @@ def init_host_test_cli_params():
     parser.description = """Flash, reset and perform host supervised tests on mbed platforms"""
     parser.epilog = """Example: mbedhtrun -d E: -p COM5 -f "test.bin" -C 4 -c shell -m K64F"""
 
-    (options, _) = parser.parse_args()
+    (options, _) = parser.parse_args(args)
     return options
@@ -90,15 +90,17 @@ class BaseHostTestAbstract(object):
         raise NotImplementedError
 
 
-def event_callback(key):
+def event_callback(key, concurrent=False):
     """
     Decorator for defining a event callback method. Adds a property attribute "event_key" with value as the passed key.
 
     :param key:
+    :param concurrent: If True callback is executed on worker thread, see register_callback()
     :return:
     """
     def decorator(func):
         func.event_key = key
+        func.event_concurrent = concurrent
         return func
     return decorator
 
@@ -108,6 +110,7 @@ class HostTestCallbackBase(BaseHostTestAbstract):
     def __init__(self):
         BaseHostTestAbstract.__init__(self)
         self.__callbacks = {}
+        self.__concurrent_callbacks = set()
         self.__restricted_callbacks = [
             '__coverage_start',
             '__testcase_start',
@@ -172,13 +175,15 @@ class HostTestCallbackBase(BaseHostTestAbstract):
         for name, method in inspect.getmembers(self, inspect.ismethod):
             key = getattr(method, 'event_key', None)
             if key:
-                self.register_callback(key, method)
+                self.register_callback(key, method, concurrent=getattr(method, 'event_concurrent', False))
 
-    def register_callback(self, key, callback, force=False):
+    def register_callback(self, key, callback, force=False, concurrent=False):
         """! Register callback for a specific event (key: event name)
             @param key String with name of the event
             @param callback Callable which will be registstered for event "key"
             @param force God mode
+            @param concurrent If True callback is executed on worker thread and event loop does not
+                   wait for it to return. Callbacks for the same key are still executed in order
         """
 
         # Non-string keys are not allowed
@@ -216,10 +221,18 @@ class HostTestCallbackBase(BaseHostTestAbstract):
                 raise ValueError("we predefined few callbacks you can't use e.g. '%s'"% key)
 
         self.__callbacks[key] = callback
+        if concurrent:
+            self.__concurrent_callbacks.add(key)
+        else:
+            self.__concurrent_callbacks.discard(key)
 
     def get_callbacks(self):
         return self.__callbacks
 
+    def get_concurrent_callbacks(self):
+        """! Keys of events which callbacks should be executed on worker thread """
+        return self.__concurrent_callbacks
+
     def setup(self):
         pass
 
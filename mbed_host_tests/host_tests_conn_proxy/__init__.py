@@ -18,3 +18,10 @@ Author: Przemyslaw Wirkus <Przemyslaw.Wirkus@arm.com>
 """
 
 from conn_proxy import conn_process
+from conn_engine import conn_process_evented
+
+# Connection process implementations, selected with --conn-engine
+CONN_ENGINES = {
+    'threads' : conn_process,
+    'evented' : conn_process_evented,
+}
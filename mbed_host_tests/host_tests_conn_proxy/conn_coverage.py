@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import re
+import binascii
+
+
+class CoverageSink(object):
+    """! Streams code coverage dumps sent by DUT directly to files
+    @details DUT sends coverage as {{__coverage_start;PATH;HEX_PAYLOAD}} where payload can be
+             megabytes long. Sink filters such dumps out of the data stream read from DUT before
+             it reaches KiViBufferWalker, decodes hex payload as it arrives and writes it to
+             PATH under output directory. Dump is never kept in memory as a whole.
+    """
+    MARKER = '{{__coverage_start;'
+    END = '}}'
+    IDLE, PATH, PAYLOAD = range(3)  # Sink states: outside of dump, reading PATH, reading payload
+    MAX_PATH_LEN = 4096
+    WRITE_BUFFER_SIZE = 1024 * 1024
+    RE_WHITESPACE = re.compile(r'\s+')
+    RE_DRIVE = re.compile(r'^[A-Za-z]:')
+
+    def __init__(self, output_dir, logger):
+        """! ctor
+        @param output_dir Directory where coverage files are stored
+        @param logger Logger instance
+        """
+        self.output_dir = output_dir
+        self.logger = logger
+        self.state = self.IDLE
+        self.held = ''          # Data which may be beginning of MARKER or END
+        self.path = None        # Path of dump being received
+        self.path_buff = ''
+        self.file = None
+        self.file_path = None
+        self.file_size = 0
+        self.nibble = ''        # Half of hex byte split between reads
+        self.eol = False        # Line terminator which ends dump is not passed on
+        self.completed = []     # (path, file_path, size) of dumps finished since last pop_completed()
+
+    def active(self):
+        """! Check if sink is in the middle of coverage dump """
+        return self.state != self.IDLE
+
+    def filter(self, data):
+        """! Consume coverage dumps from data read from DUT
+        @param data Data read from DUT
+        @return Data which is not part of any coverage dump
+        """
+        data = self.held + data
+        self.held = ''
+        passed = []
+        while data:
+            if self.state == self.IDLE and self.eol:
+                # '\r\n' can be split between reads, so '\r' keeps waiting for '\n'
+                if data[0] == '\r':
+                    data = data[1:]
+                    continue
+                if data[0] == '\n':
+                    data = data[1:]
+                self.eol = False
+            elif self.state == self.IDLE:
+                pos = data.find(self.MARKER)
+                if pos < 0:
+                    # Keep back tail of data which may be beginning of marker
+                    keep = self.__partial_suffix(data, self.MARKER)
+                    passed.append(data[:len(data) - keep])
+                    self.held = data[len(data) - keep:]
+                    break
+                passed.append(data[:pos])
+                data = data[pos + len(self.MARKER):]
+                self.state = self.PATH
+            elif self.state == self.PATH:
+                data = self.__read_path(data)
+            else:
+                pos = data.find(self.END)
+                if pos < 0:
+                    keep = self.__partial_suffix(data, self.END)
+                    self.__write_payload(data[:len(data) - keep])
+                    self.held = data[len(data) - keep:]
+                    break
+                self.__write_payload(data[:pos])
+                self.__finish_dump()
+                data = data[pos + len(self.END):]
+        return ''.join(passed)
+
+    def pop_completed(self):
+        """! Dumps stored since last call
+        @return List of (path sent by DUT, file path, size in bytes) tuples
+        """
+        completed = self.completed
+        self.completed = []
+        return completed
+
+    def close(self):
+        """! Close file of unfinished dump, e.g. when connection is lost """
+        if self.file:
+            self.logger.prn_wrn("coverage dump '%s' was not finished, %d bytes stored"% (self.path, self.file_size))
+            self.file.close()
+            self.file = None
+        self.state = self.IDLE
+        self.path_buff = ''
+        self.eol = False
+
+    @staticmethod
+    def __partial_suffix(data, token):
+        """! Length of the longest suffix of data which is a prefix of token """
+        for length in range(min(len(token) - 1, len(data)), 0, -1):
+            if data.endswith(token[:length]):
+                return length
+        return 0
+
+    def __read_path(self, data):
+        """! Collect PATH part of dump, returns data following PATH separator """
+        pos = data.find(';')
+        if pos < 0:
+            self.path_buff += data
+            if len(self.path_buff) > self.MAX_PATH_LEN:
+                self.logger.prn_err("coverage path too long, dump ignored")
+                self.path_buff = ''
+                self.__open('', None)
+            return ''
+        self.path_buff += data[:pos]
+        self.__open(self.path_buff, self.__output_path(self.path_buff))
+        self.path_buff = ''
+        return data[pos + 1:]
+
+    def __output_path(self, path):
+        """! Path to output file for path sent by DUT, always inside output directory """
+        # DUT may send Windows path of object file, drive letter is dropped on all host OSes
+        path = self.RE_DRIVE.sub('', path.strip()).replace('\\', '/')
+        path = os.path.normpath(path).lstrip('/')
+        if path.startswith('..'):
+            path = os.path.basename(path)
+        if path in ('', '.', '..'):
+            return None
+        return os.path.join(self.output_dir, path)
+
+    def __open(self, path, file_path):
+        self.state = self.PAYLOAD
+        self.path = path
+        self.file_path = file_path
+        self.file_size = 0
+        self.nibble = ''
+        if not file_path:
+            return
+        try:
+            file_dir = os.path.dirname(file_path)
+            if file_dir and not os.path.isdir(file_dir):
+                os.makedirs(file_dir)
+            self.file = open(file_path, 'wb', self.WRITE_BUFFER_SIZE)
+        except (IOError, OSError) as e:
+            self.logger.prn_err("can't store coverage dump '%s': %s"% (path, str(e)))
+            self.file = None
+
+    def __write_payload(self, payload):
+        """! Decode hex payload (bytes can be separated with whitespace) and write it to file """
+        if not payload:
+            return
+        payload = self.nibble + self.RE_WHITESPACE.sub('', payload)
+        even = len(payload) & ~1
+        self.nibble = payload[even:]
+        if self.file and even:
+            try:
+                self.file.write(binascii.unhexlify(payload[:even]))
+                self.file_size += even / 2
+            except (TypeError, binascii.Error) as e:
+                self.logger.prn_err("invalid coverage payload for '%s': %s"% (self.path, str(e)))
+                self.file.close()
+                self.file = None
+
+    def __finish_dump(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            self.completed.append((self.path, self.file_path, self.file_size))
+        self.state = self.IDLE
+        self.eol = True
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import select
+from time import time
+from Queue import Empty as QueueEmpty   # Queue here refers to the module, not a class
+from mbed_host_tests.host_tests_logger import HtrunLogger
+from conn_proxy import ConnSession, conn_process, conn_primitive_factory, serve_conn_sessions, CONN_IDLE_WAIT
+from conn_queue import queue_fileno
+
+
+class ConnEventLoop(object):
+    """! Single threaded, select() based engine driving one or more connection sessions
+    @details All DUT connections and host to DUT event queues are multiplexed in one
+             select() call, so many DUTs can be served from one thread. Connectors
+             without file descriptor (e.g. remote connections) are polled.
+    """
+    POLL_PERIOD = 0.01  # How often we poll connectors we can't select() on
+
+    def __init__(self):
+        self.sessions = []  # List of (session, dut_event_queue, dut_event_fd)
+
+    def add_session(self, session, dut_event_queue):
+        """! Add session to event loop
+        @param session ConnSession object, ConnSession.start() should be called by the caller
+        @param dut_event_queue Queue with events from host to DUT
+        """
+        self.sessions.append((session, dut_event_queue, queue_fileno(dut_event_queue)))
+        # Event loop can't handle host events while session waits for space in event queue
+        session.host_event_queue = dut_event_queue
+
+    def finish_session(self, session):
+        """! Remove session from event loop and close its connection """
+        self.sessions = [s for s in self.sessions if s[0] is not session]
+        session.flush_events()
+        session.connector.finish()
+
+    def run(self):
+        """! Run event loop until all sessions are finished """
+        while self.sessions:
+            wait_timeout = CONN_IDLE_WAIT
+            rlist = []
+            polled = []
+            for session, _, dut_event_fd in list(self.sessions):
+                # Check if connection is lost to serial
+                if not session.connector.connected():
+                    session.conn_lost()
+                    self.finish_session(session)
+                    continue
+
+                conn_fd = session.connector.fileno()
+                if conn_fd is None:
+                    polled.append(session)
+                    wait_timeout = min(wait_timeout, self.POLL_PERIOD)
+                else:
+                    rlist.append(conn_fd)
+                if dut_event_fd is None:
+                    wait_timeout = min(wait_timeout, self.POLL_PERIOD)
+                else:
+                    rlist.append(dut_event_fd)
+
+                # If there are events held back only check if DUT sent more data, flush them if it did not
+                wait_timeout = session.wait_timeout(wait_timeout)
+                sync_time_left = session.sync_time_left()
+                if sync_time_left is not None:
+                    wait_timeout = min(wait_timeout, sync_time_left)
+
+            if not self.sessions:
+                break
+
+            try:
+                readable, _, _ = select.select(rlist, [], [], wait_timeout)
+            except select.error:
+                readable = []   # e.g. EINTR, just try again
+
+            for session, dut_event_queue, dut_event_fd in list(self.sessions):
+                # Send data to DUT
+                if dut_event_fd is None or dut_event_fd in readable:
+                    try:
+                        (key, value, _) = dut_event_queue.get(block=False)
+                    except QueueEmpty:
+                        pass
+                    else:
+                        if not session.handle_host_event(key, value):
+                            self.finish_session(session)
+                            continue
+
+                # Read data from DUT
+                if session in polled or session.connector.fileno() in readable:
+                    session.receive()
+                else:
+                    session.idle()
+
+                session.resend_sync()
+
+
+def conn_process_evented(event_queue, dut_event_queue, config):
+    """! Connection process using ConnEventLoop instead of reader and writer threads
+    @details Sends exactly the same events to host as conn_process(). Requires POSIX
+             system, on other systems conn_process() is used instead.
+    """
+    logger = HtrunLogger('CONN')
+    if os.name != 'posix':
+        logger.prn_wrn("event loop connection engine is not supported on this OS, using threads")
+        return conn_process(event_queue, dut_event_queue, config)
+
+    logger.prn_inf("starting connection process (event loop)...")
+
+    # Send connection process start event to host process
+    # NOTE: Do not send any other Key-Value pairs before this!
+    event_queue.put(('__conn_process_start', 1, time()))
+
+    return serve_conn_sessions(event_queue, dut_event_queue, config, logger, run_evented_session)
+
+
+def run_evented_session(event_queue, dut_event_queue, config, logger):
+    """! Run connection session in ConnEventLoop until host finishes it """
+    conn_resource = config.get('conn_resource', 'serial')
+
+    # Create connector instance with proper configuration
+    connector = conn_primitive_factory(conn_resource, config, event_queue, logger)
+    session = ConnSession(connector, event_queue, config, logger)
+
+    loop = ConnEventLoop()
+    loop.add_session(session, dut_event_queue)
+    session.start()
+    loop.run()
@@ -24,6 +24,7 @@ class ConnectorPrimitive(object):
     def __init__(self, name):
         self.LAST_ERROR = None
         self.logger = HtrunLogger(name)
+        self.timing = {}    # Time (sec) spent in connection phases, e.g. serial_wait, reset
 
     def write_kv(self, key, value):
         """! Forms and sends Key-Value protocol message.
@@ -37,13 +38,19 @@ class ConnectorPrimitive(object):
         self.logger.prn_txd(kv_buff.rstrip())
         return kv_buff
 
-    def read(self, count):
+    def read(self, count=None):
         """! Read data from DUT
-        @param count Number of bytes to read
+        @param count Number of bytes to read, if None connector will decide how many bytes to read
         @return Bytes read
         """
         raise NotImplementedError
 
+    def fileno(self):
+        """! File descriptor which can be used with select() to wait for data from DUT
+        @return File descriptor or None if connector does not support waiting with select()
+        """
+        return None
+
     def write(self, payload, log=False):
         """! Read data from DUT
         @param payload Buffer with data to send
@@ -52,6 +59,12 @@ class ConnectorPrimitive(object):
         """
         raise NotImplementedError
 
+    def reconnect(self, port=None):
+        """! Close and reopen connection to DUT (resets DUT)
+        @param port Optional new port name
+        """
+        raise NotImplementedError
+
     def flush(self):
         """! Flush read/write channels of DUT """
         raise NotImplementedError
@@ -21,6 +21,8 @@ from mbed_host_tests.host_tests_conn_proxy.conn_primitive import ConnectorPrimit
 
 
 class RemoteConnectorPrimitive(ConnectorPrimitive):
+    READ_SIZE = 2304    # Default number of bytes read from remote DUT in one go
+
     def __init__(self, name, config):
         ConnectorPrimitive.__init__(self, name)
         self.config = config
@@ -109,8 +111,10 @@ class RemoteConnectorPrimitive(ConnectorPrimitive):
         if not self.selected_resource.flash(filename, forceflash=forceflash):
             raise Exception("remote resources flashing failed!")
 
-    def read(self, count):
+    def read(self, count=None):
         """! Read 'count' bytes of data from DUT """
+        if count is None:
+            count = self.READ_SIZE
         date = str()
         try:
             data = self.selected_resource.read(count)
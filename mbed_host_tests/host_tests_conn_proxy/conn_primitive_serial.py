@@ -17,7 +17,9 @@ limitations under the License.
 """
 
 
-from time import sleep
+import os
+import select
+from time import sleep, time
 from serial import Serial, SerialException
 from mbed_host_tests import host_tests_plugins
 from mbed_host_tests.host_tests_plugins.host_test_plugins import HostTestPluginBase
@@ -25,11 +27,15 @@ from conn_primitive import ConnectorPrimitive
 
 
 class SerialConnectorPrimitive(ConnectorPrimitive):
+    READ_PERIOD = 0.2   # Minimum read size is what DUT can send in this time (sec)
+
     def __init__(self, name, port, baudrate, config):
         ConnectorPrimitive.__init__(self, name)
         self.port = port
         self.baudrate = int(baudrate)
         self.timeout = 0.01  # 10 milli sec
+        # Serial frame is 10 bits long (8N1)
+        self.read_chunk_size = max(1, int(self.baudrate / 10 * self.READ_PERIOD))
         self.config = config
         self.target_id = self.config.get('target_id', None)
         self.serial_pooling = config.get('serial_pooling', 60)
@@ -44,12 +50,21 @@ class SerialConnectorPrimitive(ConnectorPrimitive):
         #
         # Note: This listener opens serial port and keeps connection so reset plugin uses
         # serial port object not serial port name!
+        start_time = time()
         _, serial_port = HostTestPluginBase().check_serial_port_ready(self.port, target_id=self.target_id, timeout=self.serial_pooling)
+        self.timing['serial_wait'] = time() - start_time
         if serial_port != self.port:
             # Serial port changed for given targetID
             self.logger.prn_inf("serial port changed from '%s to '%s')"% (self.port, serial_port))
             self.port = serial_port
 
+        self.serial = None
+        # Set while serial port is reopened, connection is not lost even though port is closed
+        self.reconnecting = False
+        self.__open()
+
+    def __open(self):
+        """! Open serial port and reset device """
         try:
             # TIMEOUT: While creating Serial object timeout is delibrately passed as 0. Because blocking in Serial.read
             # impacts thread and mutliprocess functioning in Python. Hence, instead in self.read() s delay (sleep()) is
@@ -63,7 +78,26 @@ class SerialConnectorPrimitive(ConnectorPrimitive):
                 str(e))
             self.logger.prn_err(str(e))
         else:
+            start_time = time()
             self.reset_dev_via_serial(delay=self.forced_reset_timeout)
+            self.timing['reset'] = self.timing.get('reset', 0.0) + time() - start_time
+
+    def reconnect(self, port=None):
+        """! Close and reopen serial port, device is reset the same way it is after first connection
+        @param port Serial port to open, if None current port is reopened
+        @details Serial port is not checked with mbed-ls (as it is in ctor), caller should
+                 pass new port name if it changed
+        """
+        self.reconnecting = True
+        try:
+            self.finish()
+            if port and port != self.port:
+                self.logger.prn_inf("serial port changed from '%s to '%s')"% (self.port, port))
+                self.port = port
+            self.logger.prn_inf("reconnecting serial(port=%s, baudrate=%d, timeout=%s)"% (self.port, self.baudrate, self.timeout))
+            self.__open()
+        finally:
+            self.reconnecting = False
 
     def reset_dev_via_serial(self, delay=1):
         """! Reset device using selected method, calls one of the reset plugins """
@@ -85,14 +119,38 @@ class SerialConnectorPrimitive(ConnectorPrimitive):
         self.logger.prn_inf("wait for it...")
         return result
 
-    def read(self, count):
-        """! Read data from serial port RX buffer """
-        # TIMEOUT: Since read is called in a loop, wait for self.timeout period before calling serial.read(). See
-        # comment on serial.Serial() call above about timeout.
-        sleep(self.timeout)
+    def get_read_size(self):
+        """! Number of bytes we should read from serial port to get all data sent by DUT
+        @return Number of bytes waiting in OS buffer, but not less than self.read_chunk_size
+        """
+        in_waiting = 0
+        try:
+            if self.serial:
+                in_waiting = self.serial.in_waiting
+        except (SerialException, IOError):
+            pass    # serial.read() will report this problem
+        return max(in_waiting, self.read_chunk_size)
+
+    def read(self, count=None):
+        """! Read data from serial port RX buffer
+        @param count Number of bytes to read, if None all bytes waiting in RX buffer are read
+        """
+        # TIMEOUT: Since read is called in a loop, wait up to self.timeout period before calling serial.read(). See
+        # comment on serial.Serial() call above about timeout. If we can select() on serial port we will stop
+        # waiting as soon as data arrives.
+        fd = self.fileno()
+        if fd is not None:
+            try:
+                select.select([fd], [], [], self.timeout)
+            except select.error:
+                pass    # e.g. EINTR, serial.read() will report real problems
+        else:
+            sleep(self.timeout)
         c = str()
         try:
             if self.serial:
+                if count is None:
+                    count = self.get_read_size()
                 c = self.serial.read(count)
         except SerialException as e:
             self.serial = None
@@ -113,12 +171,24 @@ class SerialConnectorPrimitive(ConnectorPrimitive):
             self.logger.prn_err(str(e))
         return payload
 
+    def fileno(self):
+        """! Serial port file descriptor, available only on POSIX systems
+        @return File descriptor or None if serial port is not open (e.g. it is being reopened)
+        """
+        serial = self.serial
+        if os.name == 'posix' and serial:
+            try:
+                return serial.fileno()
+            except (SerialException, ValueError):
+                pass    # Port was closed by other thread
+        return None
+
     def flush(self):
         if self.serial:
             self.serial.flush()
 
     def connected(self):
-        return bool(self.serial)
+        return bool(self.serial) or self.reconnecting
 
     def error(self):
         return self.LAST_ERROR
@@ -126,6 +196,7 @@ class SerialConnectorPrimitive(ConnectorPrimitive):
     def finish(self):
         if self.serial:
             self.serial.close()
+            self.serial = None
 
     def __del__(self):
         self.finish()
@@ -16,50 +16,128 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import os
 import re
 import uuid
+import select
+import threading
 from time import time
+from collections import deque
 from Queue import Empty as QueueEmpty   # Queue here refers to the module, not a class
 from mbed_host_tests.host_tests_logger import HtrunLogger
 from conn_primitive_serial import SerialConnectorPrimitive
 from conn_primitive_remote import RemoteConnectorPrimitive
+from conn_queue import EventBatcher, EventOverflowGuard, EventMetrics, queue_depth
+from conn_coverage import CoverageSink
+
+MONOTONIC_CLOCK = True  # False if event timestamps fall back to wall clock
+try:
+    from time import monotonic  # Python 3.3+
+except ImportError:
+    try:
+        from monotonic import monotonic    # Backport required by setup.py on Python 2
+    except (ImportError, RuntimeError):
+        # No monotonic clock available (package not installed or platform not supported)
+        from time import time as monotonic
+        MONOTONIC_CLOCK = False
+
+# Event timestamps use monotonic clock anchored to wall clock, so they do not jump
+# when system time is adjusted and are still comparable with time() timestamps
+MONOTONIC_OFFSET = time() - monotonic()
+
+
+def event_time():
+    """! Timestamp for events sent by connection process
+    @return Seconds since epoch measured with monotonic clock
+    """
+    return monotonic() + MONOTONIC_OFFSET
 
 
 class KiViBufferWalker():
-    """! Simple auxiliary class used to walk through a buffer and search for KV tokens """
-    def __init__(self):
+    """! Simple auxiliary class used to walk through a buffer and search for KV tokens
+    @details Stream is kept in a bytearray and only newly appended bytes are scanned
+             for line terminators, so cost of append() is linear in payload size
+             even if DUT sends very long lines without newline characters.
+    """
+    KIVI_MAX_LINE_LEN = 1024 * 1024     # Longest line we will buffer waiting for '\n'
+
+    def __init__(self, max_line_len=KIVI_MAX_LINE_LEN):
+        """! ctor
+        @param max_line_len Maximum length of buffered (not terminated) line. When exceeded
+               buffered data is processed as if it was a complete line. None - unbounded
+        """
         self.KIVI_REGEX = r"\{\{([\w\d_-]+);([^\}]+)\}\}"
-        self.buff = str()
-        self.kvl = []
+        self.buff = bytearray()
+        self.scan_pos = 0           # Position in self.buff where '\n' scanning will resume
+        self.kvl = deque()
         self.re_kv = re.compile(self.KIVI_REGEX)
+        self.max_line_len = max_line_len
+        self.overflow_count = 0     # Number of lines split due to max_line_len
+        self.buff_time = None       # Time when first byte in self.buff was received
+
+    def __process_line(self, line, discarded, timestamp):
+        """! Search single line for K,V pair, add non-KV parts of the line to discarded list """
+        m = self.re_kv.search(line) if '{{' in line else None
+        if m:
+            (key, value) = m.groups()
+            self.kvl.append((key, value, timestamp))
+            line = line.strip()
+            match = m.group(0)
+            pos = line.find(match)
+            before = line[:pos]
+            after = line[pos + len(match):]
+            if len(before) > 0:
+                discarded.append((before, timestamp))
+            if len(after) > 0:
+                # not a K,V pair part
+                discarded.append((after, timestamp))
+        else:
+            # not a K,V pair
+            discarded.append((line, timestamp))
 
     def append(self, payload):
         """! Append stream buffer with payload and process. Returns non-KV strings"""
-        self.buff += payload
-        lines = self.buff.split('\n')
-        self.buff = lines[-1]   # remaining
-        lines.pop(-1)
+        return [line for line, _ in self.append_timed(payload, event_time())]
+
+    def append_timed(self, payload, timestamp, byte_time=0.0):
+        """! Append stream buffer with payload and process
+        @param payload Data received from DUT
+        @param timestamp Time when last byte of payload was received
+        @param byte_time Time needed to transmit one byte, used to interpolate when
+               earlier bytes of payload were received (0 - all bytes received at timestamp)
+        @return List of (string, timestamp) tuples with strings that did not match K,V pair
+        @details Each line (and K,V pair found in it) is stamped with time its first byte was received
+        """
+        base = len(self.buff)
+        payload_time = timestamp - max(0, len(payload) - 1) * byte_time
+        if not base:
+            self.buff_time = payload_time
+        self.buff.extend(payload)
         # List of line or strings that did not match K,V pair.
         discarded = []
 
-        for line in lines:
-            m = self.re_kv.search(line)
-            if m:
-                (key, value) = m.groups()
-                self.kvl.append((key, value, time()))
-                line = line.strip()
-                match = m.group(0)
-                pos = line.find(match)
-                before = line[:pos]
-                after = line[pos + len(match):]
-                if len(before) > 0:
-                    discarded.append(before)
-                if len(after) > 0:
-                    # not a K,V pair part
-                    discarded.append(after)
-            else:
-                # not a K,V pair
-                discarded.append(line)
+        def byte_timestamp(pos):
+            # Bytes already buffered before this payload are stamped with time of line start
+            return self.buff_time if pos < base else payload_time + (pos - base) * byte_time
+
+        # Only bytes appended since last call are scanned for end of line
+        start = 0
+        pos = self.buff.find('\n', self.scan_pos)
+        while pos >= 0:
+            self.__process_line(str(self.buff[start:pos]), discarded, byte_timestamp(start))
+            start = pos + 1
+            pos = self.buff.find('\n', start)
+        if start:
+            self.buff_time = byte_timestamp(start)
+            del self.buff[:start]   # remaining
+        self.scan_pos = len(self.buff)
+
+        if self.max_line_len and len(self.buff) > self.max_line_len:
+            # Line too long, process what we have so far and start new line
+            self.__process_line(str(self.buff), discarded, self.buff_time)
+            del self.buff[:]
+            self.scan_pos = 0
+            self.overflow_count += 1
         return discarded
 
     def search(self):
@@ -68,8 +146,16 @@ class KiViBufferWalker():
 
     def pop_kv(self):
         if len(self.kvl):
-            return self.kvl.pop(0)
-        return None, None, time()
+            return self.kvl.popleft()
+        return None, None, event_time()
+
+    def drain(self):
+        """! Pop all K,V pairs found so far
+        @return List of (key, value, timestamp) tuples in order of appearance in stream
+        """
+        result = list(self.kvl)
+        self.kvl.clear()
+        return result
 
 
 def conn_primitive_factory(conn_resource, config, event_queue, logger):
@@ -123,7 +209,350 @@ def conn_primitive_factory(conn_resource, config, event_queue, logger):
         return None
 
 
+class ConnSession(object):
+    """! Key-Value protocol state machine of connection process
+    @details Handles __sync handshake with DUT, parsing of data received from DUT and
+             forwarding of Key-Value pairs between DUT and host. Waiting for data is
+             left to connection engine driving the session (see conn_process()).
+    """
+    def __init__(self, connector, event_queue, config, logger):
+        """! ctor
+        @param connector Connector (ConnectorPrimitive) used to talk to DUT
+        @param event_queue Queue used to send events to host
+        @param config Global configuration for connection process
+        @param logger Host Test logger instance
+        """
+        self.connector = connector
+        self.logger = logger
+
+        # Configuration of conn_opriocess behaviour
+        self.sync_behavior_init = int(config.get('sync_behavior', 1))
+        self.sync_behavior = self.sync_behavior_init
+        self.sync_timeout = config.get('sync_timeout', 1.0)
+        event_batch_size = int(config.get('event_batch_size', 1))
+        event_batch_timeout = float(config.get('event_batch_timeout', 0.05))
+        # Serial frame is 10 bits long (8N1), used to interpolate when each line was received
+        baudrate = int(config.get('baudrate', 0) or 0)
+        self.byte_time = 10.0 / baudrate if baudrate else 0.0
+
+        # Create simple buffer we will use for Key-Value protocol data
+        self.kv_buffer = KiViBufferWalker()
+        # Code coverage dumps are written to files before data reaches kv_buffer (if enabled)
+        coverage_dir = config.get('coverage_dir')
+        self.coverage_sink = CoverageSink(coverage_dir, logger) if coverage_dir else None
+        # Events from DUT are sent to host in batches (if enabled)
+        self.event_batcher = EventBatcher(event_queue, event_batch_size, event_batch_timeout)
+        self.event_queue = event_queue
+        # Set when host finished test, session must not wait for host to read events anymore
+        self.finishing = threading.Event()
+        # Queue with events from host, set by engines which can't handle them while session waits
+        self.host_event_queue = None
+        # Events are put to batcher only when host keeps up with DUT (if event queue is bounded)
+        self.overflow_guard = EventOverflowGuard(self.event_batcher, event_queue,
+            max_size=int(config.get('event_queue_size', 0) or 0),
+            policy=config.get('overflow_policy') or 'block',
+            sample_rate=int(config.get('overflow_sample_rate', 10) or 10),
+            abort=self.stop_waiting)
+        # Rate of data from DUT and events sent to host, reported with __metrics events
+        self.metrics = EventMetrics(float(config.get('metrics_period', 0) or 0))
+
+        # List of all sent to target UUIDs (if multiple found)
+        self.sync_uuid_list = []
+        # We will ignore all kv pairs before we get sync back
+        self.sync_uuid_discovered = threading.Event()
+        # Time when last __sync was sent
+        self.sync_timer = time()
+        # Time when handshake started, see start()
+        self.sync_start_time = time()
+        # Time spent in all handshakes so far and number of resent __sync packets
+        self.sync_total_time = 0.0
+        self.sync_total_resends = 0
+        # Serializes access to DUT connection, event batcher and overflow guard between reader
+        # and writer threads (re-entrant, receive() calls idle() while holding it)
+        self.conn_lock = threading.RLock()
+
+    def send_sync(self, timeout=None):
+        sync_uuid = str(uuid.uuid4())
+        # Handshake, we will send {{sync;UUID}} preamble and wait for mirrored reply
+        if timeout:
+            self.logger.prn_inf("resending new preamble '%s' after %0.2f sec"% (sync_uuid, timeout))
+        else:
+            self.logger.prn_inf("sending preamble '%s'"% sync_uuid)
+        self.connector.write_kv('__sync', sync_uuid)
+        self.sync_uuid_list.append(sync_uuid)
+        self.sync_behavior -= 1
+        self.sync_timer = time()
+        return sync_uuid
+
+    def start(self):
+        """! Wake up DUT and send first __sync packet """
+        self.sync_start_time = time()
+        # Send simple string to device to 'wake up' greentea-client k-v parser
+        self.connector.write("mbed" * 10, log=True)
+
+        # Sync packet management allows us to manipulate the way htrun sends __sync packet(s)
+        # With current settings we can force on htrun to send __sync packets in this manner:
+        #
+        # * --sync=0        - No sync packets will be sent to target platform
+        # * --sync=-10      - __sync packets will be sent unless we will reach
+        #                     timeout or proper response is sent from target platform
+        # * --sync=N        - Send up to N __sync packets to target platform. Response
+        #                     is sent unless we get response from target platform or
+        #                     timeout occur
+
+        if self.sync_behavior > 0:
+            # Sending up to 'n' __sync packets
+            self.logger.prn_inf("sending up to %s __sync packets (specified with --sync=%s)"% (self.sync_behavior, self.sync_behavior))
+            self.send_sync()
+        elif self.sync_behavior == 0:
+            # No __sync packets
+            self.logger.prn_wrn("skipping __sync packet (specified with --sync=%s)"% self.sync_behavior)
+        else:
+            # Send __sync until we go reply
+            self.logger.prn_inf("sending multiple __sync packets (specified with --sync=%s)"% self.sync_behavior)
+            self.send_sync()
+
+    def sync_time_left(self):
+        """! Time left until next __sync packet should be sent
+        @return Time in seconds or None if no more __sync packets will be sent
+        """
+        if self.sync_uuid_discovered.is_set() or self.sync_behavior == 0:
+            return None
+        return max(0, self.sync_timeout - (time() - self.sync_timer))
+
+    def resend_sync(self):
+        """! Resend __sync if we did not get reply in 'sync_timeout' secs (default 1 sec)
+        @details If 'sync_behavior' counter is != 0 we will continue to send __sync
+                 packets to target platform. If we specify 'sync_behavior' < 0 we
+                 will send 'forever' (or until we get reply)
+        """
+        if self.sync_time_left() == 0:
+            self.send_sync(timeout=time() - self.sync_timer)
+
+    def process_data(self, data, timestamp=None):
+        """! Parse data received from DUT and send events to host
+        @param data Data read from DUT
+        @param timestamp Time (see event_time()) when read of data returned, None - now
+        """
+        if timestamp is None:
+            timestamp = event_time()
+        data_len = len(data)
+        events = 0
+        if self.coverage_sink:
+            data = self.coverage_sink.filter(data)
+            for path, file_path, size in self.coverage_sink.pop_completed():
+                events += 1
+                self.overflow_guard.put(('__coverage_stored', {'path' : path, 'file' : file_path, 'size' : size}, time()))
+        # Stream data stream KV parsing
+        print_lines = self.kv_buffer.append_timed(data, timestamp, self.byte_time)
+        events += len(print_lines)
+        for line, line_timestamp in print_lines:
+            self.logger.prn_rxd(line)
+            self.overflow_guard.put(('__rxd_line', line, line_timestamp))
+        for key, value, kv_timestamp in self.kv_buffer.drain():
+            if self.sync_uuid_discovered.is_set():
+                events += 1
+                self.overflow_guard.put((key, value, kv_timestamp))
+                self.logger.prn_inf("found KV pair in stream: {{%s;%s}}, queued..."% (key, value))
+            else:
+                if key == '__sync':
+                    if value in self.sync_uuid_list:
+                        self.sync_uuid_discovered.set()
+                        self.overflow_guard.put((key, value, kv_timestamp))
+                        idx = self.sync_uuid_list.index(value)
+                        self.logger.prn_inf("found SYNC in stream: {{%s;%s}} it is #%d sent, queued..."% (key, value, idx))
+                        self.sync_total_time += time() - self.sync_start_time
+                        self.sync_total_resends += len(self.sync_uuid_list) - 1
+                        self.overflow_guard.put(('__timing', self.get_timing(), time()))
+                    else:
+                        self.logger.prn_err("found faulty SYNC in stream: {{%s;%s}}, ignored..."% (key, value))
+                else:
+                    self.logger.prn_wrn("found KV pair in stream: {{%s;%s}}, ignoring..."% (key, value))
+        self.metrics.count(events, data_len, timestamp)
+        self.overflow_guard.poll()
+        self.event_batcher.poll()
+
+    def get_timing(self):
+        """! Time (sec) spent in connection phases so far (also after reconnects): serial_wait, reset,
+             sync and number of sync_resends
+        """
+        timing = dict(self.connector.timing)
+        timing['sync'] = self.sync_total_time
+        timing['sync_resends'] = self.sync_total_resends
+        return timing
+
+    def idle(self):
+        """! No more data from DUT, do not hold events back """
+        with self.conn_lock:
+            self.overflow_guard.poll()
+            self.event_batcher.flush()
+
+    def flush_events(self):
+        """! Session ends, send all events held back regardless of event queue depth
+        @details Must be called before host is told session ended (__conn_process_end),
+                 otherwise events still pending in overflow guard are lost.
+        """
+        with self.conn_lock:
+            self.overflow_guard.flush()
+            self.event_batcher.flush()
+
+    def stop_waiting(self):
+        """! Check if session should stop waiting for host to read events from full event queue """
+        if self.finishing.is_set():
+            return True
+        return self.host_event_queue is not None and not self.host_event_queue.empty()
+
+    def wait_timeout(self, timeout):
+        """! Limit time engine waits for DUT data
+        @param timeout Time engine would wait otherwise
+        @return Time engine can wait before idle() should be called
+        """
+        if self.event_batcher.batch:
+            # Only check if DUT sent more data, flush batch if it did not
+            return 0
+        if self.overflow_guard.pending:
+            # Check periodically if host made space in event queue for pending events
+            return min(timeout, self.overflow_guard.RETRY_PERIOD)
+        return timeout
+
+    def receive(self):
+        """! Read all data waiting from DUT and process it """
+        with self.conn_lock:
+            data = self.connector.read()
+            # Stamp data as soon as read returns, before any processing
+            timestamp = event_time()
+            if data:
+                self.process_data(data, timestamp)
+            else:
+                self.idle()
+            self.poll_metrics()
+
+    def poll_metrics(self):
+        """! Sample event queue depth and send __metrics event if reporting period is over """
+        if self.metrics.period > 0:
+            self.metrics.sample_depth(queue_depth(self.event_queue))
+            if self.metrics.due():
+                self.overflow_guard.put(('__metrics', self.metrics.report(), time()))
+
+    def reconnect(self, port=None):
+        """! Reopen connection to DUT (this resets DUT) and start __sync handshake again
+        @param port Optional new port name
+        """
+        with self.conn_lock:
+            self.overflow_guard.flush()
+            self.event_batcher.flush()
+            self.connector.reconnect(port)
+            self.kv_buffer = KiViBufferWalker()
+            self.close_coverage()
+            self.sync_uuid_list = []
+            self.sync_uuid_discovered.clear()
+            self.sync_behavior = self.sync_behavior_init
+            if self.connector.connected():
+                self.start()
+
+    def handle_host_event(self, key, value):
+        """! Send Key-Value pair from host test to DUT
+        @return False if state machine in host_test_default has finished and session should end
+        """
+        if key == '__host_test_finished' and value == True:
+            self.logger.prn_inf("received special even '%s' value='%s', finishing"% (key, value))
+            # Host does not read events anymore, reader must not wait for space in event queue
+            self.finishing.set()
+            with self.conn_lock:
+                self.close_coverage()
+                # Totals for whole session
+                metrics = self.metrics.summary()
+                metrics.update(self.overflow_guard.summary())
+                metrics['final'] = True
+                self.overflow_guard.put(('__metrics', metrics, time()))
+                self.overflow_guard.flush()
+                self.event_batcher.flush()
+            return False
+        if key == '__reconnect':
+            # Soft reset of DUT without restarting connection process
+            self.logger.prn_inf("received special even '%s' value='%s', reconnecting"% (key, value))
+            self.reconnect(value)
+            return True
+        self.connector.write_kv(key, value)
+        return True
+
+    def close_coverage(self):
+        """! Close coverage dump interrupted by reconnect or end of session """
+        if self.coverage_sink:
+            self.coverage_sink.close()
+
+    def conn_lost(self):
+        """! Notify host that connection to DUT was lost """
+        self.finishing.set()
+        with self.conn_lock:
+            self.close_coverage()
+            self.overflow_guard.put(('__notify_conn_lost', self.connector.error(), time()))
+            self.overflow_guard.flush()
+            self.event_batcher.flush()
+
+
+# Maximum time connection process threads will wait for DUT or host test data
+CONN_IDLE_WAIT = 1.0
+
+
+def wait_for_conn_config(dut_event_queue, logger):
+    """! Block pre-spawned connection process until host sends its configuration
+    @param dut_event_queue Queue with events from host to DUT
+    @param logger Connection process logger
+    @return Configuration dictionary sent with '__conn_config' event or None if host
+            does not need connection process anymore (e.g. flashing failed)
+    """
+    logger.prn_inf("waiting for connection configuration...")
+    while True:
+        (key, value, _) = dut_event_queue.get()
+        if key == '__conn_config':
+            return value
+        if key == '__host_test_finished':
+            logger.prn_inf("received special even '%s' value='%s', finishing"% (key, value))
+            return None
+        logger.prn_wrn("unexpected event '%s' before configuration, ignored"% key)
+
+
+def serve_conn_sessions(event_queue, dut_event_queue, config, logger, run_session):
+    """! Run connection sessions until host does not need connection process anymore
+    @param config Configuration of first session or None if it should be received from host
+    @param run_session Function (event_queue, dut_event_queue, config, logger) which runs one session until host finishes it
+    @return Process exit code
+    @details If config is None process waits for '__conn_config' event before it connects to DUT.
+             If config has 'keep_alive' set process waits for next '__conn_config' event when
+             session is finished, so host can reuse it for next test (see --batch).
+             Last event of each session sent to host is always '__conn_process_end'.
+    """
+    if not MONOTONIC_CLOCK:
+        logger.prn_wrn("monotonic clock not available (install 'monotonic' package), event timestamps use wall clock")
+    sessions = 0
+    while True:
+        if config is None:
+            # Process was pre-spawned or kept alive by host, configuration is sent when DUT is ready
+            config = wait_for_conn_config(dut_event_queue, logger)
+            if config is None:
+                if not sessions:
+                    event_queue.put(('__conn_process_end', 0, time()))
+                return 0
+
+        run_session(event_queue, dut_event_queue, config, logger)
+        sessions += 1
+
+        # Host reads events until this one, it must be the last event of session
+        event_queue.put(('__conn_process_end', 0, time()))
+        if not config.get('keep_alive'):
+            return 0
+        config = None
+
+
 def conn_process(event_queue, dut_event_queue, config):
+    """! Connection process, forwards data between DUT and host test
+    @details Work is split between two threads so RX and TX never wait for each other:
+             * reader thread reads data from DUT, parses it for Key-Value pairs and sends events to host,
+             * writer thread blocks on dut_event_queue and writes Key-Value pairs to DUT. It is also
+               responsible for resending __sync preamble until DUT replies.
+             See serve_conn_sessions() for handling of configuration sent by host.
+    """
 
     logger = HtrunLogger('CONN')
     logger.prn_inf("starting connection process...")
@@ -132,120 +561,90 @@ def conn_process(event_queue, dut_event_queue, config):
     # NOTE: Do not send any other Key-Value pairs before this!
     event_queue.put(('__conn_process_start', 1, time()))
 
-    # Configuration of conn_opriocess behaviour
-    sync_behavior = int(config.get('sync_behavior', 1))
-    sync_timeout = config.get('sync_timeout', 1.0)
+    return serve_conn_sessions(event_queue, dut_event_queue, config, logger, run_threaded_session)
+
+
+def run_threaded_session(event_queue, dut_event_queue, config, logger):
+    """! Run connection session with reader and writer threads until host finishes it """
     conn_resource = config.get('conn_resource', 'serial')
 
     # Create connector instance with proper configuration
     connector = conn_primitive_factory(conn_resource, config, event_queue, logger)
-    # Create simple buffer we will use for Key-Value protocol data
-    kv_buffer = KiViBufferWalker()
-
-    # List of all sent to target UUIDs (if multiple found)
-    sync_uuid_list = []
-
-    # We will ignore all kv pairs before we get sync back
-    sync_uuid_discovered = False
+    session = ConnSession(connector, event_queue, config, logger)
+
+    # Set when connection process should finish, pipe is used to wake up reader thread
+    conn_finished = threading.Event()
+    wakeup_fds = os.pipe() if os.name == 'posix' else None
+
+    def __finish():
+        conn_finished.set()
+        if wakeup_fds:
+            os.write(wakeup_fds[1], 'x')
+
+    def __reader():
+        """! Reads data from DUT and sends events to host """
+        while not conn_finished.is_set():
+            # Connection is not checked while writer thread reconnects
+            with session.conn_lock:
+                connected = connector.connected()
+                conn_fd = connector.fileno() if connected else None
+
+            # Check if connection is lost to serial
+            if not connected:
+                session.conn_lost()
+                __finish()
+                break
+
+            # Wait for data from DUT if we can, otherwise connector will wait for us
+            if conn_fd is not None and wakeup_fds:
+                # If there are events held back only check if DUT sent more data, flush them if it did not
+                wait_timeout = session.wait_timeout(CONN_IDLE_WAIT)
+                try:
+                    readable, _, _ = select.select([conn_fd, wakeup_fds[0]], [], [], wait_timeout)
+                except select.error:
+                    readable = []   # e.g. EINTR, just try again
+                if conn_fd not in readable:
+                    session.idle()
+                    continue
+            session.receive()
+        session.idle()
+
+    def __writer():
+        """! Sends data from host test to DUT and resends __sync packets """
+        while not conn_finished.is_set():
+            session.resend_sync()
+            wait_timeout = CONN_IDLE_WAIT
+            sync_time_left = session.sync_time_left()
+            if sync_time_left is not None:
+                wait_timeout = min(wait_timeout, sync_time_left)
+
+            # Send data to DUT
+            try:
+                (key, value, _) = dut_event_queue.get(timeout=wait_timeout)
+            except QueueEmpty:
+                continue
 
-    def __send_sync(timeout=None):
-        sync_uuid = str(uuid.uuid4())
-        # Handshake, we will send {{sync;UUID}} preamble and wait for mirrored reply
-        if timeout:
-            logger.prn_inf("resending new preamble '%s' after %0.2f sec"% (sync_uuid, timeout))
-        else:
-            logger.prn_inf("sending preamble '%s'"% sync_uuid)
-        connector.write_kv('__sync', sync_uuid)
-        return sync_uuid
-
-    # Send simple string to device to 'wake up' greentea-client k-v parser
-    connector.write("mbed" * 10, log=True)
-
-    # Sync packet management allows us to manipulate the way htrun sends __sync packet(s)
-    # With current settings we can force on htrun to send __sync packets in this manner:
-    #
-    # * --sync=0        - No sync packets will be sent to target platform
-    # * --sync=-10      - __sync packets will be sent unless we will reach
-    #                     timeout or proper response is sent from target platform
-    # * --sync=N        - Send up to N __sync packets to target platform. Response
-    #                     is sent unless we get response from target platform or
-    #                     timeout occur
-
-    if sync_behavior > 0:
-        # Sending up to 'n' __sync packets
-        logger.prn_inf("sending up to %s __sync packets (specified with --sync=%s)"% (sync_behavior, sync_behavior))
-        sync_uuid_list.append(__send_sync())
-        sync_behavior -= 1
-    elif sync_behavior == 0:
-        # No __sync packets
-        logger.prn_wrn("skipping __sync packet (specified with --sync=%s)"% sync_behavior)
-    else:
-        # Send __sync until we go reply
-        logger.prn_inf("sending multiple __sync packets (specified with --sync=%s)"% sync_behavior)
-        sync_uuid_list.append(__send_sync())
-        sync_behavior -= 1
-
-    loop_timer = time()
-    while True:
-
-        # Check if connection is lost to serial
-        if not connector.connected():
-            error_msg = connector.error()
-            connector.finish()
-            event_queue.put(('__notify_conn_lost', error_msg, time()))
-            break
-
-        # Send data to DUT
-        try:
-            (key, value, _) = dut_event_queue.get(block=False)
-        except QueueEmpty:
-            pass # Check if target sent something
-        else:
             # Return if state machine in host_test_default has finished to end process
-            if key == '__host_test_finished' and value == True:
-                logger.prn_inf("received special even '%s' value='%s', finishing"% (key, value))
-                connector.finish()
-                return 0
-            connector.write_kv(key, value)
-
-        # Since read is done every 0.2 sec, with maximum baud rate we can receive 2304 bytes in one read in worst case.
-        data = connector.read(2304)
-        if data:
-            # Stream data stream KV parsing
-            print_lines = kv_buffer.append(data)
-            for line in print_lines:
-                logger.prn_rxd(line)
-                event_queue.put(('__rxd_line', line, time()))
-            while kv_buffer.search():
-                key, value, timestamp = kv_buffer.pop_kv()
-
-                if sync_uuid_discovered:
-                    event_queue.put((key, value, timestamp))
-                    logger.prn_inf("found KV pair in stream: {{%s;%s}}, queued..."% (key, value))
-                else:
-                    if key == '__sync':
-                        if value in sync_uuid_list:
-                            sync_uuid_discovered = True
-                            event_queue.put((key, value, time()))
-                            idx = sync_uuid_list.index(value)
-                            logger.prn_inf("found SYNC in stream: {{%s;%s}} it is #%d sent, queued..."% (key, value, idx))
-                        else:
-                            logger.prn_err("found faulty SYNC in stream: {{%s;%s}}, ignored..."% (key, value))
-                    else:
-                        logger.prn_wrn("found KV pair in stream: {{%s;%s}}, ignoring..."% (key, value))
-
-        if not sync_uuid_discovered:
-            # Resending __sync after 'sync_timeout' secs (default 1 sec)
-            # to target platform. If 'sync_behavior' counter is != 0 we
-            # will continue to send __sync packets to target platform.
-            # If we specify 'sync_behavior' < 0 we will send 'forever'
-            # (or until we get reply)
-
-            if sync_behavior != 0:
-                time_to_sync_again = time() - loop_timer
-                if time_to_sync_again > sync_timeout:
-                    sync_uuid_list.append(__send_sync(timeout=time_to_sync_again))
-                    sync_behavior -= 1
-                    loop_timer = time()
-
-    return 0
+            if not session.handle_host_event(key, value):
+                __finish()
+                break
+
+    session.start()
+
+    reader = threading.Thread(target=__reader, name='CONN-RX')
+    writer = threading.Thread(target=__writer, name='CONN-TX')
+    for thread in (reader, writer):
+        thread.daemon = True
+        thread.start()
+
+    # Threads are joined with timeout so main thread can still handle signals (e.g. Ctrl+C)
+    while reader.is_alive() or writer.is_alive():
+        for thread in (reader, writer):
+            thread.join(CONN_IDLE_WAIT)
+
+    # Reader could have queued more events after host finished test
+    session.flush_events()
+    connector.finish()
+    if wakeup_fds:
+        for fd in wakeup_fds:
+            os.close(fd)
@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import mmap
+import ctypes
+import struct
+import marshal
+import cPickle
+import multiprocessing
+from time import time, sleep
+from collections import deque
+from Queue import Empty as QueueEmpty, Full as QueueFull
+
+
+def queue_fileno(queue):
+    """! Returns file descriptor which becomes readable when data arrives in multiprocessing.Queue
+    @param queue multiprocessing.Queue object
+    @return File descriptor which can be used with select() or None if it is not available (e.g. on Windows)
+    @details Queue is backed by a pipe and queue's feeder thread writes whole (pickled) events to it,
+             so when pipe is readable Queue.get(block=False) will not block waiting for partial data.
+    """
+    if os.name != 'posix':
+        return None
+    try:
+        return queue._reader.fileno()
+    except (AttributeError, IOError, OSError):
+        return None
+
+
+def queue_depth(queue):
+    """! Number of items waiting in queue
+    @return Approximate queue size or None if it can't be measured (e.g. qsize() is not implemented on Mac OS X)
+    """
+    try:
+        return queue.qsize()
+    except NotImplementedError:
+        return None
+
+
+class EventMetrics(object):
+    """! Measures rate of events (and bytes) passing through one end of event queue
+    @details Besides totals, metrics are collected in periods. report() returns metrics
+             for period which just ended: rates, maximum queue depth and maximum event age
+             (time between event timestamp and moment event was counted).
+    """
+    def __init__(self, period=1.0):
+        """! ctor
+        @param period Length of reporting period in seconds, 0 - no periodic reports
+        """
+        self.period = period
+        self.start_time = time()
+        self.events = 0
+        self.bytes = 0
+        self.max_event_age = 0.0
+        self.max_depth = 0
+        self.__reset_period()
+
+    def __reset_period(self):
+        self.period_start = time()
+        self.period_events = 0
+        self.period_bytes = 0
+        self.period_max_event_age = 0.0
+        self.period_max_depth = 0
+
+    def count(self, events=1, nbytes=0, timestamp=None):
+        """! Count events (and bytes)
+        @param timestamp Timestamp of (oldest) event, used to calculate event age
+        """
+        self.period_events += events
+        self.period_bytes += nbytes
+        self.events += events
+        self.bytes += nbytes
+        if timestamp is not None:
+            age = time() - timestamp
+            if age > self.period_max_event_age:
+                self.period_max_event_age = age
+                self.max_event_age = max(self.max_event_age, age)
+
+    def sample_depth(self, depth):
+        """! Record queue depth, depth can be None if it is not known """
+        if depth is not None and depth > self.period_max_depth:
+            self.period_max_depth = depth
+            self.max_depth = max(self.max_depth, depth)
+
+    def due(self):
+        """! Check if current reporting period is over """
+        return self.period > 0 and (time() - self.period_start) >= self.period
+
+    def report(self):
+        """! End current reporting period
+        @return Dictionary with metrics of period which ended
+        """
+        elapsed = max(time() - self.period_start, 1e-6)
+        metrics = {
+            'events_per_sec' : self.period_events / elapsed,
+            'bytes_per_sec' : self.period_bytes / elapsed,
+            'max_event_age' : self.period_max_event_age,
+            'max_queue_depth' : self.period_max_depth,
+        }
+        self.__reset_period()
+        return metrics
+
+    def summary(self):
+        """! Metrics since object was created
+        @return Dictionary with totals, average rates and maximums
+        """
+        elapsed = max(time() - self.start_time, 1e-6)
+        return {
+            'events' : self.events,
+            'bytes' : self.bytes,
+            'events_per_sec' : self.events / elapsed,
+            'bytes_per_sec' : self.bytes / elapsed,
+            'max_event_age' : self.max_event_age,
+            'max_queue_depth' : self.max_depth,
+        }
+
+
+class EventBatcher(object):
+    """! Groups events sent from connection process to host into batches
+    @details Instead of putting each event in event queue separately events are
+             collected and sent as one ('__batch', [events...], timestamp) envelope.
+             Batch is flushed when it reaches batch_size events or when the oldest
+             event in batch is older than batch_timeout seconds.
+             Use EventQueueReader on the receiving side to unpack envelopes.
+    """
+    BATCH_KEY = '__batch'
+
+    def __init__(self, event_queue, batch_size=1, batch_timeout=0.05):
+        """! ctor
+        @param event_queue Queue we will put events (or batches of events) to
+        @param batch_size Maximum number of events in one batch, 1 disables batching
+        @param batch_timeout Time in seconds after which batch is flushed
+        """
+        self.event_queue = event_queue
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.batch = []
+        self.batch_start = None
+
+    def put(self, event):
+        """! Add event to batch, event is sent immediately if batching is disabled
+        @param event Tuple (key, value, timestamp)
+        """
+        if self.batch_size <= 1:
+            self.event_queue.put(event)
+            return
+        if not self.batch:
+            self.batch_start = time()
+        self.batch.append(event)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def poll(self):
+        """! Flush batch if batch_timeout for oldest event in batch expired """
+        if self.batch and (time() - self.batch_start) >= self.batch_timeout:
+            self.flush()
+
+    def flush(self):
+        """! Send all events collected so far """
+        if len(self.batch) == 1:
+            self.event_queue.put(self.batch[0])
+        elif self.batch:
+            self.event_queue.put((self.BATCH_KEY, self.batch, time()))
+        self.batch = []
+
+
+class EventOverflowGuard(object):
+    """! Bounds number of events waiting in event queue for host
+    @details Used in connection process in front of EventBatcher. When host does not keep up
+             with DUT and event queue holds max_size items (batch counts as one item) or more,
+             new events are handled according to policy:
+             * 'block' - wait until host reads events from queue,
+             * 'drop' - keep events in bounded pending list and drop oldest __rxd_line
+               events from it when it overflows,
+             * 'sample' - pass only every sample_rate-th __rxd_line event.
+             Key-Value events are never dropped. Queue depth is measured with queue_depth(),
+             if it can't be measured (e.g. on Mac OS X) events are never held back.
+    """
+    POLICIES = ['block', 'drop', 'sample']
+    RETRY_PERIOD = 0.01     # How often engine checks if pending events fit in queue
+    FULL_WAIT = 0.001       # Polling period when 'block' policy waits for space in queue
+
+    def __init__(self, sink, event_queue, max_size=0, policy='block', sample_rate=10, abort=None):
+        """! ctor
+        @param sink Object events are put to when there is space in event queue, e.g. EventBatcher
+        @param event_queue Queue which depth is bounded
+        @param max_size Maximum number of items in event queue, 0 - unbounded
+        @param policy Overflow policy, one of POLICIES
+        @param sample_rate Every sample_rate-th __rxd_line is passed with 'sample' policy
+        @param abort Callable, 'block' policy stops waiting when it returns True and puts event anyway
+        """
+        if policy not in self.POLICIES:
+            raise ValueError("unknown event queue overflow policy '%s'"% policy)
+        self.sink = sink
+        self.event_queue = event_queue
+        self.max_size = max_size
+        self.policy = policy
+        self.sample_rate = max(1, sample_rate)
+        self.abort = abort
+        self.pending = deque()  # Events waiting for space in event queue ('drop' policy)
+        self.sample_count = 0
+        # Counters reported in summary()
+        self.dropped_rxd_lines = 0
+        self.blocked_time = 0.0
+        self.max_pending = 0
+
+    def full(self):
+        """! Check if event queue holds max_size items or more """
+        if self.max_size <= 0:
+            return False
+        depth = queue_depth(self.event_queue)
+        return depth is not None and depth >= self.max_size
+
+    def put(self, event):
+        """! Put event to sink or handle it according to overflow policy
+        @param event Tuple (key, value, timestamp)
+        """
+        if self.pending:
+            self.pending.append(event)
+            self.__drop_pending()
+            self.poll()
+        elif not self.full():
+            self.sample_count = 0
+            self.sink.put(event)
+        elif self.policy == 'block':
+            self.__wait()
+            self.sink.put(event)
+        elif self.policy == 'drop':
+            self.pending.append(event)
+            self.__drop_pending()
+        elif event[0] == '__rxd_line':
+            # Only __rxd_line events are sampled, Key-Value events in between do not shift the rate
+            self.sample_count += 1
+            if self.sample_count % self.sample_rate:
+                self.dropped_rxd_lines += 1
+            else:
+                self.sink.put(event)
+        else:
+            self.sink.put(event)
+
+    def poll(self):
+        """! Pass pending events to sink while there is space in event queue """
+        while self.pending and not self.full():
+            self.sink.put(self.pending.popleft())
+
+    def flush(self):
+        """! Pass all pending events to sink regardless of event queue depth """
+        while self.pending:
+            self.sink.put(self.pending.popleft())
+
+    def summary(self):
+        """! Overflow counters
+        @return Dictionary with counters of dropped events, time spent waiting and maximum number of pending events
+        """
+        return {
+            'overflow_policy' : self.policy if self.max_size > 0 else 'none',
+            'dropped_rxd_lines' : self.dropped_rxd_lines,
+            'blocked_time' : self.blocked_time,
+            'max_pending' : self.max_pending,
+        }
+
+    def __wait(self):
+        start = time()
+        while self.full() and not (self.abort and self.abort()):
+            sleep(self.FULL_WAIT)
+        self.blocked_time += time() - start
+
+    def __drop_pending(self):
+        self.max_pending = max(self.max_pending, len(self.pending))
+        if len(self.pending) <= self.max_size:
+            return
+        for i, event in enumerate(self.pending):
+            if event[0] == '__rxd_line':
+                del self.pending[i]
+                self.dropped_rxd_lines += 1
+                return
+
+
+class EventQueueReader(object):
+    """! Reads events from event queue and transparently unpacks batches
+         created by EventBatcher
+    """
+    def __init__(self, event_queue):
+        """! ctor
+        @param event_queue Queue we will read events from
+        """
+        self.event_queue = event_queue
+        self.pending = deque()
+
+    def get(self, block=True, timeout=None):
+        """! Get single event from queue
+        @return Tuple (key, value, timestamp)
+        @details Raises Queue.Empty when there are no events (same as Queue.get())
+        """
+        while not self.pending:
+            event = self.event_queue.get(block, timeout)
+            if event[0] != EventBatcher.BATCH_KEY:
+                return event
+            self.pending.extend(event[1])
+        return self.pending.popleft()
+
+    def empty(self):
+        """! Check if there are no events pending in reader and queue """
+        return not self.pending and self.event_queue.empty()
+
+    def qsize(self):
+        """! Approximate number of events waiting, batch in queue counts as one event
+        @return Number of events or None if queue size can't be measured
+        """
+        depth = queue_depth(self.event_queue)
+        return depth + len(self.pending) if depth is not None else None
+
+
+class RingBufferQueue(object):
+    """! Event queue backed by ring buffer in shared memory
+    @details Drop-in replacement for multiprocessing.Queue used to send events from connection
+             process to host. Events are stored as length prefixed records, serialized with
+             marshal (pickle only for values marshal can't handle), and there is no feeder thread:
+             put() copies record directly to shared memory and releases semaphore reader waits on.
+             Queue can have many producers but only one consumer (host event loop).
+             Memory is shared with child processes created with fork(), so POSIX systems only.
+    """
+    HEADER = struct.Struct('<Ic')   # Record length and serialization method
+    MARSHAL = 'M'
+    PICKLE = 'P'
+    FULL_WAIT = 0.001   # Producer polling period when ring buffer is full
+
+    def __init__(self, size=4 * 1024 * 1024):
+        """! ctor
+        @param size Size of ring buffer in bytes
+        """
+        self.size = size
+        self.buff = mmap.mmap(-1, size)
+        # Total number of bytes ever written to and read from ring buffer
+        self.head = multiprocessing.RawValue(ctypes.c_uint64, 0)
+        self.tail = multiprocessing.RawValue(ctypes.c_uint64, 0)
+        self.write_lock = multiprocessing.Lock()
+        self.records = multiprocessing.Semaphore(0)     # Number of records ready to read
+
+    def __write(self, pos, data):
+        pos %= self.size
+        first = min(len(data), self.size - pos)
+        self.buff[pos:pos + first] = data[:first]
+        if first < len(data):
+            self.buff[0:len(data) - first] = data[first:]
+
+    def __read(self, pos, length):
+        pos %= self.size
+        first = min(length, self.size - pos)
+        data = self.buff[pos:pos + first]
+        if first < length:
+            data += self.buff[0:length - first]
+        return data
+
+    def put(self, event, block=True, timeout=None):
+        """! Put event in queue, blocks if there is no space in ring buffer """
+        try:
+            method, record = self.MARSHAL, marshal.dumps(event)
+        except ValueError:
+            method, record = self.PICKLE, cPickle.dumps(event, cPickle.HIGHEST_PROTOCOL)
+        length = self.HEADER.size + len(record)
+        if length > self.size:
+            raise ValueError("event of %d bytes does not fit in %d bytes ring buffer"% (length, self.size))
+
+        end_time = time() + timeout if timeout is not None else None
+        with self.write_lock:
+            # Consumer only moves tail forward, so free space can only grow while we wait
+            head = self.head.value
+            while self.size - (head - self.tail.value) < length:
+                if not block or (end_time is not None and time() >= end_time):
+                    raise QueueFull
+                sleep(self.FULL_WAIT)
+            self.__write(head, self.HEADER.pack(len(record), method) + record)
+            self.head.value = head + length
+        self.records.release()
+
+    def get(self, block=True, timeout=None):
+        """! Get event from queue
+        @details Raises Queue.Empty when there are no events (same as Queue.get())
+        """
+        if block and timeout is not None:
+            acquired = self.records.acquire(True, max(0, timeout))
+        else:
+            acquired = self.records.acquire(block)
+        if not acquired:
+            raise QueueEmpty
+        tail = self.tail.value
+        record_len, method = self.HEADER.unpack(self.__read(tail, self.HEADER.size))
+        record = self.__read(tail + self.HEADER.size, record_len)
+        self.tail.value = tail + self.HEADER.size + record_len
+        if method == self.MARSHAL:
+            return marshal.loads(record)
+        return cPickle.loads(record)
+
+    def put_nowait(self, event):
+        return self.put(event, block=False)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        """! Number of events in queue """
+        return self.records.get_value()
+
+    def empty(self):
+        return self.head.value == self.tail.value
+
+
+def create_event_queue(transport='queue'):
+    """! Create queue used to send events from connection process to host
+    @param transport 'queue' for multiprocessing.Queue, 'shm' for RingBufferQueue
+    @return Queue object
+    """
+    if transport == 'shm' and os.name == 'posix':
+        return RingBufferQueue()
+    return multiprocessing.Queue()
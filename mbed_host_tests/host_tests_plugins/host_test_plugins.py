@@ -20,11 +20,12 @@ Author: Przemyslaw Wirkus <Przemyslaw.Wirkus@arm.com>
 import os
 import sys
 import platform
+import threading
 import mbed_lstools
 
 from os import access, F_OK
 from sys import stdout
-from time import sleep
+from time import sleep, time
 from subprocess import call
 from mbed_host_tests.host_tests_logger import HtrunLogger
 
@@ -46,6 +47,15 @@ class HostTestPluginBase:
     required_parameters = []    # Parameters required for 'kwargs' in plugin APIs: e.g. self.execute()
     stable = False              # Determine if plugin is stable and can be used
 
+    # Time (sec) spent in check_mount_point_ready() by plugins, per thread because
+    # DUTs can be tested in parallel (see --devices), used for timing reports
+    thread_timing = threading.local()
+
+    # Listing of connected devices shared by all plugins, see list_mbeds_by_targetid()
+    MBEDLS_CACHE_TIME = 0.4     # Shorter than mbed-ls polling period in plugins
+    mbedls_cache_lock = threading.Lock()
+    mbedls_cache = (0.0, None)  # (time when scan started, {target_id : mbedls_dict()})
+
     def __init__(self):
         """ ctor
         """
@@ -121,6 +131,7 @@ class HostTestPluginBase:
         @param loop_delay - polling delay for access check
         @param timeout Mount point pooling timeout in seconds
         """
+        start_time = time()
 
         if target_id:
             # Wait for mount point to appear with mbed-ls
@@ -134,10 +145,8 @@ class HostTestPluginBase:
             timeout_step = 0.5
             timeout = int(timeout / timeout_step)
             for i in range(timeout):
-                # mbed_lstools.create() should be done inside the loop.
-                # Otherwise it will loop on same data.
-                mbeds = mbed_lstools.create()
-                mbeds_by_tid = mbeds.list_mbeds_by_targetid()   # key: target_id, value mbedls_dict()
+                # Listing should be done inside the loop. Otherwise it will loop on same data.
+                mbeds_by_tid = self.list_mbeds_by_targetid()    # key: target_id, value mbedls_dict()
                 if target_id in mbeds_by_tid:
                     if 'mount_point' in mbeds_by_tid[target_id]:
                         if mbeds_by_tid[target_id]['mount_point']:
@@ -163,8 +172,29 @@ class HostTestPluginBase:
                     break
                 sleep(loop_delay)
                 self.print_plugin_char('.')
+        HostTestPluginBase.thread_timing.mount_point_wait_time = HostTestPluginBase.mount_point_wait_time() + time() - start_time
         return (result, destination_disk)
 
+    @staticmethod
+    def mount_point_wait_time():
+        """! Total time (sec) spent in check_mount_point_ready() by plugins called from current thread """
+        return getattr(HostTestPluginBase.thread_timing, 'mount_point_wait_time', 0.0)
+
+    @staticmethod
+    def list_mbeds_by_targetid():
+        """! List connected devices with mbed-ls
+        @return Dictionary, key: target_id, value mbedls_dict()
+        @details When many DUTs are tested in parallel (see --devices) plugins poll mbed-ls at the
+                 same time. One scan serves all of them if it started less than MBEDLS_CACHE_TIME ago.
+        """
+        with HostTestPluginBase.mbedls_cache_lock:
+            scan_time, mbeds_by_tid = HostTestPluginBase.mbedls_cache
+            if mbeds_by_tid is None or time() - scan_time > HostTestPluginBase.MBEDLS_CACHE_TIME:
+                scan_time = time()
+                mbeds_by_tid = mbed_lstools.create().list_mbeds_by_targetid()
+                HostTestPluginBase.mbedls_cache = (scan_time, mbeds_by_tid)
+            return mbeds_by_tid
+
     def check_serial_port_ready(self, serial_port, target_id=None, timeout=60):
         """! Function checks (using mbed-ls) and updates serial port name information for DUT with specified target_id.
         If no target_id is specified function returns old serial port name.
@@ -185,9 +215,8 @@ class HostTestPluginBase:
             timeout_step = 0.5
             timeout = int(timeout / timeout_step)
             for i in range(timeout):
-                # mbed_lstools.create() should be done inside the loop. Otherwise it will loop on same data.
-                mbeds = mbed_lstools.create()
-                mbeds_by_tid = mbeds.list_mbeds_by_targetid()   # key: target_id, value mbedls_dict()
+                # Listing should be done inside the loop. Otherwise it will loop on same data.
+                mbeds_by_tid = self.list_mbeds_by_targetid()    # key: target_id, value mbedls_dict()
                 if target_id in mbeds_by_tid:
                     if 'serial_port' in mbeds_by_tid[target_id]:
                         if mbeds_by_tid[target_id]['serial_port']:
@@ -21,8 +21,14 @@ class HostTestRegistry:
     """ Simple class used to register and store
         host test plugins for further usage
     """
-    # Here we actually store all the plugins
-    PLUGINS = {}    # 'Plugin Name' : Plugin Object
+    def __init__(self):
+        """ ctor
+        """
+        # Here we actually store all the plugins
+        self.PLUGINS = {}           # 'Plugin Name' : Plugin Object
+        # Index of registered plugins maintained by register_plugin(), used by call_plugin()
+        self.plugins_by_cap = {}    # ('Plugin Type', 'Capability') : Plugin Object
+        self.caps_by_type = {}      # 'Plugin Type' : sorted list of capabilities
 
     def print_error(self, text):
         """! Prints error directly on console
@@ -43,11 +49,17 @@ class HostTestRegistry:
                  should be at least for one type of plugin configured with the same parameters
                  because we do not know which of them will actually use particular parameter.
         """
-        # TODO:
-        # - check for unique caps for specified type
         if plugin.name not in self.PLUGINS:
-            if plugin.setup(): # Setup plugin can be completed without errors
+            # Each capability of given type can be provided by one plugin only
+            conflicts = sorted(set(cap for cap in plugin.capabilities if (plugin.type, cap) in self.plugins_by_cap))
+            if conflicts:
+                self.print_error("%s capabilities already provided by other %s plugins: %s"% (plugin.name,
+                    plugin.type, ', '.join("%s (%s)"% (cap, self.plugins_by_cap[(plugin.type, cap)].name) for cap in conflicts)))
+            elif plugin.setup(): # Setup plugin can be completed without errors
                 self.PLUGINS[plugin.name] = plugin
+                for capability in plugin.capabilities:
+                    self.plugins_by_cap[(plugin.type, capability)] = plugin
+                self.caps_by_type[plugin.type] = sorted(self.caps_by_type.get(plugin.type, []) + list(plugin.capabilities))
                 return True
             else:
                 self.print_error("%s setup failed"% plugin.name)
@@ -63,10 +75,9 @@ class HostTestRegistry:
         @param kwargs Additional plugin parameters
         @return Returns result from plugin's execute() method
         """
-        for plugin_name in self.PLUGINS:
-            plugin = self.PLUGINS[plugin_name]
-            if plugin.type == type and capability in plugin.capabilities:
-                return plugin.execute(capability, *args, **kwargs)
+        plugin = self.plugins_by_cap.get((type, capability))
+        if plugin:
+            return plugin.execute(capability, *args, **kwargs)
         return False
 
     def get_plugin_caps(self, type):
@@ -74,12 +85,7 @@ class HostTestRegistry:
         @param type Plugin type
         @return Returns list of capabilities for plugin. If there are no capabilities empty list is returned
         """
-        result = []
-        for plugin_name in self.PLUGINS:
-            plugin = self.PLUGINS[plugin_name]
-            if plugin.type == type:
-                result.extend(plugin.capabilities)
-        return sorted(result)
+        return list(self.caps_by_type.get(type, []))
 
     def load_plugin(self, name):
         """! Used to load module from system (by import)
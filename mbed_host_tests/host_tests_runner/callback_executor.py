@@ -0,0 +1,97 @@
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import threading
+import traceback
+from time import time
+from Queue import Queue
+from mbed_host_tests.host_tests_logger import HtrunLogger
+
+
+class CallbackExecutor(object):
+    """! Executes host test callbacks on pool of worker threads
+    @details Events with the same key are always handled by the same worker thread,
+             so callbacks for one key are called in order events were received.
+             Callbacks for different keys may run in parallel.
+    """
+    DEFAULT_WORKERS = 4
+    FAILED_KEY = '__callback_failed'    # Event sent to event loop when callback fails
+
+    def __init__(self, workers=DEFAULT_WORKERS, logger=None, event_queue=None):
+        """! ctor
+        @param workers Number of worker threads
+        @param logger Logger used to report callback failures
+        @param event_queue Queue event loop reads, FAILED_KEY event is put to it when callback fails
+        """
+        self.logger = logger if logger else HtrunLogger('HTST')
+        self.event_queue = event_queue
+        self.failed = False     # Set if any callback raised exception
+        self.queues = []
+        self.threads = []
+        for i in range(max(1, workers)):
+            queue = Queue()
+            thread = threading.Thread(target=self.__worker, args=(queue,), name='HTST-CB%d'% i)
+            thread.daemon = True
+            thread.start()
+            self.queues.append(queue)
+            self.threads.append(thread)
+
+    def __worker(self, queue):
+        while True:
+            job = queue.get()
+            try:
+                if job is None:
+                    return
+                (callback, key, value, timestamp) = job
+                try:
+                    callback(key, value, timestamp)
+                except Exception:
+                    self.failed = True
+                    self.logger.prn_err("callback for event '%s' failed, reason:"% key)
+                    self.logger.prn_inf("==== Traceback start ====")
+                    for line in traceback.format_exc().splitlines():
+                        print line
+                    self.logger.prn_inf("==== Traceback end ====")
+                    if self.event_queue is not None:
+                        # Wake up event loop, it should not wait for next event to notice failure
+                        self.event_queue.put((self.FAILED_KEY, key, time()))
+            finally:
+                queue.task_done()
+
+    def submit(self, callback, key, value, timestamp):
+        """! Queue callback call for event, returns immediately """
+        self.queues[hash(key) % len(self.queues)].put((callback, key, value, timestamp))
+
+    def wrap(self, callback):
+        """! Wrap callback so it is executed by this executor
+        @return Callable with callback signature (key, value, timestamp)
+        """
+        def concurrent_callback(key, value, timestamp):
+            self.submit(callback, key, value, timestamp)
+        return concurrent_callback
+
+    def join(self):
+        """! Block until all queued callbacks were executed """
+        for queue in self.queues:
+            queue.join()
+
+    def shutdown(self):
+        """! Execute all queued callbacks and stop worker threads """
+        for queue in self.queues:
+            queue.put(None)
+        for thread in self.threads:
+            thread.join()
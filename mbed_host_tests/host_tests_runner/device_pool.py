@@ -0,0 +1,349 @@
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import json
+import traceback
+from time import time
+from Queue import Queue, Empty
+from mbed_host_tests.host_tests_logger import HtrunLogger
+from mbed_host_tests.host_tests_runner.host_test import HostTestResults
+from mbed_host_tests.host_tests_runner.multi_dut import MultiDutRunner
+from mbed_host_tests.host_tests_runner.pipeline import StagePipeline
+from mbed_host_tests.host_tests_runner.host_test_default import DefaultTestSelector
+from mbed_host_tests.host_tests_plugins.host_test_plugins import HostTestPluginBase
+
+
+class DevicePoolScheduler(HostTestResults):
+    """! Dispatches queue of test jobs to pool of DUTs
+    @details Jobs are dispatched in queue order to idle DUTs with the same platform, so tests of
+             one suite are sharded across identical boards. Scheduling decisions are made in
+             the thread which called run(), jobs are run by runner:
+             * runner.prepare_job(device, job, flash) is called in scheduler thread and returns job handle,
+             * runner.start_job(handle, done) starts job and returns, done(result) is called with test
+               result (RESULT_*) from any thread when job finishes.
+             Job which ends with infrastructure failure (e.g. copy or serial port error) is retried on other DUT.
+    """
+    # DUT is removed from pool after this many infrastructure failures in a row
+    MAX_INFRA_FAILURES = 3
+    WAIT_PERIOD = 1.0   # Scheduler wakes up at least this often, so it can handle signals (e.g. Ctrl+C)
+
+    def __init__(self, devices, runner, logger=None, max_retries=1):
+        """! ctor
+        @param devices List of DUT dictionaries with unique 'name' and 'platform_name'
+        @param runner Object which prepares and runs jobs, see class description
+        @param logger Logger instance
+        @param max_retries How many times job can be retried after infrastructure failure
+        """
+        HostTestResults.__init__(self)
+        self.devices = devices
+        self.runner = runner
+        self.logger = logger if logger else HtrunLogger('POOL')
+        self.max_retries = max_retries
+        # Results caused by DUT or host setup rather than by tested image
+        self.infra_results = [self.RESULT_IOERR_COPY, self.RESULT_IOERR_DISK, self.RESULT_IO_SERIAL]
+        self.images = {}            # DUT name -> image flashed on DUT by last job
+        self.infra_failures = {}    # DUT name -> infrastructure failures in a row
+        self.busy = set()           # Names of DUTs running jobs
+        self.pending = []           # Jobs waiting for DUT
+        self.results = {}           # Job name -> {'result', 'device', 'attempts', 'duration'}
+        self.finished = Queue()     # (device, entry, result) of jobs finished by runner
+
+    def run(self, jobs):
+        """! Run all jobs and wait until they finish
+        @param jobs List of job dictionaries with unique 'name', 'image_path' and 'platform_name'
+        @return Dictionary of job results, key: job name, see self.results
+        """
+        self.pending = [{'job' : job, 'excluded' : set(), 'attempts' : 0, 'start' : time(), 'result' : None} for job in jobs]
+        while True:
+            for device in self.devices:
+                if device['name'] in self.busy or not self.__in_pool(device):
+                    continue
+                entry = self.next_job(device)
+                if entry:
+                    self.__start_job(device, entry)
+
+            if not self.busy:
+                break   # Nothing runs, so remaining jobs can't be run by any DUT
+            try:
+                device, entry, result = self.finished.get(timeout=self.WAIT_PERIOD)
+            except Empty:
+                continue
+            self.__job_finished(device, entry, result)
+
+        for entry in self.pending:
+            # No DUT of job's platform in pool, or all of them failed this job
+            self.__set_result(entry, None, entry['result'] or self.RESULT_NOT_DETECTED)
+        self.pending = []
+        return self.results
+
+    def next_job(self, device):
+        """! Pick job for idle DUT
+        @param device DUT from pool
+        @return Entry of pending job or None if no pending job can run on DUT
+        @details Job with image which is already on DUT is picked first (no flashing is needed),
+                 then first job with image not flashed on other DUT of the same platform, then
+                 first job in queue.
+        """
+        candidates = [e for e in self.pending
+                      if e['job']['platform_name'] == device['platform_name'] and device['name'] not in e['excluded']]
+        if not candidates:
+            return None
+        image = self.images.get(device['name'])
+        other_images = set(self.images.get(d['name']) for d in self.devices
+                           if d['name'] != device['name'] and d['platform_name'] == device['platform_name'])
+        for entry in candidates:
+            if image and entry['job']['image_path'] == image:
+                return entry
+        for entry in candidates:
+            if entry['job']['image_path'] not in other_images:
+                return entry
+        return candidates[0]
+
+    def __in_pool(self, device):
+        return self.infra_failures.get(device['name'], 0) < self.MAX_INFRA_FAILURES
+
+    def __start_job(self, device, entry):
+        job = entry['job']
+        flash = self.images.get(device['name']) != job['image_path']
+        self.pending.remove(entry)
+        self.busy.add(device['name'])
+        entry['attempts'] += 1
+        self.logger.prn_inf("job '%s' -> '%s'%s"% (job['name'], device['name'], "" if flash else " (image already flashed)"))
+        def done(result):
+            self.finished.put((device, entry, result))
+
+        try:
+            handle = self.runner.prepare_job(device, job, flash)
+            self.runner.start_job(handle, done)
+        except Exception:
+            self.logger.prn_err("can't start job '%s' on '%s', reason:"% (job['name'], device['name']))
+            for line in traceback.format_exc().splitlines():
+                print line
+            done(self.RESULT_ERROR)
+
+    def __job_finished(self, device, entry, result):
+        name = device['name']
+        self.busy.discard(name)
+        entry['result'] = result
+        if result not in self.infra_results:
+            self.infra_failures[name] = 0
+            if result == self.RESULT_ERROR:
+                self.images.pop(name, None)     # Job may have failed before image was flashed
+            else:
+                self.images[name] = entry['job']['image_path']
+            self.__set_result(entry, name, result)
+            return
+
+        # DUT state is unknown, next job on it is flashed again
+        self.images.pop(name, None)
+        self.infra_failures[name] = self.infra_failures.get(name, 0) + 1
+        if not self.__in_pool(device):
+            self.logger.prn_wrn("'%s' removed from pool after %d infrastructure failures"% (name, self.infra_failures[name]))
+        entry['excluded'].add(name)
+        can_retry = any(d['platform_name'] == entry['job']['platform_name'] and
+                        d['name'] not in entry['excluded'] and
+                        self.__in_pool(d) for d in self.devices)
+        if entry['attempts'] <= self.max_retries and can_retry:
+            self.logger.prn_wrn("job '%s' failed on '%s' with '%s', retrying on other DUT"% (entry['job']['name'], name, result))
+            self.pending.insert(0, entry)
+        else:
+            self.__set_result(entry, name, result)
+
+    def __set_result(self, entry, device_name, result):
+        job = entry['job']
+        duration = time() - entry['start']
+        self.results[job['name']] = {
+            'result' : result,
+            'device' : device_name,
+            'attempts' : entry['attempts'],
+            'duration' : duration,
+        }
+        self.logger.prn_inf("{{job_result;name=%s,device=%s,result=%s,duration=%.3f}}"% (job['name'], device_name, result, duration))
+
+
+class DevicePoolRunner(MultiDutRunner):
+    """! Runs tests from --jobs manifest on pool of DUTs, see DevicePoolScheduler
+    @details DUTs are listed in --devices manifest (platform is given with 'micro' or -m option)
+             or detected with mbed-ls. Connection process of each job is started from
+             scheduler thread. Jobs go through STAGES of StagePipeline, each stage has its own
+             pool of workers (one per DUT by default, see --stage-workers), so e.g. slow image
+             copy to one DUT doesn't hold up host tests supervising other DUTs.
+    """
+    # Keys of --jobs manifest entries which override command line options for one job
+    JOB_OPTIONS = ['image_path', 'enum_host_tests', 'copy_method', 'program_cycle_s']
+    # Stages of each job, connection to DUT is made by supervise stage (see run_test())
+    STAGES = ['flash', 'wait_ready', 'supervise', 'teardown']
+
+    def __init__(self, options, selector_class=DefaultTestSelector):
+        """! ctor
+        @param options Command line options, options.jobs is path to jobs manifest
+        @param selector_class Class which runs test on one DUT
+        """
+        MultiDutRunner.__init__(self, options, selector_class)
+        self.logger = HtrunLogger('POOL')
+
+    def load_jobs(self, path):
+        """! Load list of jobs from --jobs manifest
+        @param path Path to JSON manifest
+        @return List of job dictionaries with 'name', 'platform_name' and JOB_OPTIONS
+        @details Manifest is JSON list of jobs or object with such list under 'jobs' key, e.g.:
+                 [{"name" : "tests-basic", "image_path" : "BUILD/K64F/tests-basic.bin", "platform_name" : "K64F"}]
+                 'platform_name' can be omitted if -m option is used.
+                 Raises IOError or ValueError if manifest can't be used.
+        """
+        with open(path) as f:
+            jobs = json.load(f)
+        if isinstance(jobs, dict):
+            jobs = jobs.get('jobs')
+        if not isinstance(jobs, list):
+            raise ValueError("manifest should contain list of jobs")
+        names = set()
+        for i, job in enumerate(jobs):
+            if not isinstance(job, dict) or not job.get('image_path'):
+                raise ValueError("job #%d has no 'image_path'"% i)
+            unknown = [k for k in job if k not in ('name', 'platform_name') and k not in self.JOB_OPTIONS]
+            if unknown:
+                raise ValueError("job #%d has unknown keys: %s"% (i, ", ".join(sorted(unknown))))
+            job.setdefault('platform_name', self.options.micro)
+            if not job['platform_name']:
+                raise ValueError("job #%d has no 'platform_name'"% i)
+            job.setdefault('name', os.path.splitext(os.path.basename(job['image_path']))[0])
+            if job['name'] in names:
+                raise ValueError("job name '%s' is not unique"% job['name'])
+            names.add(job['name'])
+        return jobs
+
+    def detect_devices(self):
+        """! List DUTs connected to host with mbed-ls
+        @return List of DUT dictionaries, see MultiDutRunner.load_devices()
+        """
+        devices = []
+        mbeds_by_tid = HostTestPluginBase.list_mbeds_by_targetid()
+        for target_id in sorted(mbeds_by_tid):
+            mbed = mbeds_by_tid[target_id]
+            if not mbed.get('serial_port') or not mbed.get('platform_name'):
+                continue
+            devices.append({
+                'name' : target_id,
+                'port' : mbed['serial_port'],
+                'disk' : mbed.get('mount_point'),
+                'target_id' : target_id,
+                'micro' : mbed['platform_name'],
+            })
+        return devices
+
+    def run(self):
+        """! Run all jobs from jobs manifest and wait until they finish
+        @return 0 if all jobs passed, otherwise integer result of first failed job (in manifest order)
+        """
+        try:
+            jobs = self.load_jobs(self.options.jobs)
+            devices = self.load_devices(self.options.devices) if self.options.devices else self.detect_devices()
+        except (IOError, ValueError) as e:
+            self.logger.prn_err("can't load jobs or devices: %s"% str(e))
+            return self.get_test_result_int(self.RESULT_ERROR)
+        for device in devices:
+            device['platform_name'] = device.get('micro') or self.options.micro
+
+        self.logger.prn_inf("running %d jobs on %d DUTs: %s"% (len(jobs), len(devices),
+                            ", ".join("%s (%s)"% (d['name'], d['platform_name']) for d in devices)))
+        try:
+            workers = self.stage_workers(self.options.stage_workers, len(devices))
+        except ValueError as e:
+            self.logger.prn_err("invalid --stage-workers: %s"% str(e))
+            return self.get_test_result_int(self.RESULT_ERROR)
+        stage_functions = [self.flash_stage, self.wait_ready_stage, self.supervise_stage, self.teardown_stage]
+        self.pipeline = StagePipeline([(stage, function, workers[stage]) for stage, function in zip(self.STAGES, stage_functions)],
+                                      self.logger)
+        scheduler = DevicePoolScheduler(devices, self, self.logger, self.options.job_retries)
+        try:
+            results = scheduler.run(jobs)
+        finally:
+            self.pipeline.close()
+        self.logger.prn_inf("time spent in stages: %s"% ", ".join("%s=%.3f"% (stage, self.pipeline.stage_time[stage])
+                                                                   for stage in self.STAGES))
+
+        self.logger.prn_inf("results of %d jobs:"% len(jobs))
+        result = 0
+        for job in jobs:
+            job_result = results[job['name']]
+            self.logger.prn_inf("%s: %s (%s)"% (job['name'], job_result['result'], job_result['device']))
+            code = self.get_test_result_int(job_result['result'])
+            if code != 0 and result == 0:
+                result = code
+        return result
+
+    def stage_workers(self, spec, default):
+        """! Number of workers of each stage
+        @param spec Comma separated STAGE=NUMBER list (--stage-workers option), can be None
+        @param default Number of workers of stages not listed in spec
+        @return Dictionary, key: stage name, value: number of workers
+        @details Raises ValueError if spec is not valid.
+        """
+        workers = dict((stage, max(1, default)) for stage in self.STAGES)
+        for item in (spec.split(',') if spec else []):
+            stage, _, number = item.partition('=')
+            stage = stage.strip()
+            if stage not in workers:
+                raise ValueError("unknown stage '%s', stages are: %s"% (stage, ", ".join(self.STAGES)))
+            if not number.strip().isdigit() or int(number) < 1:
+                raise ValueError("number of '%s' workers should be positive integer"% stage)
+            workers[stage] = int(number)
+        return workers
+
+    def prepare_job(self, device, job, flash):
+        """! Create test selector for job, called by DevicePoolScheduler in scheduler thread """
+        options = self.device_options(device)
+        for key in self.JOB_OPTIONS:
+            if key in job:
+                setattr(options, key, job[key])
+        options.batch = None
+        if not flash:
+            options.skip_flashing = True
+        selector = self.selector_class(options)
+        selector.logger = HtrunLogger('HT-%s'% device['name'])
+        selector.prespawn_conn_process()
+        return selector
+
+    def start_job(self, selector, done):
+        """! Submit test to stage pipeline, called by DevicePoolScheduler """
+        self.pipeline.submit(selector, lambda selector: done(selector.test_result))
+
+    # Stage functions called by pipeline workers, see StagePipeline
+    def flash_stage(self, selector):
+        selector.start_test()
+        return selector.flash_image()
+
+    def wait_ready_stage(self, selector):
+        selector.wait_ready()
+        return True
+
+    def supervise_stage(self, selector):
+        selector.supervise_test()
+        return True
+
+    def teardown_stage(self, selector):
+        try:
+            if selector.test_result is None:
+                selector.test_result = self.RESULT_ERROR    # Earlier stage failed
+            if selector.test_start_time is not None:
+                selector.report_test()
+        finally:
+            selector.finish_prespawned_conn_process()
+            selector.finish()
+        return True
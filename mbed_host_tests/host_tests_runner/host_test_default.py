@@ -18,10 +18,14 @@ Author: Przemyslaw Wirkus <Przemyslaw.Wirkus@arm.com>
 """
 
 
+import os
 import sys
+import json
 import traceback
+from copy import copy
 from time import time
 from Queue import Empty as QueueEmpty   # Queue here refers to the module, not a class
+from collections import OrderedDict
 
 from mbed_host_tests import BaseHostTest
 from multiprocessing import Process, Queue, Lock
@@ -30,14 +34,63 @@ from mbed_host_tests import get_host_test
 from mbed_host_tests import enum_host_tests
 from mbed_host_tests import host_tests_plugins
 from mbed_host_tests.host_tests_logger import HtrunLogger
-from mbed_host_tests.host_tests_conn_proxy import conn_process
+from mbed_host_tests.host_tests_conn_proxy import CONN_ENGINES
+from mbed_host_tests.host_tests_conn_proxy.conn_queue import EventQueueReader, EventMetrics, create_event_queue, queue_depth
 from mbed_host_tests.host_tests_runner.host_test import DefaultTestSelectorBase
+from mbed_host_tests.host_tests_runner.callback_executor import CallbackExecutor
 from mbed_host_tests.host_tests_toolbox.host_functional import handle_send_break_cmd
 
+class EventLoopState(object):
+    """! Mutable state of DefaultTestSelector.run_test() event loop shared by event handlers """
+
+    def __init__(self):
+        self.result = None
+        self.timeout_duration = 10      # Default test case timeout
+        self.start_time = time()
+        self.conn_process = None
+        # Number of connection processes started which did not send __conn_process_end yet
+        self.conn_processes = 0
+        self.sync_time = None           # Time when __sync reply from DUT was received
+        self.conn_metrics = None        # Final metrics of connection process
+        self.conn_lost = False          # Set when connection process lost connection to DUT
+        # Executes host test callbacks registered as concurrent, if there are any
+        self.callback_executor = None
+        # Host test callbacks, concurrent ones are wrapped so they run on callback_executor
+        self.callbacks = {}
+        # Dispatch table of current event loop phase and handler of events not in it
+        self.handlers = {}
+        self.orphan = None
+        # if True we will allow host test to consume all events after test is finished
+        self.callbacks_consume = True
+        # Flag check if __exit event occurred
+        self.callbacks__exit = False
+        # Flag check if __exit_event_queue event occurred
+        self.callbacks__exit_event_queue = False
+
+
 class DefaultTestSelector(DefaultTestSelectorBase):
     """! Select default host_test supervision (replaced after auto detection) """
     RESET_TYPE_SW_RST   = "software_reset"
     RESET_TYPE_HW_RST   = "hardware_reset"
+    CONN_END_CHECK_PERIOD = 1.0     # How often host checks if connection process died while waiting for __conn_process_end
+
+    # Keys of --batch manifest tests which override command line options for one test
+    BATCH_OPTIONS = ['image_path', 'enum_host_tests', 'copy_method', 'program_cycle_s', 'skip_flashing']
+
+    # Phases reported by report_timing() in this order, all in seconds except 'sync_resends'
+    TIMING_PHASES = [
+        'copy',             # Image copy
+        'mount_wait',       # Waiting for mount point
+        'program_cycle',    # Sleep after image was copied
+        'conn_start',       # Connection process start-up, not hidden by flashing
+        'serial_wait',      # Waiting for serial port (mbed-ls polling)
+        'reset',            # Reset plugin and post-reset sleep
+        'sync',             # __sync handshake
+        'sync_resends',     # Number of __sync packets resent
+        'test',             # Host test body, from __sync to end of event loop
+        'teardown',         # Connection process join, remaining events, result() and teardown()
+        'total',
+    ]
 
     def __init__(self, options):
         """! ctor
@@ -46,6 +99,16 @@ class DefaultTestSelector(DefaultTestSelectorBase):
 
         self.logger = HtrunLogger('HTST')
 
+        # Connection process (and its queues) started before DUT was flashed
+        self.conn_prespawned = None
+        # Connection process (and its queues) of previous test in batch, see execute_batch()
+        self.conn_kept = None
+        # Time spent in test phases, see TIMING_PHASES
+        self.timing = {}
+        # Result of last execute_test() call
+        self.test_result = None
+        self.test_start_time = None
+
         # Handle extra command from
         if options:
             if options.enum_host_tests:
@@ -115,11 +178,24 @@ class DefaultTestSelector(DefaultTestSelectorBase):
             Handling of all events and connector are handled here.
         @return Return self.TestResults.RESULT_* enum
         """
-        result = None
-        timeout_duration = 10       # Default test case timeout
+        state = EventLoopState()
         coverage_idle_timeout = 10  # Default coverage idle timeout
-        event_queue = Queue()       # Events from DUT to host
-        dut_event_queue = Queue()   # Events from host to DUT {k;v}
+        conn_process_kept = self.conn_kept is not None
+        if self.conn_kept:
+            # Connection process of previous test in batch waits for configuration
+            (prespawned_p, event_queue, dut_event_queue) = self.conn_kept
+            self.conn_kept = None
+        elif self.conn_prespawned:
+            # Connection process was started while DUT was flashed, it waits for configuration
+            (prespawned_p, event_queue, dut_event_queue) = self.conn_prespawned
+            self.conn_prespawned = None
+        else:
+            prespawned_p = None
+            event_queue = create_event_queue(self.options.event_transport)  # Events from DUT to host
+            dut_event_queue = Queue()   # Events from host to DUT {k;v}
+        event_reader = EventQueueReader(event_queue)    # Unpacks batched events from DUT
+        # Rate and age of events handled by event loop
+        host_metrics = EventMetrics(self.options.metrics_period)
 
         def callback__notify_prn(key, value, timestamp):
             """! Handles __norify_prn. Prints all lines in separate log line """
@@ -130,12 +206,6 @@ class DefaultTestSelector(DefaultTestSelectorBase):
             "__notify_prn" : callback__notify_prn
         }
 
-        # if True we will allow host test to consume all events after test is finished
-        callbacks_consume = True
-        # Flag check if __exit event occurred
-        callbacks__exit = False
-        # Flag check if __exit_event_queue event occurred
-        callbacks__exit_event_queue = False
         # Handle to dynamically loaded host test object
         self.test_supervisor = None
         # Version: greentea-client version from DUT
@@ -143,7 +213,7 @@ class DefaultTestSelector(DefaultTestSelectorBase):
 
         self.logger.prn_inf("starting host test process...")
 
-        def start_conn_process():
+        def get_conn_config():
             # Create device info here as it may change after restart.
             config = {
                 "digest" : "serial",
@@ -157,6 +227,13 @@ class DefaultTestSelector(DefaultTestSelectorBase):
                 "sync_behavior" : self.options.sync_behavior,
                 "platform_name" : self.options.micro,
                 "image_path" : self.mbed.image_path,
+                "event_batch_size" : self.options.event_batch_size,
+                "metrics_period" : self.options.metrics_period,
+                "coverage_dir" : self.options.coverage_dir,
+                "keep_alive" : bool(self.options.batch),
+                "event_queue_size" : self.options.event_queue_size,
+                "overflow_policy" : self.options.overflow_policy,
+                "overflow_sample_rate" : self.options.overflow_sample_rate,
             }
 
             if self.options.global_resource_mgr:
@@ -168,14 +245,41 @@ class DefaultTestSelector(DefaultTestSelectorBase):
                     "grm_host" : grm_host,
                     "grm_port" : grm_port,
                 })
+            return config
 
+        def start_conn_process():
             # DUT-host communication process
-            args = (event_queue, dut_event_queue, config)
-            p = Process(target=conn_process, args=args)
-            p.deamon = True
+            args = (event_queue, dut_event_queue, get_conn_config())
+            p = Process(target=CONN_ENGINES[self.options.conn_engine], args=args)
+            p.daemon = True
             p.start()
+            state.conn_processes += 1
             return p
 
+        def stop_conn_process():
+            # Disconnect to avoid connection lost event
+            dut_event_queue.put(('__host_test_finished', True, time()))
+            if self.options.batch:
+                # Process kept alive for next test (see keep_alive) waits for configuration, this makes it exit
+                dut_event_queue.put(('__host_test_finished', True, time()))
+            # Events sent before process finished are handled before it is replaced
+            wait_conn_process_end(state.handlers, state.orphan)
+            state.conn_process.join()
+
+        def wait_conn_process_end(handlers, orphan):
+            # Connection process sends __conn_process_end after its last event, so we read events
+            # until we get it instead of polling queue until it looks empty
+            while state.conn_processes > 0:
+                try:
+                    (key, value, timestamp) = event_reader.get(timeout=self.CONN_END_CHECK_PERIOD)
+                except QueueEmpty:
+                    # Only happens if connection process died before it sent __conn_process_end
+                    if not state.conn_process.is_alive() and event_reader.empty():
+                        self.logger.prn_wrn("connection process exited without __conn_process_end event")
+                        break
+                    continue
+                handlers.get(key, orphan)(key, value, timestamp)
+
         def process_code_coverage(key, value, timestamp):
             """! Process the found coverage key value and perform an idle
                  loop checking for more timeing out if there is no response from
@@ -184,18 +288,23 @@ class DefaultTestSelector(DefaultTestSelectorBase):
             @param value The value from the first coverage event
             @param timestamp The timestamp from the first coverage event
             @return The elapsed time taken by the processing of code coverage,
-                    and the (key, value, and timestamp) of the next event
+                    and the (key, value, and timestamp) of the next event or None
+                    if idle timeout expired
             """
             original_start_time = time()
             start_time = time()
 
             # Perform callback on first event
-            callbacks[key](key, value, timestamp)
+            run_callback(key, value, timestamp)
 
             # Start idle timeout loop looking for other events
-            while (time() - start_time) < coverage_idle_timeout:
+            while True:
+                # Wait exactly until idle timeout expires
+                time_left = start_time + coverage_idle_timeout - time()
+                if time_left <= 0:
+                    return time() - original_start_time, None
                 try:
-                    (key, value, timestamp) = event_queue.get(timeout=1)
+                    (key, value, timestamp) = event_reader.get(timeout=time_left)
                 except QueueEmpty:
                     continue
 
@@ -205,242 +314,388 @@ class DefaultTestSelector(DefaultTestSelectorBase):
                     start_time = time()
 
                     # Perform callback
-                    callbacks[key](key, value, timestamp)
+                    run_callback(key, value, timestamp)
                     continue
 
                 elapsed_time = time() - original_start_time
                 return elapsed_time, (key, value, timestamp)
 
-        p = start_conn_process()
+        def run_callback(key, value, timestamp):
+            # Host test callback bypassing system event handlers (concurrent ones still run on worker thread)
+            if key in state.callbacks:
+                state.callbacks[key](key, value, timestamp)
+
+        # System event handlers, each phase of the event loop has its own dispatch table
+
+        def handle__timeout(key, value, timestamp):
+            # Override default timeout for this event queue
+            state.start_time = time()
+            state.timeout_duration = int(value) # New timeout
+            self.logger.prn_inf("setting timeout to: %d sec"% int(value))
+
+        def handle__version(key, value, timestamp):
+            self.client_version = value
+            self.logger.prn_inf("DUT greentea-client version: " + self.client_version)
+
+        def handle__host_test_name(key, value, timestamp):
+            # Load dynamically requested host test
+            self.test_supervisor = get_host_test(value)
+            if self.test_supervisor and (self.options.batch or self.options.devices):
+                # Registry holds one host test object, each test in batch (or on each DUT) gets new one
+                self.test_supervisor = self.test_supervisor.__class__()
+            concurrent_keys = []
+
+            # Check if host test object loaded is actually host test class
+            # derived from 'mbed_host_tests.BaseHostTest()'
+            # Additionaly if host test class implements custom ctor it should
+            # call BaseHostTest().__Init__()
+            if self.test_supervisor and self.is_host_test_obj_compatible(self.test_supervisor):
+                # Pass communication queues and setup() host test
+                self.test_supervisor.setup_communication(event_queue, dut_event_queue)
+                try:
+                    # After setup() user should already register all callbacks
+                    self.test_supervisor.setup()
+                except (TypeError, ValueError):
+                    # setup() can throw in normal circumstances TypeError and ValueError
+                    self.logger.prn_err("host test setup() failed, reason:")
+                    self.logger.prn_inf("==== Traceback start ====")
+                    for line in traceback.format_exc().splitlines():
+                        print line
+                    self.logger.prn_inf("==== Traceback end ====")
+                    state.result = self.RESULT_ERROR
+                    event_queue.put(('__exit_event_queue', 0, time()))
+
+                self.logger.prn_inf("host test setup() call...")
+                if self.test_supervisor.get_callbacks():
+                    callbacks.update(self.test_supervisor.get_callbacks())
+                    concurrent_keys = [k for k in self.test_supervisor.get_concurrent_callbacks() if k in callbacks]
+                    self.logger.prn_inf("CALLBACKs updated")
+                else:
+                    self.logger.prn_wrn("no CALLBACKs specified by host test")
+                self.logger.prn_inf("host test detected: %s"% value)
+            else:
+                self.logger.prn_err("host test not detected: %s"% value)
+                state.result = self.RESULT_ERROR
+                event_queue.put(('__exit_event_queue', 0, time()))
+
+            # Host test callbacks are merged with main phase system handlers, system events take precedence
+            state.callbacks = dict(callbacks)
+            if concurrent_keys:
+                self.logger.prn_inf("concurrent CALLBACKs: %s"% ", ".join(sorted(concurrent_keys)))
+                state.callback_executor = CallbackExecutor(logger=self.logger, event_queue=event_queue)
+                for k in concurrent_keys:
+                    state.callbacks[k] = state.callback_executor.wrap(callbacks[k])
+            state.handlers = dict(state.callbacks)
+            state.handlers.update(main_handlers)
+            state.orphan = orphan_main
+
+        def handle__sync(key, value, timestamp):
+            # This is DUT-Host Test handshake event
+            self.logger.prn_inf("sync KV found, uuid=%s, timestamp=%f"% (str(value), timestamp))
+            state.sync_time = time()
+
+        def format_metrics(metrics):
+            return ", ".join("%s=%s"% (k, ("%.3f"% v if type(v) is float else v)) for k, v in sorted(metrics.iteritems()))
+
+        def handle__metrics(key, value, timestamp):
+            # This event is sent by conn_process periodically (--metrics-period) and when it finishes
+            if value.get('final'):
+                state.conn_metrics = value
+                return
+            metrics = {
+                'conn' : value,
+                'host' : host_metrics.report(),
+                'dut_event_queue_depth' : queue_depth(dut_event_queue),
+            }
+            self.logger.prn_inf("metrics: conn(%s) host(%s) dut_event_queue_depth=%s"% (format_metrics(metrics['conn']),
+                format_metrics(metrics['host']), metrics['dut_event_queue_depth']))
+            if '__metrics' in callbacks:
+                # Host test can register this callback with force=True
+                callbacks['__metrics'](key, metrics, timestamp)
+
+        def handle__coverage_stored(key, value, timestamp):
+            # This event is sent by conn_process when coverage dump was streamed to file (--coverage-dir)
+            self.logger.prn_inf("coverage dump '%s' stored in '%s' (%d bytes)"% (value['path'], value['file'], value['size']))
+            if '__coverage_stored' in callbacks:
+                # Host test can register this callback with force=True
+                callbacks['__coverage_stored'](key, value, timestamp)
+
+        def handle__timing(key, value, timestamp):
+            # This event is sent by conn_process after handshake, time spent in connection phases
+            self.timing.update(value)
+
+        def handle__conn_process_end(key, value, timestamp):
+            # This event is the last event sent by conn_process (e.g. one stopped for hardware reset)
+            state.conn_processes -= 1
+
+        def handle__notify_conn_lost(key, value, timestamp):
+            # This event is sent by conn_process, DUT connection was lost
+            self.logger.prn_err(value)
+            self.logger.prn_wrn("stopped to consume events due to %s event"% key)
+            state.conn_lost = True
+            state.callbacks_consume = False
+            state.result = self.RESULT_IO_SERIAL
+            event_queue.put(('__exit_event_queue', 0, time()))
+
+        def handle__callback_failed(key, value, timestamp):
+            # This event is sent by CallbackExecutor (failure is logged there), it only wakes up
+            # event loop which ends when it sees executor failed
+            pass
+
+        def handle__exit_event_queue(key, value, timestamp):
+            # This event is sent by the host test indicating no more events expected
+            self.logger.prn_inf("%s received"% (key))
+            state.callbacks__exit_event_queue = True
+
+        def handle__coverage_start(key, value, timestamp):
+            # If coverage detected switch to idle loop
+            self.logger.prn_inf("starting coverage idle timeout loop...")
+            elapsed_time, event = process_code_coverage(key, value, timestamp)
+
+            # Ignore the time taken by the code coverage
+            state.timeout_duration += elapsed_time
+            self.logger.prn_inf("exiting coverage idle timeout loop (elapsed_time: %.2f" % elapsed_time)
+
+            if event:
+                # Event which ended coverage loop
+                (key, value, timestamp) = event
+                state.handlers.get(key, state.orphan)(key, value, timestamp)
+
+        def handle__notify_complete(key, value, timestamp):
+            # This event is sent by Host Test, test result is in value
+            # or if value is None, value will be retrieved from HostTest.result() method
+            self.logger.prn_inf("%s(%s)"% (key, str(value)))
+            state.result = value
+
+        def handle__reset_dut(key, value, timestamp):
+            if value not in [DefaultTestSelector.RESET_TYPE_HW_RST, DefaultTestSelector.RESET_TYPE_SW_RST]:
+                self.logger.prn_err("Invalid reset type (%s). Supported types [%s]." %
+                                    (value, ", ".join([DefaultTestSelector.RESET_TYPE_HW_RST,
+                                                       DefaultTestSelector.RESET_TYPE_SW_RST])))
+                self.logger.prn_inf("Software reset will be performed.")
+                value = DefaultTestSelector.RESET_TYPE_SW_RST
+
+            if value == DefaultTestSelector.RESET_TYPE_SW_RST and not self.options.global_resource_mgr:
+                self.logger.prn_inf("Performing software reset.")
+                # Reopening serial port in running connection process will soft reset DUT
+                dut_event_queue.put(('__reconnect', self.mbed.port, time()))
+            else:
+                stop_conn_process()
+
+                if value == DefaultTestSelector.RESET_TYPE_HW_RST:
+                    self.logger.prn_inf("Performing hard reset.")
+                    # request hardware reset
+                    self.mbed.hw_reset()
+                else:
+                    self.logger.prn_inf("Performing software reset.")
+                    # Just disconnecting and re-connecting comm process will soft reset DUT
+
+                # connect to the device
+                state.conn_process = start_conn_process()
+
+        def handle__exit(key, value, timestamp):
+            # This event is sent by DUT, test suite exited
+            self.logger.prn_inf("%s(%s)"% (key, str(value)))
+            state.callbacks__exit = True
+            event_queue.put(('__exit_event_queue', 0, time()))
+
+        def orphan_preamble(key, value, timestamp):
+            # Consume other system level events
+            if not key.startswith('__'):
+                self.logger.prn_err("orphan event in preamble phase: {{%s;%s}}, timestamp=%f"% (key, str(value), timestamp))
+
+        def orphan_main(key, value, timestamp):
+            self.logger.prn_err("orphan event in main phase: {{%s;%s}}, timestamp=%f"% (key, str(value), timestamp))
+
+        def orphan_consume(key, value, timestamp):
+            # Consume other system level events
+            if not key.startswith('__'):
+                self.logger.prn_wrn(">>> orphan event: {{%s;%s}}, timestamp=%f"% (key, str(value), timestamp))
+
+        preamble_handlers = {
+            '__timeout' : handle__timeout,
+            '__version' : handle__version,
+            '__host_test_name' : handle__host_test_name,
+            '__sync' : handle__sync,
+            '__timing' : handle__timing,
+            '__metrics' : handle__metrics,
+            '__coverage_stored' : handle__coverage_stored,
+            '__notify_conn_lost' : handle__notify_conn_lost,
+            '__conn_process_end' : handle__conn_process_end,
+            '__exit_event_queue' : handle__exit_event_queue,
+        }
+
+        main_handlers = {
+            '__coverage_start' : handle__coverage_start,
+            '__coverage_stored' : handle__coverage_stored,
+            '__notify_complete' : handle__notify_complete,
+            '__reset_dut' : handle__reset_dut,
+            '__notify_conn_lost' : handle__notify_conn_lost,
+            '__exit' : handle__exit,
+            '__exit_event_queue' : handle__exit_event_queue,
+            CallbackExecutor.FAILED_KEY : handle__callback_failed,
+            '__timing' : handle__timing,
+            '__metrics' : handle__metrics,
+            '__conn_process_end' : handle__conn_process_end,
+        }
+
+        conn_start_time = time()
+        if prespawned_p:
+            self.logger.prn_inf("configuring %s connection process..."% ("kept alive" if conn_process_kept else "pre-spawned"))
+            state.conn_process = prespawned_p
+            state.conn_processes += 1
+            dut_event_queue.put(('__conn_config', get_conn_config(), time()))
+        else:
+            state.conn_process = start_conn_process()
 
         conn_process_started = False
-        try:
-            (key, value, timestamp) = event_queue.get(timeout=self.options.process_start_timeout)
+        if conn_process_kept:
+            # Kept alive process sent __conn_process_start before first test in batch
+            conn_process_started = True
+            self.timing['conn_start'] = time() - conn_start_time
+        else:
+            try:
+                (key, value, timestamp) = event_reader.get(timeout=self.options.process_start_timeout)
 
-            if key == '__conn_process_start':
-                conn_process_started = True
-            else:
-                self.logger.prn_err("First expected event was '__conn_process_start', received '%s' instead"% key)
+                if key == '__conn_process_start':
+                    conn_process_started = True
+                    self.timing['conn_start'] = time() - conn_start_time
+                else:
+                    self.logger.prn_err("First expected event was '__conn_process_start', received '%s' instead"% key)
 
-        except QueueEmpty:
-            self.logger.prn_err("Conn process failed to start in %f sec"% self.options.process_start_timeout)
+            except QueueEmpty:
+                self.logger.prn_err("Conn process failed to start in %f sec"% self.options.process_start_timeout)
 
         if not conn_process_started:
-            p.terminate()
+            state.conn_process.terminate()
             return self.RESULT_TIMEOUT
 
-        start_time = time()
+        state.start_time = time()
+        loop_start_time = state.start_time
+        # Preamble phase lasts until host test is loaded (see handle__host_test_name())
+        state.handlers = preamble_handlers
+        state.orphan = orphan_preamble
 
         try:
-            consume_preamble_events = True
+            while True:
+                # Block until next event or test timeout, deadline can be moved by event handlers
+                time_left = state.start_time + state.timeout_duration - time()
+                if time_left <= 0:
+                    break
 
-            while (time() - start_time) < timeout_duration:
                 # Handle default events like timeout, host_test_name, ...
                 try:
-                    (key, value, timestamp) = event_queue.get(timeout=1)
+                    (key, value, timestamp) = event_reader.get(timeout=time_left)
                 except QueueEmpty:
                     continue
 
-                if consume_preamble_events:
-                    if key == '__timeout':
-                        # Override default timeout for this event queue
-                        start_time = time()
-                        timeout_duration = int(value) # New timeout
-                        self.logger.prn_inf("setting timeout to: %d sec"% int(value))
-                    elif key == '__version':
-                        self.client_version = value
-                        self.logger.prn_inf("DUT greentea-client version: " + self.client_version)
-                    elif key == '__host_test_name':
-                        # Load dynamically requested host test
-                        self.test_supervisor = get_host_test(value)
-
-                        # Check if host test object loaded is actually host test class
-                        # derived from 'mbed_host_tests.BaseHostTest()'
-                        # Additionaly if host test class implements custom ctor it should
-                        # call BaseHostTest().__Init__()
-                        if self.test_supervisor and self.is_host_test_obj_compatible(self.test_supervisor):
-                            # Pass communication queues and setup() host test
-                            self.test_supervisor.setup_communication(event_queue, dut_event_queue)
-                            try:
-                                # After setup() user should already register all callbacks
-                                self.test_supervisor.setup()
-                            except (TypeError, ValueError):
-                                # setup() can throw in normal circumstances TypeError and ValueError
-                                self.logger.prn_err("host test setup() failed, reason:")
-                                self.logger.prn_inf("==== Traceback start ====")
-                                for line in traceback.format_exc().splitlines():
-                                    print line
-                                self.logger.prn_inf("==== Traceback end ====")
-                                result = self.RESULT_ERROR
-                                event_queue.put(('__exit_event_queue', 0, time()))
-
-                            self.logger.prn_inf("host test setup() call...")
-                            if self.test_supervisor.get_callbacks():
-                                callbacks.update(self.test_supervisor.get_callbacks())
-                                self.logger.prn_inf("CALLBACKs updated")
-                            else:
-                                self.logger.prn_wrn("no CALLBACKs specified by host test")
-                            self.logger.prn_inf("host test detected: %s"% value)
-                        else:
-                            self.logger.prn_err("host test not detected: %s"% value)
-                            result = self.RESULT_ERROR
-                            event_queue.put(('__exit_event_queue', 0, time()))
-
-                        consume_preamble_events = False
-                    elif key == '__sync':
-                        # This is DUT-Host Test handshake event
-                        self.logger.prn_inf("sync KV found, uuid=%s, timestamp=%f"% (str(value), timestamp))
-                    elif key == '__notify_conn_lost':
-                        # This event is sent by conn_process, DUT connection was lost
-                        self.logger.prn_err(value)
-                        self.logger.prn_wrn("stopped to consume events due to %s event"% key)
-                        callbacks_consume = False
-                        result = self.RESULT_IO_SERIAL
-                        event_queue.put(('__exit_event_queue', 0, time()))
-                    elif key == '__exit_event_queue':
-                        # This event is sent by the host test indicating no more events expected
-                        self.logger.prn_inf("%s received"% (key))
-                        callbacks__exit_event_queue = True
-                        break
-                    elif key.startswith('__'):
-                        # Consume other system level events
-                        pass
-                    else:
-                        self.logger.prn_err("orphan event in preamble phase: {{%s;%s}}, timestamp=%f"% (key, str(value), timestamp))
-                else:
-                    # If coverage detected switch to idle loop
-                    if key == '__coverage_start':
-                        self.logger.prn_inf("starting coverage idle timeout loop...")
-                        elapsed_time, (key, value, timestamp) = process_code_coverage(key, value, timestamp)
-
-                        # Ignore the time taken by the code coverage
-                        timeout_duration += elapsed_time
-                        self.logger.prn_inf("exiting coverage idle timeout loop (elapsed_time: %.2f" % elapsed_time)
-
-                    if key == '__notify_complete':
-                        # This event is sent by Host Test, test result is in value
-                        # or if value is None, value will be retrieved from HostTest.result() method
-                        self.logger.prn_inf("%s(%s)"% (key, str(value)))
-                        result = value
-                    elif key == '__reset_dut':
-                        # Disconnect to avoid connection lost event
-                        dut_event_queue.put(('__host_test_finished', True, time()))
-                        p.join()
-
-                        if value == DefaultTestSelector.RESET_TYPE_SW_RST:
-                            self.logger.prn_inf("Performing software reset.")
-                            # Just disconnecting and re-connecting comm process will soft reset DUT
-                        elif value == DefaultTestSelector.RESET_TYPE_HW_RST:
-                            self.logger.prn_inf("Performing hard reset.")
-                            # request hardware reset
-                            self.mbed.hw_reset()
-                        else:
-                            self.logger.prn_err("Invalid reset type (%s). Supported types [%s]." %
-                                                (value, ", ".join([DefaultTestSelector.RESET_TYPE_HW_RST,
-                                                                   DefaultTestSelector.RESET_TYPE_SW_RST])))
-                            self.logger.prn_inf("Software reset will be performed.")
-
-                        # connect to the device
-                        p = start_conn_process()
-                    elif key == '__notify_conn_lost':
-                        # This event is sent by conn_process, DUT connection was lost
-                        self.logger.prn_err(value)
-                        self.logger.prn_wrn("stopped to consume events due to %s event"% key)
-                        callbacks_consume = False
-                        result = self.RESULT_IO_SERIAL
-                        event_queue.put(('__exit_event_queue', 0, time()))
-                    elif key == '__exit':
-                        # This event is sent by DUT, test suite exited
-                        self.logger.prn_inf("%s(%s)"% (key, str(value)))
-                        callbacks__exit = True
-                        event_queue.put(('__exit_event_queue', 0, time()))
-                    elif key == '__exit_event_queue':
-                        # This event is sent by the host test indicating no more events expected
-                        self.logger.prn_inf("%s received"% (key))
-                        callbacks__exit_event_queue = True
-                        break
-                    elif key in callbacks:
-                        # Handle callback
-                        callbacks[key](key, value, timestamp)
-                    else:
-                        self.logger.prn_err("orphan event in main phase: {{%s;%s}}, timestamp=%f"% (key, str(value), timestamp))
+                host_metrics.count(nbytes=len(value) if type(value) is str else 0, timestamp=timestamp)
+                if host_metrics.period > 0:
+                    host_metrics.sample_depth(event_reader.qsize())
+                state.handlers.get(key, state.orphan)(key, value, timestamp)
+                if state.callbacks__exit_event_queue:
+                    break
+                if state.callback_executor and state.callback_executor.failed:
+                    break
         except Exception:
             self.logger.prn_err("something went wrong in event main loop!")
             self.logger.prn_inf("==== Traceback start ====")
             for line in traceback.format_exc().splitlines():
                 print line
             self.logger.prn_inf("==== Traceback end ====")
-            result = self.RESULT_ERROR
+            state.result = self.RESULT_ERROR
+
+        loop_end_time = time()
+        self.timing['test'] = loop_end_time - (state.sync_time or loop_start_time)
+
+        if state.callback_executor:
+            # Let worker threads finish callbacks for events already received
+            state.callback_executor.shutdown()
+            if state.callback_executor.failed:
+                self.logger.prn_err("host test callback failed on worker thread")
+                state.result = self.RESULT_ERROR
 
-        time_duration = time() - start_time
+        time_duration = time() - state.start_time
         self.logger.prn_inf("test suite run finished after %.2f sec..."% time_duration)
 
         # Force conn_proxy process to return
         dut_event_queue.put(('__host_test_finished', True, time()))
-        p.join()
-        self.logger.prn_inf("CONN exited with code: %s"% str(p.exitcode))
-
-        # Callbacks...
-        self.logger.prn_inf("No events in queue" if event_queue.empty() else "Some events in queue")
 
         # If host test was used we will:
-        # 1. Consume all existing events in queue if consume=True
+        # 1. Consume all remaining events if consume=True, otherwise only system events are handled
         # 2. Check result from host test and call teardown()
 
-        # NOTE: with the introduction of the '__exit_event_queue' event, there
-        # should never be left events assuming the DUT has stopped sending data
-        # over the serial data. Leaving this for now to catch anything that slips through.
-
-        if callbacks_consume:
-            # We are consuming all remaining events if requested
-            while not event_queue.empty():
-                try:
-                    (key, value, timestamp) = event_queue.get(timeout=1)
-                except QueueEmpty:
-                    break
-
-                if key == '__notify_complete':
-                    # This event is sent by Host Test, test result is in value
-                    # or if value is None, value will be retrieved from HostTest.result() method
-                    self.logger.prn_inf("%s(%s)"% (key, str(value)))
-                    result = value
-                elif key.startswith('__'):
-                    # Consume other system level events
-                    pass
-                elif key in callbacks:
-                    callbacks[key](key, value, timestamp)
-                else:
-                    self.logger.prn_wrn(">>> orphan event: {{%s;%s}}, timestamp=%f"% (key, str(value), timestamp))
-            self.logger.prn_inf("stopped consuming events")
-
-        if result is not None:  # We must compare here against None!
+        drain_handlers = {
+            '__metrics' : handle__metrics,
+            '__coverage_stored' : handle__coverage_stored,
+        }
+        if state.callbacks_consume:
+            drain_handlers.update((k, v) for k, v in callbacks.iteritems() if not k.startswith('__'))
+            drain_handlers['__notify_complete'] = handle__notify_complete
+        drain_handlers['__conn_process_end'] = handle__conn_process_end
+        drain_orphan = orphan_consume if state.callbacks_consume else lambda key, value, timestamp: None
+        wait_conn_process_end(drain_handlers, drain_orphan)
+        self.logger.prn_inf("stopped consuming events")
+
+        # Process whose session ended on its own (lost connection) treats __host_test_finished
+        # sent above as end of process and exits, so it can't be reused
+        conn_reusable = (not state.conn_lost and state.conn_processes == 0 and
+            state.result not in (self.RESULT_IO_SERIAL, self.RESULT_IOERR_COPY, self.RESULT_IOERR_DISK))
+        if self.options.batch and conn_reusable and state.conn_process.is_alive():
+            # Connection process waits for configuration of next test in batch
+            self.conn_kept = (state.conn_process, event_queue, dut_event_queue)
+        else:
+            if self.options.batch:
+                # Process kept alive may wait for configuration, this makes it exit
+                dut_event_queue.put(('__host_test_finished', True, time()))
+            state.conn_process.join()
+            self.logger.prn_inf("CONN exited with code: %s"% str(state.conn_process.exitcode))
+
+        # Age of events tells if host test callbacks keep up with DUT
+        if state.conn_metrics:
+            self.logger.prn_inf("metrics summary: conn(%s)"% format_metrics(dict((k, v) for k, v in state.conn_metrics.iteritems() if k != 'final')))
+            if state.conn_metrics.get('dropped_rxd_lines'):
+                self.logger.prn_wrn("event queue overflow: %d __rxd_line events dropped (policy '%s')"% (state.conn_metrics['dropped_rxd_lines'],
+                    state.conn_metrics['overflow_policy']))
+        self.logger.prn_inf("metrics summary: host(%s)"% format_metrics(host_metrics.summary()))
+
+        if state.result is not None:  # We must compare here against None!
             # Here for example we've received some error code like IOERR_COPY
-            self.logger.prn_inf("host test result() call skipped, received: %s"% str(result))
+            self.logger.prn_inf("host test result() call skipped, received: %s"% str(state.result))
         else:
             if self.test_supervisor:
-                result = self.test_supervisor.result()
-            self.logger.prn_inf("host test result(): %s"% str(result))
+                state.result = self.test_supervisor.result()
+            self.logger.prn_inf("host test result(): %s"% str(state.result))
 
-        if not callbacks__exit:
+        if not state.callbacks__exit:
             self.logger.prn_wrn("missing __exit event from DUT")
 
-        if not callbacks__exit_event_queue:
+        if not state.callbacks__exit_event_queue:
             self.logger.prn_wrn("missing __exit_event_queue event from host test")
 
         #if not callbacks__exit_event_queue and not result:
-        if not callbacks__exit_event_queue and result is None:
+        if not state.callbacks__exit_event_queue and state.result is None:
             self.logger.prn_err("missing __exit_event_queue event from " + \
                 "host test and no result from host test, timeout...")
-            result = self.RESULT_TIMEOUT
+            state.result = self.RESULT_TIMEOUT
 
         self.logger.prn_inf("calling blocking teardown()")
         if self.test_supervisor:
             self.test_supervisor.teardown()
         self.logger.prn_inf("teardown() finished")
 
-        return result
+        self.timing['teardown'] = time() - loop_end_time
+        return state.result
 
     def execute(self):
+        """! Run test (or all tests from --batch manifest)
+        @return Test result as integer, see get_test_result_int()
+        """
+        if self.options.batch:
+            return self.execute_batch()
+        return self.execute_test()
+
+    def execute_test(self):
         """! Test runner for host test.
 
         @details This function will start executing test and forward test result via serial port
@@ -452,37 +707,197 @@ class DefaultTestSelector(DefaultTestSelectorBase):
                  At the end of the procedure proper host test (defined in set properties) will be executed
                  and test execution timeout will be measured.
         """
-        result = self.RESULT_UNDEF
+        try:
+            self.start_test()
+            if self.flash_image():
+                # Execute test if flashing was successful or skipped
+                self.wait_ready()
+                self.supervise_test()
+            return self.report_test()
+
+        except KeyboardInterrupt:
+            self.finish_prespawned_conn_process()
+            return(-3)    # Keyboard interrupt
+
+    # Stages of execute_test(), DevicePoolRunner runs each of them in its own pool of workers
+    def start_test(self):
+        """! Reset test state before flash_image() """
+        self.test_start_time = time()
+        self.timing = {}
+        self.test_result = None
 
         # hello sting with htrun version, for debug purposes
         self.logger.prn_inf(self.get_hello_string())
 
-        try:
-            # Copy image to device
-            if self.options.skip_flashing:
-                self.logger.prn_inf("copy image onto target... SKIPPED!")
-            else:
-                self.logger.prn_inf("copy image onto target...")
-                result = self.mbed.copy_image()
-                if not result:
-                    result = self.RESULT_IOERR_COPY
-                    return self.get_test_result_int(result)
-
-            # Execute test if flashing was successful or skipped
-            test_result = self.run_test()
-
-            if test_result == True:
-                result = self.RESULT_SUCCESS
-            elif test_result == False:
-                result = self.RESULT_FAILURE
-            elif test_result is None:
-                result = self.RESULT_ERROR
-            else:
-                result = test_result
+    def flash_image(self):
+        """! Copy image to DUT (flash stage)
+        @return True if image was copied or flashing is skipped, otherwise test result is RESULT_IOERR_COPY
+        """
+        if self.options.skip_flashing:
+            self.logger.prn_inf("copy image onto target... SKIPPED!")
+            return True
+
+        # Connection process starts up while image is copied and DUT boots
+        self.prespawn_conn_process()
+        self.logger.prn_inf("copy image onto target...")
+        result = self.mbed.copy_image(program_cycle=False)
+        self.timing.update(self.mbed.timing)
+        if not result:
+            self.finish_prespawned_conn_process()
+            self.test_result = self.RESULT_IOERR_COPY
+            return False
+        return True
+
+    def wait_ready(self):
+        """! Wait until flashed DUT programs itself and boots (wait-ready stage) """
+        if not self.options.skip_flashing:
+            self.mbed.wait_program_cycle()
+            self.timing['program_cycle'] = self.mbed.timing['program_cycle']
+
+    def supervise_test(self):
+        """! Connect to DUT and run host test (supervise stage), sets self.test_result """
+        test_result = self.run_test()
+        if test_result == True:
+            result = self.RESULT_SUCCESS
+        elif test_result == False:
+            result = self.RESULT_FAILURE
+        elif test_result is None:
+            result = self.RESULT_ERROR
+        else:
+            result = test_result
+        self.test_result = result
 
+    def report_test(self):
+        """! Print timing and result of test started with start_test()
+        @return Test result as integer, see get_test_result_int()
+        """
+        self.timing['total'] = time() - self.test_start_time
+        self.report_timing()
+        if self.test_result != self.RESULT_IOERR_COPY:
             # This will be captured by Greentea
-            self.logger.prn_inf("{{result;%s}}"% result)
-            return self.get_test_result_int(result)
+            self.logger.prn_inf("{{result;%s}}"% self.test_result)
+        return self.get_test_result_int(self.test_result)
+
+    def load_batch_manifest(self, path):
+        """! Load list of tests from --batch manifest
+        @param path Path to JSON manifest
+        @return List of dictionaries with test 'name' and BATCH_OPTIONS which override command line options
+        @details Manifest is JSON list of tests or object with such list under 'tests' key, e.g.:
+                 [{"name" : "tests-basic", "image_path" : "BUILD/tests-basic.bin", "enum_host_tests" : "TESTS/host_tests"}]
+                 Raises IOError or ValueError if manifest can't be used.
+        """
+        with open(path) as f:
+            manifest = json.load(f)
+        if isinstance(manifest, dict):
+            manifest = manifest.get('tests')
+        if not isinstance(manifest, list):
+            raise ValueError("manifest should contain list of tests")
+        for i, test in enumerate(manifest):
+            if not isinstance(test, dict) or not test.get('image_path'):
+                raise ValueError("test #%d has no 'image_path'"% i)
+            unknown = [k for k in test if k != 'name' and k not in self.BATCH_OPTIONS]
+            if unknown:
+                raise ValueError("test #%d has unknown keys: %s"% (i, ", ".join(sorted(unknown))))
+            test.setdefault('name', os.path.splitext(os.path.basename(test['image_path']))[0])
+        return manifest
+
+    def apply_batch_test(self, options, test):
+        """! Configure selector for next test in batch
+        @param options Command line options
+        @param test Test from batch manifest, see load_batch_manifest()
+        @details Mbed object is reused, so serial port and mount point found by previous tests
+                 (e.g. after hardware reset) are kept. Only test specific settings are changed.
+        """
+        self.options = copy(options)
+        for key in self.BATCH_OPTIONS:
+            if key in test:
+                setattr(self.options, key, test[key])
+        self.mbed.options = self.options
+        self.mbed.image_path = self.options.image_path.strip('"')
+        self.mbed.copy_method = self.options.copy_method
+        self.mbed.program_cycle_s = float(self.options.program_cycle_s if self.options.program_cycle_s is not None else 2.0)
+        if test.get('enum_host_tests'):
+            enum_host_tests(test['enum_host_tests'], verbose=self.options.verbose)
+
+    def execute_batch(self):
+        """! Run all tests from --batch manifest one after another on the same DUT
+        @details Host test registry, plugins, DUT serial port and mount point and connection process
+                 are reused between tests. Result of each test is printed as soon as test finishes:
+                 {{batch_result;name=tests-basic,result=success,duration=3.201}}
+        @return 0 if all tests passed, otherwise integer result of first test which did not pass
+        """
+        options = self.options
+        try:
+            tests = self.load_batch_manifest(options.batch)
+        except (IOError, ValueError) as e:
+            self.logger.prn_err("can't load batch manifest '%s': %s"% (options.batch, str(e)))
+            return self.get_test_result_int(self.RESULT_ERROR)
 
-        except KeyboardInterrupt:
-            return(-3)    # Keyboard interrupt
+        batch_result = 0
+        results = []
+        try:
+            for i, test in enumerate(tests):
+                self.logger.prn_inf("batch test %d/%d: %s"% (i + 1, len(tests), test['name']))
+                self.apply_batch_test(options, test)
+                start_time = time()
+                result = self.execute_test()
+                if result == -3:
+                    return result   # Keyboard interrupt
+                test_result = self.test_result or self.RESULT_UNDEF
+                results.append((test['name'], test_result))
+                self.logger.prn_inf("{{batch_result;name=%s,result=%s,duration=%.3f}}"% (test['name'], test_result, time() - start_time))
+                if result != 0 and batch_result == 0:
+                    batch_result = result
+        finally:
+            self.options = options
+            self.mbed.options = options
+            self.finish_prespawned_conn_process()
+
+        passed = len([r for _, r in results if r == self.RESULT_SUCCESS])
+        self.logger.prn_inf("batch finished: %d/%d tests passed"% (passed, len(results)))
+        for name, test_result in results:
+            if test_result != self.RESULT_SUCCESS:
+                self.logger.prn_inf("%s: %s"% (name, test_result))
+        return batch_result
+
+    def report_timing(self):
+        """! Print time spent in each test phase as {{timing;phase=sec,...}} and write it
+             to JSON file if --timing-json option was used
+        """
+        timing = OrderedDict((phase, self.timing[phase]) for phase in self.TIMING_PHASES if phase in self.timing)
+        self.logger.prn_inf("{{timing;%s}}"% ",".join("%s=%s"% (phase, ("%.3f"% value if type(value) is float else value))
+                                                      for phase, value in timing.iteritems()))
+        if self.options.timing_json:
+            try:
+                with open(self.options.timing_json, 'w') as f:
+                    json.dump(timing, f, indent=4)
+            except IOError as e:
+                self.logger.prn_err("failed to write timing to '%s': %s"% (self.options.timing_json, str(e)))
+
+    def prespawn_conn_process(self):
+        """! Start connection process before it can connect to DUT
+        @details Process start-up (and on some platforms module imports) overlaps with
+                 flashing. Process waits for '__conn_config' event sent by run_test().
+        """
+        if self.conn_kept or self.conn_prespawned:
+            # Process of previous test in batch (or one started by MultiDutRunner) is waiting already
+            return
+        event_queue = create_event_queue(self.options.event_transport)  # Events from DUT to host
+        dut_event_queue = Queue()   # Events from host to DUT {k;v}
+        args = (event_queue, dut_event_queue, None)
+        p = Process(target=CONN_ENGINES[self.options.conn_engine], args=args)
+        p.daemon = True
+        p.start()
+        self.conn_prespawned = (p, event_queue, dut_event_queue)
+
+    def finish_prespawned_conn_process(self):
+        """! Stop pre-spawned connection process which was not used by run_test() or one kept
+             alive between tests in batch
+        """
+        for conn in (self.conn_prespawned, self.conn_kept):
+            if conn:
+                (p, _, dut_event_queue) = conn
+                dut_event_queue.put(('__host_test_finished', True, time()))
+                p.join()
+        self.conn_prespawned = None
+        self.conn_kept = None
@@ -0,0 +1,208 @@
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+import json
+import errno
+import socket
+import struct
+import threading
+import traceback
+from mbed_host_tests.host_tests_logger import HtrunLogger
+
+
+class JobServer(object):
+    """! Runs mbedhtrun jobs sent over Unix socket (see mbedhtrun --serve)
+    @details Server process imports all modules, registers plugins and host tests once.
+             Each job is run in process forked from server, so it starts warm but can't
+             change server state. Protocol (see also mbedhtrun_client):
+             * client sends one JSON line: {"argv" : [mbedhtrun arguments], "cwd" : "working directory"},
+             * server streams job's stdout and stderr back as OUTPUT records,
+             * job ends with RESULT record holding job exit code as decimal string.
+             Each record is RECORD header (record type, payload length) followed by payload,
+             so job output may contain any bytes. POSIX systems only.
+    """
+    RECORD = struct.Struct('>cI')
+    OUTPUT = 'O'
+    RESULT = 'R'
+    MAX_JOB_SIZE = 1024 * 1024
+    REAP_PERIOD = 1.0   # How often finished jobs are reaped when there are no new jobs
+    OUTPUT_WAIT = 1.0   # How long job output is relayed after job returned (processes it started may still write)
+
+    def __init__(self, path, run_job, logger=None):
+        """! ctor
+        @param path Path of Unix socket
+        @param run_job Function called with argv list in job process, returns job exit code
+        @param logger Logger instance
+        """
+        self.path = path
+        self.run_job = run_job
+        self.logger = logger if logger else HtrunLogger('SERV')
+        self.sock = None
+        self.jobs = set()   # PIDs of running jobs
+        self.running = False
+
+    def serve_forever(self):
+        """! Accept jobs until interrupted (e.g. Ctrl+C) or stopped with shutdown() """
+        if not self.sock:
+            self.listen()
+        self.logger.prn_inf("waiting for jobs on '%s'..."% self.path)
+        try:
+            while self.running:
+                try:
+                    conn, _ = self.sock.accept()
+                except socket.timeout:
+                    self.reap_jobs()
+                    continue
+                except socket.error as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                self.start_job(conn)
+                self.reap_jobs()
+        finally:
+            self.close()
+
+    def listen(self):
+        """! Create Unix socket, stale socket file left by previous server is removed """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(16)
+        self.sock.settimeout(self.REAP_PERIOD)
+        self.running = True
+
+    def shutdown(self):
+        """! Stop accepting jobs, running jobs are not interrupted """
+        self.running = False
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def start_job(self, conn):
+        """! Fork job process for accepted connection """
+        # Nothing buffered in server may be written again by job process
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid:
+            conn.close()
+            self.jobs.add(pid)
+            return
+
+        code = 1
+        try:
+            self.sock.close()
+            conn.settimeout(None)
+            code = self.__run(conn)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(code if type(code) is int else 1)
+
+    def reap_jobs(self):
+        """! Collect exit status of finished jobs """
+        for pid in list(self.jobs):
+            try:
+                finished, _ = os.waitpid(pid, os.WNOHANG)
+            except OSError:
+                finished = pid
+            if finished:
+                self.jobs.discard(pid)
+
+    def __read_job(self, conn):
+        data = ''
+        while '\n' not in data:
+            chunk = conn.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+            if len(data) > self.MAX_JOB_SIZE:
+                raise ValueError("job is longer than %d bytes"% self.MAX_JOB_SIZE)
+        return json.loads(data.split('\n', 1)[0])
+
+    def __send(self, conn, lock, record_type, payload):
+        with lock:
+            conn.sendall(self.RECORD.pack(record_type, len(payload)) + payload)
+
+    def __relay(self, fd, conn, lock):
+        """! Send data from job output pipe to client as OUTPUT records """
+        connected = True
+        while True:
+            try:
+                data = os.read(fd, 4096)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                break
+            if not data:
+                break
+            if connected:
+                try:
+                    self.__send(conn, lock, self.OUTPUT, data)
+                except socket.error:
+                    connected = False   # Client is gone, output is discarded so job does not block
+        os.close(fd)
+
+    def __run(self, conn):
+        """! Run job in job process, stdout and stderr are redirected to client """
+        lock = threading.Lock()
+        try:
+            job = self.__read_job(conn)
+        except ValueError as e:
+            self.__send(conn, lock, self.OUTPUT, "invalid job: %s\n"% str(e))
+            self.__send(conn, lock, self.RESULT, '1')
+            return 1
+        if not job:
+            return 1
+
+        # Job output (including output of processes it starts) goes to client through pipe
+        read_fd, write_fd = os.pipe()
+        relay = threading.Thread(target=self.__relay, args=(read_fd, conn, lock))
+        relay.daemon = True
+        relay.start()
+        os.dup2(write_fd, sys.stdout.fileno())
+        os.dup2(write_fd, sys.stderr.fileno())
+        os.close(write_fd)
+        code = -2
+        try:
+            os.chdir(job.get('cwd') or '.')
+            code = self.run_job([str(arg) for arg in job.get('argv', [])])
+        except SystemExit as e:
+            # e.g. --list or invalid command line
+            code = e.code if type(e.code) is int else (0 if e.code is None else 1)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+        # Relay ends when all writers closed pipe, unless processes started by job still hold it
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.dup2(devnull, sys.stderr.fileno())
+        os.close(devnull)
+        relay.join(self.OUTPUT_WAIT)
+        self.__send(conn, lock, self.RESULT, str(code if code is not None else 0))
+        conn.close()
+        return 0
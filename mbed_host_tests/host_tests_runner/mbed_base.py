@@ -18,9 +18,10 @@ Author: Przemyslaw Wirkus <Przemyslaw.Wirkus@arm.com>
 """
 
 import json
-from time import sleep
+from time import sleep, time
 from mbed_host_tests import DEFAULT_BAUD_RATE
 import mbed_host_tests.host_tests_plugins as ht_plugins
+from mbed_host_tests.host_tests_plugins.host_test_plugins import HostTestPluginBase
 
 
 class Mbed:
@@ -64,6 +65,9 @@ class Mbed:
         # Overriding baud rate value with command line specified value
         self.serial_baud = self.options.baud_rate if self.options.baud_rate else self.serial_baud
 
+        # Time (sec) spent in phases of last copy_image() call: copy, mount_wait, program_cycle
+        self.timing = {}
+
         # Test configuration in JSON format
         self.test_cfg = None
         if self.options.json_test_configuration is not None:
@@ -79,8 +83,9 @@ class Mbed:
                 print "MBED: Test configuration JSON Unexpected error:", str(e)
                 raise
 
-    def copy_image(self, image_path=None, disk=None, copy_method=None, port=None):
+    def copy_image(self, image_path=None, disk=None, copy_method=None, port=None, program_cycle=True):
         """! Closure for copy_image_raw() method.
+        @param program_cycle When False caller waits for DUT with wait_program_cycle() later
         @return Returns result from copy plugin
         """
         # Set-up closure environment
@@ -94,10 +99,23 @@ class Mbed:
             port = self.port
 
         # Call proper copy method
+        start_time = time()
+        mount_point_wait_time = HostTestPluginBase.mount_point_wait_time()
         result = self.copy_image_raw(image_path, disk, copy_method, port)
-        sleep(self.program_cycle_s)
+        mount_point_wait_time = HostTestPluginBase.mount_point_wait_time() - mount_point_wait_time
+        self.timing['mount_wait'] = mount_point_wait_time
+        self.timing['copy'] = time() - start_time - mount_point_wait_time
+
+        if program_cycle:
+            self.wait_program_cycle()
         return result
 
+    def wait_program_cycle(self):
+        """! Wait until DUT programs itself with copied image and boots """
+        start_time = time()
+        sleep(self.program_cycle_s)
+        self.timing['program_cycle'] = time() - start_time
+
     def copy_image_raw(self, image_path=None, disk=None, copy_method=None, port=None):
         """! Copy file depending on method you want to use. Handles exception
              and return code from shell copy commands.
@@ -0,0 +1,162 @@
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import json
+import threading
+import traceback
+from copy import copy
+from time import time
+from mbed_host_tests.host_tests_logger import HtrunLogger
+from mbed_host_tests.host_tests_runner.host_test import HostTestResults
+from mbed_host_tests.host_tests_runner.host_test_default import DefaultTestSelector
+
+
+class MultiDutRunner(HostTestResults):
+    """! Runs tests on many DUTs in parallel from one process
+    @details Each DUT is driven by its own DefaultTestSelector in its own thread and has its own
+             connection process, while host test registry, plugins and mbed-ls scans are shared.
+             Connection processes are started from main thread before DUT threads start, so
+             no process is forked while other threads may hold locks (e.g. logging).
+    """
+    # Keys of --devices manifest entries which override command line options for one DUT
+    DEVICE_OPTIONS = ['port', 'disk', 'target_id', 'micro', 'image_path', 'batch', 'copy_method',
+                      'program_cycle_s', 'forced_reset_type', 'timing_json']
+
+    def __init__(self, options, selector_class=DefaultTestSelector):
+        """! ctor
+        @param options Command line options, options.devices is path to device manifest
+        @param selector_class Class which runs test(s) on one DUT
+        """
+        HostTestResults.__init__(self)
+        self.options = options
+        self.selector_class = selector_class
+        self.logger = HtrunLogger('MULT')
+        self.results = {}   # DUT name -> {'result' : RESULT_*, 'code' : int, 'duration' : sec}
+        self.results_lock = threading.Lock()
+
+    def load_devices(self, path):
+        """! Load list of DUTs from --devices manifest
+        @param path Path to JSON manifest
+        @return List of dictionaries with DUT 'name' and DEVICE_OPTIONS which override command line options
+        @details Manifest is JSON list of DUTs or object with such list under 'devices' key, e.g.:
+                 [{"name" : "K64F-0", "port" : "/dev/ttyACM0", "disk" : "/mnt/DAPLINK", "target_id" : "0240..."}]
+                 Raises IOError or ValueError if manifest can't be used.
+        """
+        with open(path) as f:
+            devices = json.load(f)
+        if isinstance(devices, dict):
+            devices = devices.get('devices')
+        if not isinstance(devices, list) or not devices:
+            raise ValueError("manifest should contain list of devices")
+        names = set()
+        for i, device in enumerate(devices):
+            if not isinstance(device, dict) or not device.get('port'):
+                raise ValueError("device #%d has no 'port'"% i)
+            unknown = [k for k in device if k != 'name' and k not in self.DEVICE_OPTIONS]
+            if unknown:
+                raise ValueError("device #%d has unknown keys: %s"% (i, ", ".join(sorted(unknown))))
+            device.setdefault('name', device.get('target_id') or 'dut%d'% i)
+            if device['name'] in names:
+                raise ValueError("device name '%s' is not unique"% device['name'])
+            names.add(device['name'])
+        return devices
+
+    def device_options(self, device):
+        """! Command line options for one DUT
+        @param device DUT from device manifest, see load_devices()
+        @return Copy of command line options with DUT specific values
+        """
+        options = copy(self.options)
+        for key in self.DEVICE_OPTIONS:
+            if key in device:
+                setattr(options, key, device[key])
+        if options.timing_json and 'timing_json' not in device:
+            # Each DUT writes its own timing report
+            root, ext = os.path.splitext(options.timing_json)
+            options.timing_json = "%s-%s%s"% (root, device['name'], ext)
+        return options
+
+    def run(self):
+        """! Run tests on all DUTs from device manifest and wait until all of them finish
+        @return 0 if tests passed on all DUTs, otherwise integer result of first failed DUT (in manifest order)
+        """
+        try:
+            devices = self.load_devices(self.options.devices)
+        except (IOError, ValueError) as e:
+            self.logger.prn_err("can't load device manifest '%s': %s"% (self.options.devices, str(e)))
+            return self.get_test_result_int(self.RESULT_ERROR)
+
+        selectors = []
+        for device in devices:
+            selector = self.selector_class(self.device_options(device))
+            selector.logger = HtrunLogger('HT-%s'% device['name'])
+            # Start connection process while this is the only thread
+            selector.prespawn_conn_process()
+            selectors.append((device['name'], selector))
+
+        self.logger.prn_inf("running tests on %d DUTs: %s"% (len(selectors), ", ".join(name for name, _ in selectors)))
+        threads = []
+        for name, selector in selectors:
+            thread = threading.Thread(target=self.__run_device, args=(name, selector), name='DUT-%s'% name)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        # Threads are joined with timeout so main thread can still handle signals (e.g. Ctrl+C)
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(1.0)
+
+        self.logger.prn_inf("results of %d DUTs:"% len(selectors))
+        result = 0
+        for name, _ in selectors:
+            dut_result = self.results.get(name, {'result' : self.RESULT_ERROR, 'code' : self.get_test_result_int(self.RESULT_ERROR)})
+            self.logger.prn_inf("%s: %s"% (name, dut_result['result']))
+            if dut_result['code'] != 0 and result == 0:
+                result = dut_result['code']
+        return result
+
+    def __run_device(self, name, selector):
+        """! Run test(s) on one DUT, executed in DUT thread """
+        start_time = time()
+        code = self.get_test_result_int(self.RESULT_ERROR)
+        try:
+            code = selector.execute()
+        except Exception:
+            selector.logger.prn_err("test execution failed, reason:")
+            selector.logger.prn_inf("==== Traceback start ====")
+            for line in traceback.format_exc().splitlines():
+                print line
+            selector.logger.prn_inf("==== Traceback end ====")
+        finally:
+            selector.finish_prespawned_conn_process()
+            selector.finish()
+
+        if selector.options.batch:
+            # Each test in batch reported its result, DUT passed if all of them did
+            result = self.RESULT_SUCCESS if code == 0 else self.RESULT_FAILURE
+        else:
+            result = selector.test_result or self.RESULT_ERROR
+        with self.results_lock:
+            self.results[name] = {
+                'result' : result,
+                'code' : code,
+                'duration' : time() - start_time,
+            }
+        # Result map is printed as DUTs finish, so it can be streamed to caller
+        self.logger.prn_inf("{{dut_result;name=%s,result=%s,duration=%.3f}}"% (name, result, time() - start_time))
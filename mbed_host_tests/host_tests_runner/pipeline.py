@@ -0,0 +1,93 @@
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import threading
+import traceback
+from time import time
+from Queue import Queue
+from mbed_host_tests.host_tests_logger import HtrunLogger
+
+
+class StagePipeline(object):
+    """! Moves items through sequence of stages, each stage has its own pool of worker threads
+    @details Stage function is called with item and returns True when item goes to next stage.
+             When it returns False (or raises exception) item skips to last stage, so last stage
+             (e.g. teardown) is always run. Slow work in one stage (e.g. flashing) occupies only
+             workers of that stage, items in other stages are not blocked by it.
+    """
+
+    def __init__(self, stages, logger=None):
+        """! ctor
+        @param stages List of (name, function, number of workers) tuples
+        @param logger Logger instance
+        """
+        self.stages = stages
+        self.logger = logger if logger else HtrunLogger('PIPE')
+        self.queues = [Queue() for _ in stages]
+        self.lock = threading.Lock()
+        self.stage_time = dict((name, 0.0) for name, _, _ in stages)     # Stage name -> total time spent in stage
+        self.threads = []   # Worker threads of each stage
+        for index, (name, _, workers) in enumerate(stages):
+            self.threads.append([])
+            for i in range(max(1, workers)):
+                thread = threading.Thread(target=self.__worker, args=(index,), name='%s-%d'% (name, i))
+                thread.daemon = True
+                thread.start()
+                self.threads[index].append(thread)
+
+    def submit(self, item, done=None):
+        """! Add item to first stage
+        @param item Item passed to stage functions
+        @param done Function called with item after last stage
+        """
+        self.queues[0].put((item, done))
+
+    def close(self):
+        """! Stop workers once all submitted items went through pipeline """
+        # Stages are stopped in order, so items still moving forward are not lost
+        for index, threads in enumerate(self.threads):
+            for _ in threads:
+                self.queues[index].put(None)
+            for thread in threads:
+                thread.join()
+
+    def __worker(self, index):
+        name, function, _ = self.stages[index]
+        last = len(self.stages) - 1
+        while True:
+            task = self.queues[index].get()
+            if task is None:
+                break
+            item, done = task
+            start_time = time()
+            passed = False
+            try:
+                passed = function(item)
+            except Exception:
+                self.logger.prn_err("stage '%s' failed, reason:"% name)
+                for line in traceback.format_exc().splitlines():
+                    print line
+            with self.lock:
+                self.stage_time[name] += time() - start_time
+
+            if index == last:
+                if done:
+                    done(item)
+            elif passed:
+                self.queues[index + 1].put(task)
+            else:
+                self.queues[last].put(task)
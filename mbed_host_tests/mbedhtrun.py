@@ -17,26 +17,83 @@ limitations under the License.
 Author: Przemyslaw Wirkus <Przemyslaw.Wirkus@arm.com>
 """
 
+import os
+import socket
 from multiprocessing import freeze_support
+from mbed_host_tests import enum_host_tests
 from mbed_host_tests import init_host_test_cli_params
+from mbed_host_tests.host_tests_logger import HtrunLogger
 from mbed_host_tests.host_tests_runner.host_test_default import DefaultTestSelector
+from mbed_host_tests.host_tests_runner.multi_dut import MultiDutRunner
+from mbed_host_tests.host_tests_runner.device_pool import DevicePoolRunner
+from mbed_host_tests.host_tests_runner.job_server import JobServer
 
 
-def main():
-    """! This function drives command line tool 'mbedhtrun' which is using DefaultTestSelector
-    @details 1. Create DefaultTestSelector object and pass command line parameters
-             2. Call default test execution function run() to start test instrumentation
+def run_tests(options):
+    """! Run test(s) described by command line options
+    @param options Command line options
+    @return Test result as integer, 0 on success
     """
-    freeze_support()
-    result = -2
-    test_selector = DefaultTestSelector(init_host_test_cli_params())
+    if options.jobs:
+        return DevicePoolRunner(options).run()
+    if options.devices:
+        return MultiDutRunner(options).run()
+
+    test_selector = DefaultTestSelector(options)
     try:
         result = test_selector.execute()
     except (KeyboardInterrupt, SystemExit):
         test_selector.finish()
-        result = -3
         raise
     else:
         test_selector.finish()
 
     return result
+
+
+def serve(options):
+    """! Accept mbedhtrun jobs on Unix socket options.serve (see JobServer)
+    @param options Command line options of server
+    @return 0 when server was stopped, negative value on error
+    """
+    logger = HtrunLogger('SERV')
+    if not hasattr(socket, 'AF_UNIX') or not hasattr(os, 'fork'):
+        logger.prn_err("--serve is supported on POSIX systems only")
+        return -2
+
+    # Host tests from server's -e directory are loaded once, jobs using the same directory skip loading
+    preloaded_dir = None
+    if options.enum_host_tests:
+        enum_host_tests(options.enum_host_tests, verbose=options.verbose)
+        preloaded_dir = os.path.abspath(options.enum_host_tests)
+
+    def run_job(argv):
+        job_options = init_host_test_cli_params(argv)
+        if job_options.serve:
+            logger.prn_err("--serve can't be used in job")
+            return -2
+        if job_options.enum_host_tests and os.path.abspath(job_options.enum_host_tests) == preloaded_dir:
+            job_options.enum_host_tests = None
+        return run_tests(job_options)
+
+    server = JobServer(options.serve, run_job, logger)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.prn_inf("server stopped")
+    return 0
+
+
+def main():
+    """! This function drives command line tool 'mbedhtrun' which is using DefaultTestSelector
+    @details 1. Create DefaultTestSelector object and pass command line parameters
+             2. Call default test execution function run() to start test instrumentation
+             With --devices option tests run on many DUTs in parallel, see MultiDutRunner.
+             With --jobs option tests are scheduled on pool of DUTs, see DevicePoolRunner.
+             With --serve option tests are run as jobs sent by mbedhtrun-client, see JobServer.
+    """
+    freeze_support()
+    options = init_host_test_cli_params()
+    if options.serve:
+        return serve(options)
+    return run_tests(options)
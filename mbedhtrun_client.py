@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+# Client is kept out of mbed_host_tests package on purpose: importing the package
+# loads all plugins and host tests, which is the cost 'mbedhtrun --serve' avoids.
+
+import os
+import sys
+import json
+import socket
+import struct
+
+# Records sent by server, see JobServer
+RECORD = struct.Struct('>cI')   # Record type and payload length
+OUTPUT = 'O'                    # Payload is job output
+RESULT = 'R'                    # Payload is job exit code, last record of job
+ENV_SOCKET = 'MBEDHTRUN_SOCKET'
+
+
+def split_connect_option(argv):
+    """! Extract --connect SOCK from command line, other arguments are passed to mbedhtrun
+    @param argv Command line arguments
+    @return Tuple (socket path or None, mbedhtrun arguments)
+    """
+    path = None
+    args = []
+    i = 0
+    while i < len(argv):
+        if argv[i] == '--connect' and i + 1 < len(argv):
+            path = argv[i + 1]
+            i += 2
+            continue
+        if argv[i].startswith('--connect='):
+            path = argv[i][len('--connect='):]
+        else:
+            args.append(argv[i])
+        i += 1
+    return path, args
+
+
+def run_job(path, argv, cwd, output):
+    """! Send job to mbedhtrun server and stream job output
+    @param path Path to server's Unix socket
+    @param argv mbedhtrun command line arguments
+    @param cwd Working directory of job
+    @param output File job output is written to
+    @return Job exit code, None if job didn't finish (e.g. server was stopped)
+    @details Raises socket.error if server can't be reached.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    buff = ''   # Received data not forming complete record yet
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        raise
+    try:
+        sock.sendall(json.dumps({'argv' : argv, 'cwd' : cwd}) + '\n')
+        while True:
+            try:
+                data = sock.recv(4096)
+            except socket.error:
+                data = ''
+            if not data:
+                break
+            buff += data
+            while len(buff) >= RECORD.size:
+                record_type, length = RECORD.unpack_from(buff)
+                if len(buff) < RECORD.size + length:
+                    break
+                payload = buff[RECORD.size:RECORD.size + length]
+                buff = buff[RECORD.size + length:]
+                if record_type == RESULT:
+                    return int(payload)
+                output.write(payload)
+                output.flush()
+    finally:
+        sock.close()
+    return None
+
+
+def main():
+    """! This function drives command line tool 'mbedhtrun-client'
+    @details Accepts the same arguments as mbedhtrun and runs test as job on mbedhtrun server
+             given with --connect SOCK (or MBEDHTRUN_SOCKET environment variable).
+             When server can't be reached test is run by mbedhtrun in this process.
+    """
+    path, argv = split_connect_option(sys.argv[1:])
+    path = path or os.environ.get(ENV_SOCKET)
+    if path:
+        try:
+            result = run_job(path, argv, os.getcwd(), sys.stdout)
+        except socket.error as e:
+            sys.stderr.write("mbedhtrun-client: can't connect to '%s' (%s), running mbedhtrun locally\n"% (path, str(e)))
+        else:
+            if result is None:
+                sys.stderr.write("mbedhtrun-client: connection to '%s' lost before job finished\n"% path)
+                return -2
+            return result
+
+    from mbed_host_tests import mbedhtrun
+    sys.argv = [sys.argv[0]] + argv
+    return mbedhtrun.main()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -45,14 +45,17 @@ setup(name='mbed-host-tests',
       maintainer_email=OWNER_EMAILS,
       url='https://github.com/ARMmbed/htrun',
       packages=find_packages(),
+      py_modules=['mbedhtrun_client'],
       license="Apache-2.0",
       test_suite = 'test',
       entry_points={
         "console_scripts":
             ["mbedhtrun=mbed_host_tests.mbedhtrun:main",
-             "mbedflsh=mbed_host_tests.mbedflsh:main"],
+             "mbedflsh=mbed_host_tests.mbedflsh:main",
+             "mbedhtrun-client=mbedhtrun_client:main"],
       },
       install_requires=["PySerial>=3.0",
                         "PrettyTable>=0.7.2",
                         "requests",
-                        "mbed-ls>=1.0.0"])
+                        "mbed-ls>=1.0.0",
+                        "monotonic>=1.0; python_version<'3.3'"])
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+import threading
+from Queue import Queue
+from mbed_host_tests.host_tests_logger import HtrunLogger
+from mbed_host_tests.host_tests_runner.callback_executor import CallbackExecutor
+
+
+class CallbackExecutorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = CallbackExecutor(workers=3, logger=HtrunLogger('TEST'))
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_per_key_order(self):
+        calls = {}
+        def callback(key, value, timestamp):
+            calls.setdefault(key, []).append(value)
+        for i in range(100):
+            for key in ['a', 'b', 'c', 'd']:
+                self.executor.submit(callback, key, i, 0.0)
+        self.executor.join()
+        for key in ['a', 'b', 'c', 'd']:
+            self.assertEqual(range(100), calls[key])
+        self.assertFalse(self.executor.failed)
+
+    def test_callback_does_not_block_caller(self):
+        release = threading.Event()
+        done = []
+        def callback(key, value, timestamp):
+            release.wait(5)
+            done.append(value)
+        wrapped = self.executor.wrap(callback)
+        wrapped('key', 1, 0.0)
+        self.assertEqual([], done)
+        release.set()
+        self.executor.join()
+        self.assertEqual([1], done)
+
+    def test_callback_failure(self):
+        def callback(key, value, timestamp):
+            raise ValueError(value)
+        self.executor.submit(callback, 'key', 'bad value', 0.0)
+        self.executor.join()
+        self.assertTrue(self.executor.failed)
+
+    def test_callback_failure_event(self):
+        event_queue = Queue()
+        executor = CallbackExecutor(workers=1, logger=HtrunLogger('TEST'), event_queue=event_queue)
+        def callback(key, value, timestamp):
+            if value == 'bad value':
+                raise ValueError(value)
+        executor.submit(callback, 'key', 'ok', 0.0)
+        executor.submit(callback, 'key', 'bad value', 0.0)
+        # Event loop blocked on event queue is woken up when callback fails
+        (key, value, _) = event_queue.get(timeout=5)
+        self.assertEqual((CallbackExecutor.FAILED_KEY, 'key'), (key, value))
+        self.assertTrue(executor.failed)
+        executor.shutdown()
+        self.assertTrue(event_queue.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
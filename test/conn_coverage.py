@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from mbed_host_tests.host_tests_logger import HtrunLogger
+from mbed_host_tests.host_tests_conn_proxy.conn_coverage import CoverageSink
+
+
+class CoverageSinkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.sink = CoverageSink(self.output_dir, HtrunLogger('TEST'))
+
+    def tearDown(self):
+        self.sink.close()
+        shutil.rmtree(self.output_dir)
+
+    def read_file(self, path):
+        with open(os.path.join(self.output_dir, path), 'rb') as f:
+            return f.read()
+
+    def filter_chunks(self, chunks):
+        return ''.join(self.sink.filter(chunk) for chunk in chunks)
+
+    def test_passthrough(self):
+        self.assertEqual("line 1\n{{key;value}}\n", self.sink.filter("line 1\n{{key;value}}\n"))
+        self.assertEqual([], self.sink.pop_completed())
+
+    def test_single_dump(self):
+        data = "before\n{{__coverage_start;main.gcda;01 02 ff}}\nafter\n"
+        # Line terminator which ends dump is consumed with dump
+        self.assertEqual("before\nafter\n", self.sink.filter(data))
+        self.assertEqual([('main.gcda', os.path.join(self.output_dir, 'main.gcda'), 3)], self.sink.pop_completed())
+        self.assertEqual('\x01\x02\xff', self.read_file('main.gcda'))
+        self.assertEqual([], self.sink.pop_completed())
+
+    def test_dump_split_between_reads(self):
+        data = "text {{__coverage_start;dir/a.gcda;0a0b 0c 0d0e0f}} more {{k;v}}\n"
+        # Every possible split: marker, path, hex byte and end token can be split between reads
+        for i in range(1, len(data)):
+            self.assertEqual("text  more {{k;v}}\n", self.filter_chunks([data[:i], data[i:]]))
+            self.assertEqual(1, len(self.sink.pop_completed()))
+            self.assertEqual('\x0a\x0b\x0c\x0d\x0e\x0f', self.read_file('dir/a.gcda'))
+        # One character per read
+        self.assertEqual("text  more {{k;v}}\n", self.filter_chunks(list(data)))
+        self.assertEqual('\x0a\x0b\x0c\x0d\x0e\x0f', self.read_file('dir/a.gcda'))
+
+    def test_false_marker(self):
+        self.assertEqual("{{__coverage_x;1}}\n", self.filter_chunks(["{{__cover", "age_x;1}}\n"]))
+        # Possible beginning of marker is held back until more data arrives
+        self.assertEqual("abc ", self.sink.filter("abc {{__cov"))
+        self.assertEqual("{{__cover\n", self.sink.filter("er\n"))
+
+    def test_line_terminator_split_between_reads(self):
+        self.assertEqual("line\n", self.filter_chunks(["{{__coverage_start;a.gcda;01}}\r", "\nline\n"]))
+        self.assertEqual("", self.sink.filter("{{__coverage_start;a.gcda;01}}"))
+        self.assertEqual("line\n", self.filter_chunks(["", "\r\n", "line\n"]))
+        # Only one terminator is consumed
+        self.assertEqual("\n", self.sink.filter("{{__coverage_start;a.gcda;01}}\n\n"))
+
+    def test_path_stays_in_output_dir(self):
+        self.sink.filter("{{__coverage_start;../../etc/x.gcda;00}}")
+        self.sink.filter("{{__coverage_start;/abs/path/y.gcda;00}}")
+        self.sink.filter("{{__coverage_start;C:\\build\\z.gcda;00}}")
+        completed = self.sink.pop_completed()
+        self.assertEqual(3, len(completed))
+        for _, file_path, _ in completed:
+            self.assertTrue(os.path.abspath(file_path).startswith(os.path.abspath(self.output_dir) + os.sep))
+        self.assertEqual('\x00', self.read_file('x.gcda'))
+        self.assertEqual('\x00', self.read_file('abs/path/y.gcda'))
+        self.assertEqual('\x00', self.read_file('build/z.gcda'))
+
+    def test_invalid_payload(self):
+        self.assertEqual("ok\n", self.sink.filter("{{__coverage_start;bad.gcda;zz}}\nok\n"))
+        self.assertEqual([], self.sink.pop_completed())
+        self.assertFalse(self.sink.active())
+
+    def test_close_unfinished_dump(self):
+        self.sink.filter("{{__coverage_start;part.gcda;0102")
+        self.assertTrue(self.sink.active())
+        self.sink.close()
+        self.assertFalse(self.sink.active())
+        self.assertEqual([], self.sink.pop_completed())
+        self.assertEqual('\x01\x02', self.read_file('part.gcda'))
+        self.assertEqual("line\n", self.sink.filter("line\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()
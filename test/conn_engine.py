@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import re
+import select
+import threading
+import unittest
+import multiprocessing
+from Queue import Queue
+from mbed_host_tests.host_tests_logger import HtrunLogger
+from mbed_host_tests.host_tests_conn_proxy import conn_engine
+from mbed_host_tests.host_tests_conn_proxy.conn_engine import ConnEventLoop
+from mbed_host_tests.host_tests_conn_proxy.conn_engine import conn_process_evented
+from mbed_host_tests.host_tests_conn_proxy.conn_proxy import ConnSession
+from mbed_host_tests.host_tests_conn_proxy.conn_primitive import ConnectorPrimitive
+
+
+class PipeConnector(ConnectorPrimitive):
+    """! DUT behind a pipe, answers __sync with list of events and echoes other Key-Value pairs """
+
+    def __init__(self, events, hang_up=False):
+        ConnectorPrimitive.__init__(self, 'PIPE')
+        self.events = events
+        self.hang_up = hang_up  # Connection is lost after first read
+        self.read_fd, self.write_fd = os.pipe()
+        self.written = []
+        self.alive = True
+        self.finished = False
+
+    def write(self, payload, log=False):
+        self.written.append(payload)
+        m = re.match(r'\{\{([^;]+);([^}]+)\}\}', payload)
+        if m and m.group(1) == '__sync':
+            os.write(self.write_fd, payload + "".join("{{%s;%s}}\n"% event for event in self.events))
+        elif m:
+            os.write(self.write_fd, payload)
+        return payload
+
+    def read(self, count=None):
+        data = os.read(self.read_fd, 4096)
+        if self.hang_up:
+            self.alive = False
+        return data
+
+    def fileno(self):
+        return self.read_fd
+
+    def connected(self):
+        return self.alive
+
+    def error(self):
+        return 'connection lost'
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            os.close(self.read_fd)
+            os.close(self.write_fd)
+
+
+class PolledPipeConnector(PipeConnector):
+    """! Connector without file descriptor, event loop polls it """
+
+    def read(self, count=None):
+        readable, _, _ = select.select([self.read_fd], [], [], 0)
+        if not readable:
+            return ''
+        return PipeConnector.read(self, count)
+
+    def fileno(self):
+        return None
+
+
+@unittest.skipUnless(os.name == 'posix', "POSIX only")
+class ConnProcessEventedTestCase(unittest.TestCase):
+
+    CONFIG = {'sync_behavior' : 1}
+
+    def setUp(self):
+        self.event_queue = Queue()
+        # Event loop selects on pipe backing multiprocessing.Queue
+        self.dut_event_queue = multiprocessing.Queue()
+        self.connectors = []
+        self.connector_class = PipeConnector
+        self.hang_up = False
+        self.events = []
+        self.conn_primitive_factory = conn_engine.conn_primitive_factory
+        conn_engine.conn_primitive_factory = self.connector
+
+    def tearDown(self):
+        conn_engine.conn_primitive_factory = self.conn_primitive_factory
+
+    def connector(self, conn_resource, config, event_queue, logger):
+        connector = self.connector_class([('__timeout', '5')], self.hang_up)
+        self.connectors.append(connector)
+        return connector
+
+    def start(self):
+        thread = threading.Thread(target=conn_process_evented, args=(self.event_queue, self.dut_event_queue, self.CONFIG))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def wait_for(self, key):
+        """! Read events sent to host until one with given key arrives """
+        while True:
+            (event_key, value, _) = self.event_queue.get(timeout=5)
+            self.events.append((event_key, value))
+            if event_key == key:
+                return value
+
+    def host_test_finished(self):
+        thread = self.start()
+        self.wait_for('__timeout')
+        self.dut_event_queue.put(('echo', 'abc', 0.0))
+        self.wait_for('echo')
+        self.dut_event_queue.put(('__host_test_finished', True, 0.0))
+        self.wait_for('__conn_process_end')
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(self.event_queue.empty())
+
+        connector = self.connectors[0]
+        self.assertEqual(["mbed" * 10, "{{__sync;%s}}\n"% self.events[1][1], "{{echo;abc}}\n"], connector.written)
+        self.assertTrue(connector.finished)
+        self.assertEqual(['__conn_process_start', '__sync', '__timing', '__timeout', 'echo', '__metrics', '__conn_process_end'],
+                         [key for key, _ in self.events])
+        self.assertEqual([('__timeout', '5'), ('echo', 'abc')], self.events[3:5])
+        self.assertTrue(self.events[5][1]['final'])
+
+    def test_host_test_finished(self):
+        self.host_test_finished()
+
+    def test_host_test_finished_polled(self):
+        # Neither connector nor host event queue has file descriptor
+        self.connector_class = PolledPipeConnector
+        self.dut_event_queue = Queue()
+        self.host_test_finished()
+
+    def test_conn_lost(self):
+        self.hang_up = True
+        thread = self.start()
+        self.wait_for('__conn_process_end')
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(self.event_queue.empty())
+        # Events received before connection was lost still reach host
+        self.assertEqual(['__conn_process_start', '__sync', '__timing', '__timeout', '__notify_conn_lost', '__conn_process_end'],
+                         [key for key, _ in self.events])
+        self.assertEqual(('__notify_conn_lost', 'connection lost'), self.events[4])
+        self.assertTrue(self.connectors[0].finished)
+
+
+@unittest.skipUnless(os.name == 'posix', "POSIX only")
+class ConnEventLoopTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = HtrunLogger('TEST')
+
+    def tearDown(self):
+        pass
+
+    def test_sessions_finish_independently(self):
+        loop = ConnEventLoop()
+        sessions = []
+        for hang_up in (True, False):
+            event_queue = Queue()
+            dut_event_queue = Queue()
+            session = ConnSession(PipeConnector([('__timeout', '5')], hang_up), event_queue, {}, self.logger)
+            loop.add_session(session, dut_event_queue)
+            session.start()
+            sessions.append((session, event_queue, dut_event_queue))
+        # Session which lost connection is removed, other one runs until host finishes it
+        sessions[1][2].put(('__host_test_finished', True, 0.0))
+        thread = threading.Thread(target=loop.run)
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([], loop.sessions)
+
+        keys = []
+        for session, event_queue, _ in sessions:
+            self.assertTrue(session.connector.finished)
+            keys.append([event_queue.get(block=False)[0] for _ in range(event_queue.qsize())])
+        self.assertEqual(['__sync', '__timing', '__timeout', '__notify_conn_lost'], keys[0])
+        self.assertEqual('__metrics', keys[1][-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
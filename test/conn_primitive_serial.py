@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import threading
+import unittest
+from mbed_host_tests.host_tests_conn_proxy.conn_primitive_serial import SerialConnectorPrimitive
+
+
+@unittest.skipUnless(os.name == 'posix', "POSIX only")
+class SerialConnectorPrimitiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Pseudo terminal stands in for DUT's serial port
+        import pty
+        self.master_fd, slave_fd = pty.openpty()
+        self.port = os.ttyname(slave_fd)
+        os.close(slave_fd)
+        self.connector = SerialConnectorPrimitive('SERI', self.port, 115200, {'forced_reset_timeout' : 0})
+
+    def tearDown(self):
+        self.connector.finish()
+        os.close(self.master_fd)
+
+    def test_finish(self):
+        self.assertTrue(self.connector.connected())
+        self.assertNotEqual(None, self.connector.fileno())
+        self.connector.finish()
+        self.assertFalse(self.connector.connected())
+        self.assertEqual(None, self.connector.fileno())
+        self.assertEqual('', self.connector.read())
+
+    def test_reader_during_reconnect(self):
+        seen = []
+        port_closed = threading.Event()
+        reader_done = threading.Event()
+
+        def reader():
+            # Reader thread checks connection while port is closed by reconnect()
+            port_closed.wait()
+            seen.append((self.connector.connected(), self.connector.fileno()))
+            reader_done.set()
+
+        prn_inf = self.connector.logger.prn_inf
+        def logged(text):
+            if text.startswith('reconnecting'):
+                port_closed.set()
+                reader_done.wait(5)
+            prn_inf(text)
+        self.connector.logger.prn_inf = logged
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        self.connector.reconnect()
+        thread.join()
+        # Reconnect in progress is not lost connection and closed port has no file descriptor
+        self.assertEqual([(True, None)], seen)
+        self.assertTrue(self.connector.connected())
+        self.assertNotEqual(None, self.connector.fileno())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,488 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import re
+import select
+import shutil
+import tempfile
+import threading
+import unittest
+from time import sleep
+from Queue import Queue
+from mbed_host_tests.host_tests_logger import HtrunLogger
+from mbed_host_tests.host_tests_conn_proxy import conn_proxy
+from mbed_host_tests.host_tests_conn_proxy.conn_proxy import KiViBufferWalker
+from mbed_host_tests.host_tests_conn_proxy.conn_proxy import ConnSession
+from mbed_host_tests.host_tests_conn_proxy.conn_proxy import wait_for_conn_config
+from mbed_host_tests.host_tests_conn_proxy.conn_proxy import serve_conn_sessions
+from mbed_host_tests.host_tests_conn_proxy.conn_proxy import conn_process
+from mbed_host_tests.host_tests_conn_proxy.conn_primitive import ConnectorPrimitive
+
+
+class KiViBufferWalkerTestCase(unittest.TestCase):
+
+    STREAM = ("mbedmbedmbedmbed\r\n"
+              "{{__sync;0dad4a9d-59a3-4aec-810d-d5fb09d852c1}}\r\n"
+              "{{__version;1.1.0}}\r\n"
+              "{{__timeout;5}}\r\n"
+              "{{__host_test_name;default_auto}}\r\n"
+              "some printf output\r\n"
+              "before{{echo;abc-def}}after\r\n"
+              "{{broken;line\r\n"
+              "\r\n"
+              "{{end;success}}\n"
+              "{{__exit;0}}\n")
+
+    def setUp(self):
+        self.kv_buffer = KiViBufferWalker()
+
+    def tearDown(self):
+        pass
+
+    def reference_parse(self, stream):
+        """! Line splitting and KV matching done on whole stream at once """
+        re_kv = re.compile(self.kv_buffer.KIVI_REGEX)
+        kvs, discarded = [], []
+        for line in stream.split('\n')[:-1]:
+            m = re_kv.search(line)
+            if m:
+                kvs.append(m.groups())
+                line = line.strip()
+                before, _, after = line.partition(m.group(0))
+                discarded.extend([s for s in (before, after) if s])
+            else:
+                discarded.append(line)
+        return kvs, discarded
+
+    def walk(self, chunks):
+        discarded = []
+        for chunk in chunks:
+            discarded.extend(self.kv_buffer.append(chunk))
+        kvs = []
+        while self.kv_buffer.search():
+            key, value, _ = self.kv_buffer.pop_kv()
+            kvs.append((key, value))
+        return kvs, discarded
+
+    def test_single_chunk(self):
+        self.assertEqual(self.reference_parse(self.STREAM), self.walk([self.STREAM]))
+
+    def test_chunked_stream(self):
+        expected = self.reference_parse(self.STREAM)
+        for size in [1, 2, 3, 7, 16, 64]:
+            self.kv_buffer = KiViBufferWalker()
+            chunks = [self.STREAM[i:i + size] for i in range(0, len(self.STREAM), size)]
+            self.assertEqual(expected, self.walk(chunks))
+
+    def test_kv_values(self):
+        kvs, discarded = self.walk([self.STREAM])
+        self.assertIn(('echo', 'abc-def'), kvs)
+        self.assertIn('before', discarded)
+        self.assertIn('after', discarded)
+        self.assertIn('{{broken;line\r', discarded)
+
+    def test_incomplete_line_buffered(self):
+        self.assertEqual([], self.kv_buffer.append("{{key;val"))
+        self.assertFalse(self.kv_buffer.search())
+        self.assertEqual([], self.kv_buffer.append("ue}}"))
+        self.assertEqual([], self.kv_buffer.append("\n"))
+        key, value, _ = self.kv_buffer.pop_kv()
+        self.assertEqual(('key', 'value'), (key, value))
+
+    def test_drain(self):
+        self.kv_buffer.append("{{a;1}}\n{{b;2}}\ntext\n{{c;3}}\n")
+        kvs = self.kv_buffer.drain()
+        self.assertEqual([('a', '1'), ('b', '2'), ('c', '3')], [(k, v) for k, v, _ in kvs])
+        self.assertFalse(self.kv_buffer.search())
+        self.assertEqual([], self.kv_buffer.drain())
+        self.assertEqual((None, None), self.kv_buffer.pop_kv()[:2])
+
+    def test_max_line_len(self):
+        self.kv_buffer = KiViBufferWalker(max_line_len=16)
+        self.assertEqual([], self.kv_buffer.append("0123456789"))
+        self.assertEqual(["0123456789ABCDEFGHIJ"], self.kv_buffer.append("ABCDEFGHIJ"))
+        self.assertEqual(1, self.kv_buffer.overflow_count)
+        self.assertEqual(["tail"], self.kv_buffer.append("tail\n"))
+
+    def test_timestamps_interpolated(self):
+        # 10 bytes received at 100.0, one byte every 0.1 sec
+        discarded = self.kv_buffer.append_timed("text\n{{a;1", 100.0, 0.1)
+        self.assertEqual(['text'], [line for line, _ in discarded])
+        self.assertAlmostEqual(99.1, discarded[0][1])
+        self.assertEqual([], self.kv_buffer.append_timed("}}\n{{b;2}}\n", 200.0, 0.1))
+        kvs = self.kv_buffer.drain()
+        self.assertEqual(('a', '1'), kvs[0][:2])
+        self.assertAlmostEqual(99.6, kvs[0][2])   # Line started in first payload
+        self.assertEqual(('b', '2'), kvs[1][:2])
+        self.assertAlmostEqual(199.3, kvs[1][2])
+
+
+class ConnSessionTestCase(unittest.TestCase):
+
+    class ConnectorMock(ConnectorPrimitive):
+        def __init__(self):
+            ConnectorPrimitive.__init__(self, 'MOCK')
+            self.written = []
+            self.reconnected = []
+
+        def write(self, payload, log=False):
+            self.written.append(payload)
+            return payload
+
+        def reconnect(self, port=None):
+            self.reconnected.append(port)
+
+        def connected(self):
+            return True
+
+        def error(self):
+            return 'connection lost'
+
+    def setUp(self):
+        self.connector = self.ConnectorMock()
+        self.event_queue = Queue()
+        self.session = ConnSession(self.connector, self.event_queue, {'sync_behavior' : 2}, HtrunLogger('TEST'))
+
+    def tearDown(self):
+        pass
+
+    def test_sync_handshake(self):
+        self.session.start()
+        self.assertEqual(1, len(self.session.sync_uuid_list))
+        self.assertEqual("mbed" * 10, self.connector.written[0])
+        sync_uuid = self.session.sync_uuid_list[0]
+        self.assertEqual("{{__sync;%s}}\n"% sync_uuid, self.connector.written[1])
+
+        # KV pairs before sync are ignored
+        self.session.process_data("{{__timeout;5}}\n")
+        self.assertTrue(self.event_queue.empty())
+        self.assertNotEqual(None, self.session.sync_time_left())
+
+        self.session.process_data("{{__sync;%s}}\n{{__timeout;5}}\n"% sync_uuid)
+        self.assertEqual(('__sync', sync_uuid), self.event_queue.get(block=False)[:2])
+        (key, timing, _) = self.event_queue.get(block=False)
+        self.assertEqual('__timing', key)
+        self.assertEqual(0, timing['sync_resends'])
+        self.assertIn('sync', timing)
+        self.assertEqual(('__timeout', '5'), self.event_queue.get(block=False)[:2])
+        self.assertEqual(None, self.session.sync_time_left())
+
+    def test_sync_resend(self):
+        self.session.sync_timeout = 0
+        self.session.start()
+        self.session.resend_sync()
+        self.assertEqual(2, len(self.session.sync_uuid_list))
+        # Only two __sync packets allowed with sync_behavior=2
+        self.assertEqual(None, self.session.sync_time_left())
+        self.session.resend_sync()
+        self.assertEqual(2, len(self.session.sync_uuid_list))
+
+    def test_host_events(self):
+        self.assertTrue(self.session.handle_host_event('echo', 'abc'))
+        self.assertEqual("{{echo;abc}}\n", self.connector.written[-1])
+        self.assertFalse(self.session.handle_host_event('__host_test_finished', True))
+        # Session metrics are sent to host when session finishes
+        (key, value, _) = self.event_queue.get(block=False)
+        self.assertEqual('__metrics', key)
+        self.assertTrue(value['final'])
+        self.assertEqual(0, value['dropped_rxd_lines'])
+
+    def test_reconnect(self):
+        self.session.start()
+        sync_uuid = self.session.sync_uuid_list[0]
+        self.session.process_data("{{__sync;%s}}\n{{__sync;"% sync_uuid)
+        self.assertEqual('__sync', self.event_queue.get(block=False)[0])
+        self.assertEqual('__timing', self.event_queue.get(block=False)[0])
+
+        self.assertTrue(self.session.handle_host_event('__reconnect', '/dev/ttyACM1'))
+        self.assertEqual(['/dev/ttyACM1'], self.connector.reconnected)
+        # Handshake starts again and old data is discarded
+        self.assertEqual(1, len(self.session.sync_uuid_list))
+        self.assertNotEqual(sync_uuid, self.session.sync_uuid_list[0])
+        self.assertEqual("mbed" * 10, self.connector.written[-2])
+        self.session.process_data("{{__sync;%s}}\n"% sync_uuid)
+        self.assertTrue(self.event_queue.empty())
+        self.session.process_data("{{__sync;%s}}\n"% self.session.sync_uuid_list[0])
+        self.assertEqual('__sync', self.event_queue.get(block=False)[0])
+
+    def test_coverage_sink(self):
+        output_dir = tempfile.mkdtemp()
+        try:
+            session = ConnSession(self.connector, self.event_queue, {'coverage_dir' : output_dir}, HtrunLogger('TEST'))
+            session.start()
+            session.process_data("{{__sync;%s}}\n"% session.sync_uuid_list[0])
+            self.assertEqual('__sync', self.event_queue.get(block=False)[0])
+            self.assertEqual('__timing', self.event_queue.get(block=False)[0])
+            # Coverage dump is not parsed as KV pair, host gets only notification
+            session.process_data("{{__coverage_start;a.gcda;0102")
+            session.process_data("03}}\n{{end;success}}\n")
+            (key, value, _) = self.event_queue.get(block=False)
+            self.assertEqual('__coverage_stored', key)
+            self.assertEqual({'path' : 'a.gcda', 'file' : os.path.join(output_dir, 'a.gcda'), 'size' : 3}, value)
+            # Line terminator of dump doesn't produce empty line
+            self.assertEqual(('end', 'success'), self.event_queue.get(block=False)[:2])
+        finally:
+            shutil.rmtree(output_dir)
+
+    def test_flush_pending_events(self):
+        session = ConnSession(self.connector, self.event_queue, {'event_queue_size' : 1, 'overflow_policy' : 'drop'}, HtrunLogger('TEST'))
+        session.start()
+        session.process_data("{{__sync;%s}}\n"% session.sync_uuid_list[0])
+        # Host stopped reading events, queue is full so events stay pending
+        self.assertFalse(session.handle_host_event('__host_test_finished', True))
+        session.process_data("{{end;success}}\n")
+        session.idle()
+        self.assertEqual(['end'], [event[0] for event in session.overflow_guard.pending])
+        # Nothing is left pending when session ends
+        session.flush_events()
+        self.assertEqual(0, len(session.overflow_guard.pending))
+        events = []
+        while not self.event_queue.empty():
+            events.append(self.event_queue.get(block=False)[0])
+        self.assertEqual(['__sync', '__timing', '__metrics', 'end'], events)
+
+    def test_idle_during_host_finished(self):
+        class SlowQueue(Queue):
+            # Widens window between reading and resetting batch in EventBatcher.flush()
+            def put(self, item, block=True, timeout=None):
+                sleep(0.01)
+                Queue.put(self, item, block, timeout)
+        event_queue = SlowQueue()
+        session = ConnSession(self.connector, event_queue, {'event_batch_size' : 100}, HtrunLogger('TEST'))
+        session.start()
+        session.process_data("{{__sync;%s}}\n"% session.sync_uuid_list[0] + "".join("{{k;%d}}\n"% i for i in range(10)))
+
+        # Reader thread flushes batch while writer thread finishes session
+        reader = threading.Thread(target=lambda: [session.idle() for _ in range(20)])
+        reader.start()
+        session.handle_host_event('__host_test_finished', True)
+        reader.join()
+
+        events = []
+        while not event_queue.empty():
+            (key, value, _) = event_queue.get(block=False)
+            events.extend(value if key == '__batch' else [(key, value, 0.0)])
+        keys = [event[0] for event in events]
+        # Each event is sent exactly once, final metrics included
+        self.assertEqual(10, keys.count('k'))
+        self.assertEqual(['%d'% i for i in range(10)], [value for key, value, _ in events if key == 'k'])
+        self.assertEqual(1, keys.count('__metrics'))
+
+    def test_conn_lost(self):
+        self.session.conn_lost()
+        self.assertEqual(('__notify_conn_lost', 'connection lost'), self.event_queue.get(block=False)[:2])
+
+
+class WaitForConnConfigTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dut_event_queue = Queue()
+        self.logger = HtrunLogger('TEST')
+
+    def tearDown(self):
+        pass
+
+    def test_config_received(self):
+        self.dut_event_queue.put(('echo', 'abc', 0.0))
+        self.dut_event_queue.put(('__conn_config', {'port' : '/dev/ttyACM0'}, 0.0))
+        self.assertEqual({'port' : '/dev/ttyACM0'}, wait_for_conn_config(self.dut_event_queue, self.logger))
+
+    def test_host_finished(self):
+        self.dut_event_queue.put(('__host_test_finished', True, 0.0))
+        self.assertEqual(None, wait_for_conn_config(self.dut_event_queue, self.logger))
+
+
+class ServeConnSessionsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.event_queue = Queue()
+        self.dut_event_queue = Queue()
+        self.logger = HtrunLogger('TEST')
+        self.sessions = []
+
+    def tearDown(self):
+        pass
+
+    def run_session(self, event_queue, dut_event_queue, config, logger):
+        self.sessions.append(config['port'])
+
+    def read_events(self):
+        events = []
+        while not self.event_queue.empty():
+            events.append(self.event_queue.get(block=False)[0])
+        return events
+
+    def test_single_session(self):
+        self.assertEqual(0, serve_conn_sessions(self.event_queue, self.dut_event_queue, {'port' : 'A'}, self.logger, self.run_session))
+        self.assertEqual(['A'], self.sessions)
+        self.assertEqual(['__conn_process_end'], self.read_events())
+
+    def test_not_configured(self):
+        self.dut_event_queue.put(('__host_test_finished', True, 0.0))
+        self.assertEqual(0, serve_conn_sessions(self.event_queue, self.dut_event_queue, None, self.logger, self.run_session))
+        self.assertEqual([], self.sessions)
+        self.assertEqual(['__conn_process_end'], self.read_events())
+
+    def test_keep_alive(self):
+        # Host configures next session when previous one ended
+        self.dut_event_queue.put(('__conn_config', {'port' : 'B', 'keep_alive' : True}, 0.0))
+        self.dut_event_queue.put(('__conn_config', {'port' : 'C', 'keep_alive' : True}, 0.0))
+        self.dut_event_queue.put(('__host_test_finished', True, 0.0))
+        serve_conn_sessions(self.event_queue, self.dut_event_queue, {'port' : 'A', 'keep_alive' : True}, self.logger, self.run_session)
+        self.assertEqual(['A', 'B', 'C'], self.sessions)
+        # Each session ends with one marker, process exit does not add another one
+        self.assertEqual(['__conn_process_end'] * 3, self.read_events())
+
+
+class PipeConnector(ConnectorPrimitive):
+    """! DUT behind a pipe, answers __sync with list of events and echoes other Key-Value pairs """
+
+    def __init__(self, events, hang_up=False):
+        ConnectorPrimitive.__init__(self, 'PIPE')
+        self.events = events
+        self.hang_up = hang_up  # Connection is lost after first read
+        self.read_fd, self.write_fd = os.pipe()
+        self.written = []
+        self.alive = True
+        self.finished = False
+
+    def write(self, payload, log=False):
+        self.written.append(payload)
+        m = re.match(r'\{\{([^;]+);([^}]+)\}\}', payload)
+        if m and m.group(1) == '__sync':
+            os.write(self.write_fd, payload + "".join("{{%s;%s}}\n"% event for event in self.events))
+        elif m:
+            os.write(self.write_fd, payload)
+        return payload
+
+    def read(self, count=None):
+        data = os.read(self.read_fd, 4096)
+        if self.hang_up:
+            self.alive = False
+        return data
+
+    def fileno(self):
+        return self.read_fd
+
+    def connected(self):
+        return self.alive
+
+    def error(self):
+        return 'connection lost'
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            os.close(self.read_fd)
+            os.close(self.write_fd)
+
+
+class PolledPipeConnector(PipeConnector):
+    """! Connector without file descriptor, read() waits for data itself """
+
+    def read(self, count=None):
+        readable, _, _ = select.select([self.read_fd], [], [], 0.01)
+        if not readable:
+            return ''
+        return PipeConnector.read(self, count)
+
+    def fileno(self):
+        return None
+
+
+@unittest.skipUnless(os.name == 'posix', "POSIX only")
+class RunThreadedSessionTestCase(unittest.TestCase):
+
+    CONFIG = {'sync_behavior' : 1}
+
+    def setUp(self):
+        self.event_queue = Queue()
+        self.dut_event_queue = Queue()
+        self.connectors = []
+        self.connector_class = PipeConnector
+        self.hang_up = False
+        self.events = []
+        self.conn_primitive_factory = conn_proxy.conn_primitive_factory
+        conn_proxy.conn_primitive_factory = self.connector
+
+    def tearDown(self):
+        conn_proxy.conn_primitive_factory = self.conn_primitive_factory
+
+    def connector(self, conn_resource, config, event_queue, logger):
+        connector = self.connector_class([('__timeout', '5')], self.hang_up)
+        self.connectors.append(connector)
+        return connector
+
+    def start(self):
+        thread = threading.Thread(target=conn_process, args=(self.event_queue, self.dut_event_queue, self.CONFIG))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def wait_for(self, key):
+        """! Read events sent to host until one with given key arrives """
+        while True:
+            (event_key, value, _) = self.event_queue.get(timeout=5)
+            self.events.append((event_key, value))
+            if event_key == key:
+                return value
+
+    def host_test_finished(self):
+        thread = self.start()
+        self.wait_for('__timeout')
+        self.dut_event_queue.put(('echo', 'abc', 0.0))
+        self.wait_for('echo')
+        self.dut_event_queue.put(('__host_test_finished', True, 0.0))
+        self.wait_for('__conn_process_end')
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(self.event_queue.empty())
+
+        connector = self.connectors[0]
+        self.assertEqual(["mbed" * 10, "{{__sync;%s}}\n"% self.events[1][1], "{{echo;abc}}\n"], connector.written)
+        self.assertTrue(connector.finished)
+        self.assertEqual(['__conn_process_start', '__sync', '__timing', '__timeout', 'echo', '__metrics', '__conn_process_end'],
+                         [key for key, _ in self.events])
+        self.assertEqual([('__timeout', '5'), ('echo', 'abc')], self.events[3:5])
+        self.assertTrue(self.events[5][1]['final'])
+
+    def test_host_test_finished(self):
+        self.host_test_finished()
+
+    def test_host_test_finished_polled(self):
+        # Connector without file descriptor is read by reader thread without select()
+        self.connector_class = PolledPipeConnector
+        self.host_test_finished()
+
+    def test_conn_lost(self):
+        self.hang_up = True
+        thread = self.start()
+        self.wait_for('__conn_process_end')
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(self.event_queue.empty())
+        # Events received before connection was lost still reach host
+        self.assertEqual(['__conn_process_start', '__sync', '__timing', '__timeout', '__notify_conn_lost', '__conn_process_end'],
+                         [key for key, _ in self.events])
+        self.assertEqual(('__notify_conn_lost', 'connection lost'), self.events[4])
+        self.assertTrue(self.connectors[0].finished)
+
+
+if __name__ == '__main__':
+    unittest.main()
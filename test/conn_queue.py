@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+from Queue import Queue, Empty, Full
+from multiprocessing import Process
+from time import time
+from mbed_host_tests.host_tests_conn_proxy.conn_queue import EventBatcher
+from mbed_host_tests.host_tests_conn_proxy.conn_queue import EventMetrics
+from mbed_host_tests.host_tests_conn_proxy.conn_queue import EventOverflowGuard
+from mbed_host_tests.host_tests_conn_proxy.conn_queue import EventQueueReader
+from mbed_host_tests.host_tests_conn_proxy.conn_queue import RingBufferQueue
+
+
+class EventBatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.event_queue = Queue()
+        self.event_reader = EventQueueReader(self.event_queue)
+
+    def tearDown(self):
+        pass
+
+    def test_batching_disabled(self):
+        batcher = EventBatcher(self.event_queue, batch_size=1)
+        batcher.put(('a', 1, 0.0))
+        self.assertEqual(('a', 1, 0.0), self.event_queue.get(block=False))
+
+    def test_batch_size_flush(self):
+        batcher = EventBatcher(self.event_queue, batch_size=3, batch_timeout=60)
+        for i in range(7):
+            batcher.put(('key', i, 0.0))
+        self.assertEqual(2, self.event_queue.qsize())
+        batcher.flush()
+        self.assertEqual(3, self.event_queue.qsize())
+        self.assertEqual('__batch', self.event_queue.queue[0][0])
+        values = [self.event_reader.get(block=False)[1] for _ in range(7)]
+        self.assertEqual(range(7), values)
+        self.assertTrue(self.event_reader.empty())
+        self.assertRaises(Empty, self.event_reader.get, False)
+
+    def test_batch_timeout_flush(self):
+        batcher = EventBatcher(self.event_queue, batch_size=100, batch_timeout=60)
+        batcher.put(('key', 'value', 0.0))
+        batcher.poll()
+        self.assertTrue(self.event_queue.empty())
+        batcher.batch_timeout = 0
+        batcher.poll()
+        # Single event is not wrapped in batch envelope
+        self.assertEqual(('key', 'value', 0.0), self.event_queue.get(block=False))
+
+    def test_reader_mixed_events(self):
+        batcher = EventBatcher(self.event_queue, batch_size=2)
+        self.event_queue.put(('__notify_complete', True, 0.0))
+        batcher.put(('a', 1, 0.0))
+        batcher.put(('b', 2, 0.0))
+        keys = [self.event_reader.get(block=False)[0] for _ in range(3)]
+        self.assertEqual(['__notify_complete', 'a', 'b'], keys)
+
+
+class EventMetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = EventMetrics(period=60)
+
+    def tearDown(self):
+        pass
+
+    def test_report_and_summary(self):
+        self.metrics.count(3, 100, timestamp=time() - 5.0)
+        self.metrics.sample_depth(7)
+        self.metrics.sample_depth(None)
+        self.assertFalse(self.metrics.due())
+        report = self.metrics.report()
+        self.assertTrue(report['max_event_age'] >= 5.0)
+        self.assertEqual(7, report['max_queue_depth'])
+        self.assertTrue(report['events_per_sec'] > 0)
+
+        # New period starts after report
+        self.metrics.count(1, 10, timestamp=time())
+        report = self.metrics.report()
+        self.assertTrue(report['max_event_age'] < 5.0)
+        self.assertEqual(0, report['max_queue_depth'])
+
+        summary = self.metrics.summary()
+        self.assertEqual(4, summary['events'])
+        self.assertEqual(110, summary['bytes'])
+        self.assertTrue(summary['max_event_age'] >= 5.0)
+        self.assertEqual(7, summary['max_queue_depth'])
+
+    def test_disabled(self):
+        self.metrics.period = 0
+        self.assertFalse(self.metrics.due())
+
+
+class EventOverflowGuardTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Guard puts events directly to queue, host did not read any yet
+        self.event_queue = Queue()
+
+    def tearDown(self):
+        pass
+
+    def fill(self, guard, events):
+        for event in events:
+            guard.put(event)
+
+    def read_all(self):
+        events = []
+        while not self.event_queue.empty():
+            events.append(self.event_queue.get(block=False))
+        return events
+
+    def test_unbounded(self):
+        guard = EventOverflowGuard(self.event_queue, self.event_queue)
+        self.fill(guard, [('__rxd_line', str(i), 0.0) for i in range(100)])
+        self.assertEqual(100, self.event_queue.qsize())
+        self.assertEqual(0, guard.summary()['dropped_rxd_lines'])
+        self.assertEqual('none', guard.summary()['overflow_policy'])
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, EventOverflowGuard, self.event_queue, self.event_queue, 10, 'ignore')
+
+    def test_drop_oldest_rxd_lines(self):
+        guard = EventOverflowGuard(self.event_queue, self.event_queue, max_size=2, policy='drop')
+        self.fill(guard, [('__rxd_line', 'a', 0.0), ('__rxd_line', 'b', 0.0)])
+        # Queue is full, next events are pending, oldest __rxd_line is dropped when there are more than 2
+        self.fill(guard, [('__rxd_line', 'c', 0.0), ('key', '1', 0.0), ('__rxd_line', 'd', 0.0), ('__rxd_line', 'e', 0.0)])
+        self.assertEqual(2, self.event_queue.qsize())
+        self.assertEqual(2, guard.summary()['dropped_rxd_lines'])
+        self.assertEqual([('__rxd_line', 'a', 0.0), ('__rxd_line', 'b', 0.0)], self.read_all())
+        guard.poll()
+        self.assertEqual([('key', '1', 0.0), ('__rxd_line', 'e', 0.0)], self.read_all())
+
+    def test_drop_never_drops_kv_events(self):
+        guard = EventOverflowGuard(self.event_queue, self.event_queue, max_size=1, policy='drop')
+        self.fill(guard, [('__rxd_line', 'a', 0.0)] + [('key', str(i), 0.0) for i in range(5)])
+        self.assertEqual(0, guard.summary()['dropped_rxd_lines'])
+        self.assertEqual(5, guard.summary()['max_pending'])
+        guard.flush()
+        self.assertEqual(6, len(self.read_all()))
+
+    def test_sample(self):
+        guard = EventOverflowGuard(self.event_queue, self.event_queue, max_size=1, policy='sample', sample_rate=3)
+        self.fill(guard, [('__rxd_line', str(i), 0.0) for i in range(7)] + [('key', 'v', 0.0)])
+        # First event fills the queue, then every 3rd __rxd_line passes
+        self.assertEqual(['0', '3', '6', 'v'], [value for _, value, _ in self.read_all()])
+        self.assertEqual(4, guard.summary()['dropped_rxd_lines'])
+
+    def test_sample_rate_ignores_kv_events(self):
+        guard = EventOverflowGuard(self.event_queue, self.event_queue, max_size=1, policy='sample', sample_rate=3)
+        guard.put(('__rxd_line', 'full', 0.0))
+        # Key-Value events between lines don't change which lines are passed
+        for i in range(6):
+            guard.put(('__rxd_line', str(i), 0.0))
+            guard.put(('key', str(i), 0.0))
+        values = [value for key, value, _ in self.read_all() if key == '__rxd_line']
+        self.assertEqual(['full', '2', '5'], values)
+        self.assertEqual(4, guard.summary()['dropped_rxd_lines'])
+
+    def test_block(self):
+        aborted = []
+        guard = EventOverflowGuard(self.event_queue, self.event_queue, max_size=1, policy='block',
+                                   abort=lambda: aborted.append(True) or len(aborted) > 2)
+        self.fill(guard, [('__rxd_line', 'a', 0.0), ('__rxd_line', 'b', 0.0)])
+        # Guard waited until abort() returned True and put event anyway
+        self.assertEqual(3, len(aborted))
+        self.assertEqual(2, self.event_queue.qsize())
+        self.assertTrue(guard.summary()['blocked_time'] > 0)
+        self.assertEqual(0, guard.summary()['dropped_rxd_lines'])
+
+
+class RingBufferQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = RingBufferQueue(size=256)
+
+    def tearDown(self):
+        pass
+
+    def test_put_get(self):
+        self.assertTrue(self.queue.empty())
+        self.queue.put(('__rxd_line', 'text', 1.5))
+        self.queue.put(('__notify_complete', None, 2.5))
+        self.assertEqual(2, self.queue.qsize())
+        self.assertEqual(('__rxd_line', 'text', 1.5), self.queue.get())
+        self.assertEqual(('__notify_complete', None, 2.5), self.queue.get())
+        self.assertTrue(self.queue.empty())
+
+    def test_empty_timeout(self):
+        self.assertRaises(Empty, self.queue.get, False)
+        self.assertRaises(Empty, self.queue.get, True, 0.01)
+
+    def test_wrap_around(self):
+        for i in range(100):
+            event = ('key', 'x' * (i % 50), float(i))
+            self.queue.put(event)
+            self.assertEqual(event, self.queue.get(block=False))
+
+    def test_full(self):
+        self.assertRaises(ValueError, self.queue.put, ('key', 'x' * 256, 0.0))
+        self.queue.put(('key', 'x' * 150, 0.0))
+        self.assertRaises(Full, self.queue.put, ('key', 'x' * 150, 0.0), False)
+
+    def test_batch_and_non_marshal_values(self):
+        batch = ('__batch', [('a', '1', 0.0), ('b', '2', 0.0)], 0.0)
+        self.queue.put(batch)
+        self.assertEqual(batch, self.queue.get())
+        self.queue.put(('key', Exception, 0.0))
+        self.assertEqual(('key', Exception, 0.0), self.queue.get())
+
+    def test_put_from_other_process(self):
+        def producer(queue):
+            for i in range(50):
+                queue.put(('key', str(i), 0.0))
+        p = Process(target=producer, args=(self.queue,))
+        p.start()
+        values = [self.queue.get(timeout=5)[1] for _ in range(50)]
+        p.join()
+        self.assertEqual([str(i) for i in range(50)], values)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from time import sleep
+from mbed_host_tests.host_tests_logger import HtrunLogger
+from mbed_host_tests.host_tests_runner.device_pool import DevicePoolScheduler
+from mbed_host_tests.host_tests_runner.device_pool import DevicePoolRunner
+
+
+class FakeRunner(object):
+    """! Runs jobs without DUTs, results are taken from 'results' map """
+
+    def __init__(self, results=None, duration=0.01):
+        self.results = results or {}    # (job name, DUT name) -> result, default 'success'
+        self.duration = duration
+        self.runs = []                  # (job name, DUT name, flash) in start order
+        self.prepare_threads = set()
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def prepare_job(self, device, job, flash):
+        self.prepare_threads.add(threading.current_thread().name)
+        self.runs.append((job['name'], device['name'], flash))
+        return (job['name'], device['name'])
+
+    def start_job(self, handle, done):
+        thread = threading.Thread(target=self.run_job, args=(handle, done))
+        thread.daemon = True
+        thread.start()
+
+    def run_job(self, handle, done):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        sleep(self.duration)
+        with self.lock:
+            self.running -= 1
+        done(self.results.get(handle, 'success'))
+
+
+class DevicePoolSchedulerTestCase(unittest.TestCase):
+
+    def devices(self, *platforms):
+        return [{'name' : '%s-%d'% (p, i), 'platform_name' : p} for i, p in enumerate(platforms)]
+
+    def jobs(self, *jobs):
+        return [{'name' : name, 'image_path' : image, 'platform_name' : platform} for name, image, platform in jobs]
+
+    def schedule(self, devices, jobs, runner, max_retries=1):
+        scheduler = DevicePoolScheduler(devices, runner, HtrunLogger('TEST'), max_retries)
+        scheduler.WAIT_PERIOD = 0.05
+        return scheduler.run(jobs)
+
+    def test_sharding(self):
+        runner = FakeRunner(duration=0.05)
+        jobs = self.jobs(*[('t%d'% i, 't%d.bin'% i, 'K64F') for i in range(6)])
+        results = self.schedule(self.devices('K64F', 'K64F', 'K64F'), jobs, runner)
+        self.assertEqual(6, len(results))
+        self.assertTrue(all(r['result'] == 'success' for r in results.values()))
+        # Jobs run on all boards at once, each board runs its share
+        self.assertEqual(3, runner.max_running)
+        self.assertEqual(set(['K64F-0', 'K64F-1', 'K64F-2']), set(r['device'] for r in results.values()))
+        # Jobs are prepared in scheduler thread only
+        self.assertEqual(set([threading.current_thread().name]), runner.prepare_threads)
+
+    def test_platform_matching(self):
+        runner = FakeRunner()
+        jobs = self.jobs(('a', 'a.bin', 'K64F'), ('b', 'b.bin', 'NUCLEO_F429ZI'), ('c', 'c.bin', 'LPC1768'))
+        results = self.schedule(self.devices('K64F', 'NUCLEO_F429ZI'), jobs, runner)
+        self.assertEqual('K64F-0', results['a']['device'])
+        self.assertEqual('NUCLEO_F429ZI-1', results['b']['device'])
+        # No board of this platform
+        self.assertEqual({'result' : 'not_detected', 'device' : None, 'attempts' : 0}, dict((k, results['c'][k]) for k in ('result', 'device', 'attempts')))
+
+    def test_affinity(self):
+        runner = FakeRunner()
+        jobs = self.jobs(('a1', 'a.bin', 'K64F'), ('b1', 'b.bin', 'K64F'), ('a2', 'a.bin', 'K64F'), ('a3', 'a.bin', 'K64F'))
+        self.schedule(self.devices('K64F'), jobs, runner)
+        # Jobs with image already on board are picked first and are not flashed again
+        self.assertEqual([('a1', 'K64F-0', True), ('a2', 'K64F-0', False), ('a3', 'K64F-0', False), ('b1', 'K64F-0', True)], runner.runs)
+
+    def test_affinity_kept_by_other_board(self):
+        scheduler = DevicePoolScheduler(self.devices('K64F', 'K64F'), FakeRunner())
+        scheduler.images = {'K64F-0' : 'a.bin', 'K64F-1' : 'b.bin'}
+        scheduler.pending = [{'job' : job, 'excluded' : set()} for job in
+                             self.jobs(('a', 'a.bin', 'K64F'), ('b', 'b.bin', 'K64F'), ('c', 'c.bin', 'K64F'))]
+        self.assertEqual('b', scheduler.next_job(scheduler.devices[1])['job']['name'])
+        scheduler.images = {'K64F-0' : 'a.bin'}
+        self.assertEqual('b', scheduler.next_job(scheduler.devices[1])['job']['name'])
+
+    def test_retry_infra_failure_on_other_board(self):
+        runner = FakeRunner({('a', 'K64F-0') : 'ioerr_copy', ('b', 'K64F-0') : 'failure'})
+        jobs = self.jobs(('a', 'a.bin', 'K64F'))
+        results = self.schedule(self.devices('K64F', 'K64F'), jobs, runner)
+        self.assertEqual({'result' : 'success', 'device' : 'K64F-1', 'attempts' : 2}, dict((k, results['a'][k]) for k in ('result', 'device', 'attempts')))
+        self.assertEqual([('a', 'K64F-0', True), ('a', 'K64F-1', True)], runner.runs)
+
+    def test_retry_limit(self):
+        runner = FakeRunner(dict((('a', 'K64F-%d'% i), 'ioerr_serial') for i in range(3)))
+        results = self.schedule(self.devices('K64F', 'K64F', 'K64F'), self.jobs(('a', 'a.bin', 'K64F')), runner, max_retries=1)
+        self.assertEqual(('ioerr_serial', 2), (results['a']['result'], results['a']['attempts']))
+
+    def test_test_failure_not_retried(self):
+        runner = FakeRunner({('a', 'K64F-0') : 'failure'})
+        results = self.schedule(self.devices('K64F', 'K64F'), self.jobs(('a', 'a.bin', 'K64F')), runner)
+        self.assertEqual(('failure', 1), (results['a']['result'], results['a']['attempts']))
+
+    def test_broken_board_removed_from_pool(self):
+        jobs = self.jobs(*[('t%d'% i, 't%d.bin'% i, 'K64F') for i in range(8)])
+        runner = FakeRunner(dict(((job['name'], 'K64F-0'), 'ioerr_disk') for job in jobs))
+        results = self.schedule(self.devices('K64F', 'K64F'), jobs, runner, max_retries=2)
+        self.assertTrue(all(r['result'] == 'success' and r['device'] == 'K64F-1' for r in results.values()))
+        self.assertEqual(DevicePoolScheduler.MAX_INFRA_FAILURES, len([r for r in runner.runs if r[1] == 'K64F-0']))
+
+    def test_runner_exception(self):
+        class BrokenRunner(FakeRunner):
+            def start_job(self, handle, done):
+                raise RuntimeError('broken')
+        results = self.schedule(self.devices('K64F'), self.jobs(('a', 'a.bin', 'K64F')), BrokenRunner())
+        self.assertEqual('error', results['a']['result'])
+
+
+class DevicePoolRunnerTestCase(unittest.TestCase):
+
+    class Options(object):
+        def __init__(self, jobs, devices):
+            self.jobs = jobs
+            self.devices = devices
+            self.job_retries = 1
+            self.micro = None
+            self.port = None
+            self.disk = None
+            self.batch = None
+            self.skip_flashing = False
+            self.timing_json = None
+            self.stage_workers = None
+
+    class SelectorMock(object):
+        """! Image can be copied only to DUT on port 'P0' """
+        stages = []
+
+        def __init__(self, options):
+            self.options = options
+            self.test_result = None
+            self.test_start_time = None
+            self.conn_prespawned = False
+
+        def prespawn_conn_process(self):
+            self.conn_prespawned = True
+
+        def start_test(self):
+            self.test_start_time = 0
+            self.stages.append(('start', self.options.port))
+
+        def flash_image(self):
+            self.stages.append(('flash', self.options.port))
+            if self.options.port != 'P0':
+                self.test_result = 'ioerr_copy'
+            return self.test_result is None
+
+        def wait_ready(self):
+            self.stages.append(('wait_ready', self.options.port))
+
+        def supervise_test(self):
+            self.stages.append(('supervise', self.options.port))
+            self.test_result = 'success'
+
+        def report_test(self):
+            self.stages.append(('report', self.options.port))
+
+        def finish_prespawned_conn_process(self):
+            pass
+
+        def finish(self):
+            pass
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.SelectorMock.stages = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_manifest(self, name, data):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        return path
+
+    def test_load_jobs(self):
+        options = self.Options(None, None)
+        options.micro = 'K64F'
+        runner = DevicePoolRunner(options)
+        jobs = runner.load_jobs(self.write_manifest('jobs.json', {'jobs' : [{'image_path' : 'BUILD/a.bin'},
+                                                                            {'image_path' : 'b.bin', 'platform_name' : 'LPC1768'}]}))
+        self.assertEqual([('a', 'K64F'), ('b', 'LPC1768')], [(j['name'], j['platform_name']) for j in jobs])
+        options.micro = None
+        for jobs in ([{'name' : 'a'}], [{'image_path' : 'a.bin'}], [{'image_path' : 'a.bin', 'platform_name' : 'K64F', 'port' : 'x'}]):
+            self.assertRaises(ValueError, runner.load_jobs, self.write_manifest('jobs.json', jobs))
+
+    def test_run(self):
+        jobs = self.write_manifest('jobs.json', [{'image_path' : 'a.bin', 'platform_name' : 'K64F'}])
+        devices = self.write_manifest('devices.json', [{'name' : 'bad', 'port' : 'P1', 'micro' : 'K64F'},
+                                                       {'name' : 'good', 'port' : 'P0', 'micro' : 'K64F'}])
+        runner = DevicePoolRunner(self.Options(jobs, devices), selector_class=self.SelectorMock)
+        runner.logger = HtrunLogger('TEST')
+        self.assertEqual(0, runner.run())
+        # Failed copy skips to teardown, job is retried on other DUT
+        self.assertEqual([('start', 'P1'), ('flash', 'P1'), ('report', 'P1'),
+                          ('start', 'P0'), ('flash', 'P0'), ('wait_ready', 'P0'), ('supervise', 'P0'), ('report', 'P0')],
+                         self.SelectorMock.stages)
+
+    def test_stage_workers(self):
+        runner = DevicePoolRunner(self.Options(None, None))
+        self.assertEqual({'flash' : 2, 'wait_ready' : 4, 'supervise' : 4, 'teardown' : 1}, runner.stage_workers('flash=2, teardown=1', 4))
+        self.assertEqual(dict((stage, 1) for stage in runner.STAGES), runner.stage_workers(None, 0))
+        for spec in ('copy=1', 'flash', 'flash=0', 'flash=x'):
+            self.assertRaises(ValueError, runner.stage_workers, spec, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -39,3 +39,21 @@ class TestEvenCallbackDecorator(unittest.TestCase):
         callbacks = h.get_callbacks()
         self.assertIn('Hi', callbacks)
         self.assertIn('Hello', callbacks)
+
+    def test_event_callback_decorator_concurrent(self):
+        class Ht(BaseHostTest):
+
+            @event_callback('Hi', concurrent=True)
+            def hi(self, key, value, timestamp):
+                print 'hi'
+
+            @event_callback('Hello')
+            def hello(self, key, value, timestamp):
+                print 'hello'
+
+            def setup(self):
+                self.register_callback('Hey', self.hello, concurrent=True)
+        h = Ht()
+        h.setup()
+        self.assertIn('Hi', h.get_callbacks())
+        self.assertEqual(set(['Hi', 'Hey']), h.get_concurrent_callbacks())
@@ -0,0 +1,503 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import re
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from time import time, sleep
+from collections import OrderedDict
+from Queue import Queue
+from mbed_host_tests import init_host_test_cli_params
+from mbed_host_tests import BaseHostTest, event_callback, HOSTREGISTRY
+from mbed_host_tests.host_tests_logger import HtrunLogger
+from mbed_host_tests.host_tests_conn_proxy import conn_proxy
+from mbed_host_tests.host_tests_conn_proxy.conn_proxy import serve_conn_sessions
+from mbed_host_tests.host_tests_conn_proxy.conn_primitive import ConnectorPrimitive
+from mbed_host_tests.host_tests_runner import host_test_default
+from mbed_host_tests.host_tests_runner.host_test_default import DefaultTestSelector
+
+
+# DUT events of test which passes
+SESSION_PASS = [('__sync', 'a1'), ('__version', '1.1.0'), ('__timeout', '5'),
+                ('__host_test_name', 'default_auto'), ('end', 'success'), ('__exit', '0')]
+# DUT events of test which lost connection to DUT
+SESSION_LOST = [('__sync', 'a2'), ('__version', '1.1.0'), ('__timeout', '5'),
+                ('__host_test_name', 'default_auto'), ('__notify_conn_lost', 'serial port closed')]
+
+
+class SelectorHostTest(BaseHostTest):
+    """! Host test used by run_test() tests """
+    name = 'selector_test'
+
+    def __init__(self):
+        BaseHostTest.__init__(self)
+        self.events = []
+        self.rxd_threads = set()   # Threads __rxd_line callback was called on
+
+    def setup(self):
+        self.register_callback('__rxd_line', self._rxd_line, force=True, concurrent=True)
+
+    def _rxd_line(self, key, value, timestamp):
+        self.rxd_threads.add(threading.current_thread().name)
+
+    @event_callback('echo')
+    def _echo(self, key, value, timestamp):
+        self.events.append(value)
+
+    @event_callback('reset')
+    def _reset(self, key, value, timestamp):
+        self.reset_dut(value)
+
+    @event_callback('fail', concurrent=True)
+    def _fail(self, key, value, timestamp):
+        raise ValueError(value)
+
+
+class FakeConnProcess(threading.Thread):
+    """! Stands in for connection process, each session replays list of DUT events """
+    FINISHED = ('__host_test_finished', True)
+
+    def __init__(self, event_queue, dut_event_queue, sessions, config=None):
+        """! ctor
+        @param sessions List of event lists, one for each session, shared by processes
+        @param config Configuration of first session, None if process waits for '__conn_config'
+        """
+        threading.Thread.__init__(self, name='FAKE-CONN')
+        self.daemon = True
+        self.event_queue = event_queue
+        self.dut_event_queue = dut_event_queue
+        self.sessions = sessions
+        self.configs = []       # Configuration of each session
+        self.host_events = []   # Events sent by host to DUT
+        self.config = config
+        self.exitcode = None
+        self.unread_at_join = None  # Number of events host did not read when it joined process
+
+    def run(self):
+        self.event_queue.put(('__conn_process_start', 1, time()))
+        self.exitcode = serve_conn_sessions(self.event_queue, self.dut_event_queue, self.config, HtrunLogger('TEST'), self.run_session)
+
+    def join(self, timeout=None):
+        if self.unread_at_join is None:
+            self.unread_at_join = self.event_queue.qsize()
+        threading.Thread.join(self, timeout)
+
+    def run_session(self, event_queue, dut_event_queue, config, logger):
+        self.configs.append(config)
+        events = self.sessions.pop(0) if self.sessions else []
+        # Events after FINISHED marker are sent when host finished session (e.g. ones held back)
+        held_back = []
+        if self.FINISHED in events:
+            held_back = events[events.index(self.FINISHED) + 1:]
+            events = events[:events.index(self.FINISHED)]
+        for key, value in events:
+            event_queue.put((key, value, time()))
+            if key == '__notify_conn_lost':
+                return  # Session ends on its own, see ConnSession.conn_lost()
+        while True:
+            (key, value, _) = dut_event_queue.get()
+            if key == '__host_test_finished':
+                for key, value in held_back:
+                    event_queue.put((key, value, time()))
+                return
+            self.host_events.append((key, value))
+
+    def terminate(self):
+        pass
+
+
+class FakeConnSelector(DefaultTestSelector):
+    """! Runs tests with FakeConnProcess, image copy and program cycle are skipped """
+
+    def __init__(self, options, sessions):
+        DefaultTestSelector.__init__(self, options)
+        self.sessions = sessions
+        self.processes = []
+        self.mbed.copy_image = lambda **kwargs: self.mbed.timing.update(copy=0.0) or True
+        self.mbed.wait_program_cycle = lambda: self.mbed.timing.update(program_cycle=0.0)
+        self.mbed.hw_reset = lambda: None
+
+    def prespawn_conn_process(self):
+        if self.conn_kept or self.conn_prespawned:
+            return
+        event_queue = Queue()
+        dut_event_queue = Queue()
+        p = FakeConnProcess(event_queue, dut_event_queue, self.sessions)
+        p.start()
+        self.processes.append(p)
+        self.conn_prespawned = (p, event_queue, dut_event_queue)
+
+
+class RunTestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        HOSTREGISTRY.register_host_test(SelectorHostTest.name, SelectorHostTest())
+
+    def tearDown(self):
+        HOSTREGISTRY.unregister_host_test(SelectorHostTest.name)
+
+    def run_test(self, events, args=None):
+        """! Run test on pre-spawned FakeConnProcess which sends events
+        @return Tuple (test result, selector)
+        """
+        options = init_host_test_cli_params(['-f', 'a.bin', '-p', 'FAKE:9600'] + (args or []))
+        selector = FakeConnSelector(options, [events])
+        selector.prespawn_conn_process()
+        return selector.run_test(), selector
+
+    def test_preamble_and_main_phase(self):
+        result, selector = self.run_test([('__sync', 'a1'), ('__version', '1.1.0'), ('echo', 'early'), ('__timeout', '5'),
+                                          ('__host_test_name', SelectorHostTest.name), ('echo', 'a'), ('echo', 'b'),
+                                          ('end', 'success'), ('__exit', '0')])
+        self.assertTrue(result)
+        self.assertEqual('1.1.0', selector.client_version)
+        # Events before host test is loaded are not passed to it
+        self.assertEqual(['a', 'b'], selector.test_supervisor.events)
+        self.assertIn('test', selector.timing)
+
+    def test_orphan_events(self):
+        result, selector = self.run_test([('__sync', 'a1'), ('__timeout', '5'), ('__host_test_name', SelectorHostTest.name),
+                                          ('unknown', '1'), ('__unknown', '2'), ('echo', 'a'), ('end', 'success'), ('__exit', '0')])
+        self.assertTrue(result)
+        self.assertEqual(['a'], selector.test_supervisor.events)
+
+    def test_coverage_start(self):
+        result, selector = self.run_test([('__sync', 'a1'), ('__timeout', '5'), ('__host_test_name', SelectorHostTest.name),
+                                          ('__coverage_start', 'a.gcda;0102'), ('__rxd_line', 'text'),
+                                          ('echo', 'after'), ('end', 'success'), ('__exit', '0')])
+        self.assertTrue(result)
+        # Event which ended coverage idle loop is handled
+        self.assertEqual(['after'], selector.test_supervisor.events)
+        # Concurrent callback called from coverage idle loop runs on worker thread
+        self.assertEqual(1, len(selector.test_supervisor.rxd_threads))
+        self.assertTrue(selector.test_supervisor.rxd_threads.pop().startswith('HTST-CB'))
+
+    def test_host_test_not_found(self):
+        start_time = time()
+        result, selector = self.run_test([('__sync', 'a1'), ('__timeout', '30'), ('__host_test_name', 'missing_host_test')])
+        # Loop ends with __exit_event_queue, not with timeout
+        self.assertEqual('error', result)
+        self.assertEqual(None, selector.test_supervisor)
+        self.assertLess(time() - start_time, 5)
+
+    def test_timeout(self):
+        start_time = time()
+        result, _ = self.run_test([('__sync', 'a1'), ('__timeout', '1'), ('__host_test_name', SelectorHostTest.name), ('echo', 'a')])
+        self.assertEqual('timeout', result)
+        # Loop waits until deadline set by __timeout, not for fixed period
+        self.assertGreaterEqual(time() - start_time, 1.0)
+        self.assertLess(time() - start_time, 3.0)
+
+    def test_drain_until_conn_process_end(self):
+        result, selector = self.run_test([('__sync', 'a1'), ('__timeout', '5'), ('__host_test_name', SelectorHostTest.name),
+                                          ('echo', 'a'), ('end', 'success'), ('__exit', '0'),
+                                          FakeConnProcess.FINISHED, ('echo', 'late')])
+        self.assertTrue(result)
+        # Events connection process sent after host finished test are consumed too
+        self.assertEqual(['a', 'late'], selector.test_supervisor.events)
+        self.assertEqual(0, selector.processes[0].unread_at_join)
+        self.assertEqual(0, selector.processes[0].exitcode)
+
+    def test_conn_lost(self):
+        result, selector = self.run_test(SESSION_LOST)
+        self.assertEqual('ioerr_serial', result)
+        self.assertFalse(selector.processes[0].is_alive())
+
+    def test_hardware_reset(self):
+        def process(target, args):
+            # Connection process started after reset
+            (event_queue, dut_event_queue, config) = args
+            p = FakeConnProcess(event_queue, dut_event_queue, self.sessions, config)
+            self.processes.append(p)
+            return p
+        self.processes = []
+        self.sessions = [[('echo', 'after'), ('end', 'success'), ('__exit', '0')]]
+        Process = host_test_default.Process
+        host_test_default.Process = process
+        try:
+            result, selector = self.run_test([('__sync', 'a1'), ('__timeout', '5'), ('__host_test_name', SelectorHostTest.name),
+                                              ('echo', 'before'), ('reset', DefaultTestSelector.RESET_TYPE_HW_RST),
+                                              FakeConnProcess.FINISHED, ('echo', 'last')])
+        finally:
+            host_test_default.Process = Process
+        self.assertTrue(result)
+        self.assertEqual(['before', 'last', 'after'], selector.test_supervisor.events)
+        # All events of stopped process were read before it was joined
+        self.assertEqual(0, selector.processes[0].unread_at_join)
+        self.assertEqual(1, len(self.processes))
+
+    def test_concurrent_callback_failure(self):
+        start_time = time()
+        result, _ = self.run_test([('__sync', 'a1'), ('__timeout', '30'), ('__host_test_name', SelectorHostTest.name), ('fail', 'x')])
+        self.assertEqual('error', result)
+        # Event loop doesn't wait for next event (or timeout) to notice failure
+        self.assertLess(time() - start_time, 5)
+
+
+class FakeConnector(ConnectorPrimitive):
+    """! DUT which answers __sync and then sends list of events """
+
+    def __init__(self, config, events):
+        ConnectorPrimitive.__init__(self, 'FAKE')
+        self.config = config
+        self.events = events
+        self.data = ''
+        self.lock = threading.Lock()
+        self.finished = False
+
+    def write(self, payload, log=False):
+        m = re.search(r'\{\{__sync;([^}]+)\}\}', payload)
+        if m:
+            with self.lock:
+                self.data += "{{__sync;%s}}\n"% m.group(1)
+                self.data += "".join("{{%s;%s}}\n"% event for event in self.events)
+        return payload
+
+    def read(self, count=None):
+        with self.lock:
+            data, self.data = self.data, ''
+        if not data:
+            sleep(0.01)
+        return data
+
+    def fileno(self):
+        return None
+
+    def connected(self):
+        return True
+
+    def error(self):
+        return self.LAST_ERROR
+
+    def finish(self):
+        self.finished = True
+
+
+class ThreadProcess(threading.Thread):
+    """! Runs connection process function in thread of test process """
+
+    def __init__(self, target, args):
+        threading.Thread.__init__(self, target=target, args=args)
+        self.exitcode = None
+
+    def terminate(self):
+        pass
+
+
+class PrespawnTestCase(unittest.TestCase):
+
+    def setUp(self):
+        HOSTREGISTRY.register_host_test(SelectorHostTest.name, SelectorHostTest())
+        self.connectors = []
+        # Pre-spawned connection process runs in thread and connects to FakeConnector
+        self.Process = host_test_default.Process
+        self.conn_primitive_factory = conn_proxy.conn_primitive_factory
+        host_test_default.Process = ThreadProcess
+        conn_proxy.conn_primitive_factory = self.connector
+        options = init_host_test_cli_params(['-f', 'a.bin', '-p', 'FAKE:9600', '--conn-engine', 'threads'])
+        self.selector = DefaultTestSelector(options)
+
+    def tearDown(self):
+        host_test_default.Process = self.Process
+        conn_proxy.conn_primitive_factory = self.conn_primitive_factory
+        HOSTREGISTRY.unregister_host_test(SelectorHostTest.name)
+
+    def connector(self, conn_resource, config, event_queue, logger):
+        connector = FakeConnector(config, [('__timeout', '5'), ('__host_test_name', SelectorHostTest.name),
+                                           ('echo', 'a'), ('end', 'success'), ('__exit', '0')])
+        self.connectors.append(connector)
+        return connector
+
+    def test_conn_config_handoff(self):
+        self.selector.prespawn_conn_process()
+        (p, _, _) = self.selector.conn_prespawned
+        # Process waits for configuration, it is not started twice
+        self.selector.prespawn_conn_process()
+        self.assertIs(p, self.selector.conn_prespawned[0])
+        self.assertTrue(p.is_alive())
+        self.assertEqual([], self.connectors)
+
+        self.assertTrue(self.selector.run_test())
+        self.assertEqual(None, self.selector.conn_prespawned)
+        self.assertEqual(['a'], self.selector.test_supervisor.events)
+        # Configuration sent by run_test() reached connection process
+        self.assertEqual(1, len(self.connectors))
+        self.assertEqual('FAKE', self.connectors[0].config['port'])
+        self.assertEqual(9600, self.connectors[0].config['baudrate'])
+        self.assertTrue(self.connectors[0].finished)
+        self.assertFalse(p.is_alive())
+
+    def test_discard_prespawned(self):
+        # e.g. image copy failed
+        self.selector.prespawn_conn_process()
+        (p, event_queue, _) = self.selector.conn_prespawned
+        self.selector.finish_prespawned_conn_process()
+        self.assertEqual(None, self.selector.conn_prespawned)
+        self.assertFalse(p.is_alive())
+        # Process never connected to DUT
+        self.assertEqual([], self.connectors)
+        self.assertEqual('__conn_process_start', event_queue.get(timeout=5)[0])
+        self.assertEqual('__conn_process_end', event_queue.get(timeout=5)[0])
+
+    def test_copy_failure(self):
+        self.selector.mbed.copy_image = lambda **kwargs: False
+        self.assertFalse(self.selector.flash_image())
+        self.assertEqual(self.selector.RESULT_IOERR_COPY, self.selector.test_result)
+        self.assertEqual(None, self.selector.conn_prespawned)
+        self.assertEqual([], self.connectors)
+
+
+class ReportTimingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.timing_json = os.path.join(self.tmp_dir, 'timing.json')
+        self.lines = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def selector(self, args):
+        selector = DefaultTestSelector(init_host_test_cli_params(['-f', 'a.bin', '-p', 'FAKE:9600'] + args))
+        selector.logger.prn_inf = self.lines.append
+        selector.logger.prn_err = self.lines.append
+        return selector
+
+    def test_report_timing(self):
+        selector = self.selector(['--timing-json', self.timing_json])
+        selector.timing = {'total' : 3.5, 'sync_resends' : 2, 'copy' : 1.25, 'sync' : 0.0004, 'unknown' : 1.0}
+        selector.report_timing()
+        # Phases are reported in TIMING_PHASES order, unknown ones are left out
+        self.assertEqual(["{{timing;copy=1.250,sync=0.000,sync_resends=2,total=3.500}}"], self.lines)
+        with open(self.timing_json) as f:
+            timing = json.load(f, object_pairs_hook=OrderedDict)
+        self.assertEqual(['copy', 'sync', 'sync_resends', 'total'], timing.keys())
+        self.assertEqual(1.25, timing['copy'])
+        self.assertAlmostEqual(0.0004, timing['sync'])
+        self.assertEqual(2, timing['sync_resends'])
+        self.assertEqual(3.5, timing['total'])
+
+    def test_report_timing_without_json(self):
+        selector = self.selector([])
+        selector.timing = {'test' : 0.5}
+        selector.report_timing()
+        self.assertEqual(["{{timing;test=0.500}}"], self.lines)
+        self.assertFalse(os.path.exists(self.timing_json))
+
+    def test_report_timing_write_error(self):
+        selector = self.selector(['--timing-json', os.path.join(self.tmp_dir, 'missing', 'timing.json')])
+        selector.timing = {'total' : 1.0}
+        selector.report_timing()
+        self.assertEqual("{{timing;total=1.000}}", self.lines[0])
+        self.assertIn("failed to write timing", self.lines[1])
+
+    def test_test_timing(self):
+        # Stage durations of whole test run end up in timing file
+        HOSTREGISTRY.register_host_test(SelectorHostTest.name, SelectorHostTest())
+        try:
+            selector = FakeConnSelector(init_host_test_cli_params(['-f', 'a.bin', '-p', 'FAKE:9600', '--timing-json', self.timing_json]),
+                [[('__sync', 'a1'), ('__timeout', '5'), ('__host_test_name', SelectorHostTest.name), ('end', 'success'), ('__exit', '0')]])
+            self.assertEqual(0, selector.execute_test())
+        finally:
+            HOSTREGISTRY.unregister_host_test(SelectorHostTest.name)
+        with open(self.timing_json) as f:
+            timing = json.load(f)
+        for phase in ['copy', 'program_cycle', 'conn_start', 'test', 'teardown', 'total']:
+            self.assertIn(phase, timing)
+            self.assertGreaterEqual(timing[phase], 0.0)
+        self.assertGreaterEqual(timing['total'], timing['test'])
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manifest = os.path.join(self.tmp_dir, 'batch.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def selector(self, manifest, sessions=None, args=None):
+        with open(self.manifest, 'w') as f:
+            json.dump(manifest, f)
+        options = init_host_test_cli_params(['-f', 'first.bin', '-p', 'FAKE:9600', '--batch', self.manifest] + (args or []))
+        return FakeConnSelector(options, sessions if sessions is not None else [])
+
+    def test_load_batch_manifest(self):
+        selector = self.selector({'tests' : [{'image_path' : 'BUILD/tests-basic.bin'},
+                                             {'name' : 'second', 'image_path' : 'b.bin', 'skip_flashing' : True}]})
+        tests = selector.load_batch_manifest(self.manifest)
+        self.assertEqual(['tests-basic', 'second'], [test['name'] for test in tests])
+        self.assertTrue(tests[1]['skip_flashing'])
+
+    def test_load_invalid_batch_manifest(self):
+        selector = self.selector([])
+        for manifest in ({'tests' : None}, [{'name' : 'x'}], [{'image_path' : 'a.bin', 'disk' : 'E:'}], 'a.bin'):
+            with open(self.manifest, 'w') as f:
+                json.dump(manifest, f)
+            self.assertRaises(ValueError, selector.load_batch_manifest, self.manifest)
+        self.assertRaises(IOError, selector.load_batch_manifest, os.path.join(self.tmp_dir, 'missing.json'))
+
+    def test_apply_batch_test(self):
+        selector = self.selector([])
+        options = selector.options
+        selector.apply_batch_test(options, {'name' : 'b', 'image_path' : '"b.bin"', 'copy_method' : 'cp', 'program_cycle_s' : 0.5})
+        self.assertEqual('b.bin', selector.mbed.image_path)
+        self.assertEqual('cp', selector.mbed.copy_method)
+        self.assertEqual(0.5, selector.mbed.program_cycle_s)
+        self.assertIs(selector.options, selector.mbed.options)
+        # Command line options are not changed, next test starts from them
+        self.assertEqual('first.bin', options.image_path)
+        selector.apply_batch_test(options, {'image_path' : 'c.bin'})
+        self.assertEqual(2.0, selector.mbed.program_cycle_s)
+
+    def test_execute_batch(self):
+        tests = [{'image_path' : 'a.bin'}, {'image_path' : 'b.bin', 'skip_flashing' : True}]
+        selector = self.selector(tests, [SESSION_PASS, SESSION_PASS])
+        self.assertEqual(0, selector.execute_batch())
+        # Connection process is kept alive for second test and stopped when batch ends
+        self.assertEqual(1, len(selector.processes))
+        self.assertEqual(2, len(selector.processes[0].configs))
+        self.assertFalse(selector.processes[0].is_alive())
+        self.assertEqual(None, selector.conn_kept)
+        self.assertEqual('b.bin', selector.processes[0].configs[1]['image_path'])
+
+    def test_execute_batch_conn_lost(self):
+        tests = [{'image_path' : 'a.bin'}, {'image_path' : 'b.bin'}]
+        selector = self.selector(tests, [SESSION_LOST, SESSION_PASS])
+        start_time = time()
+        result = selector.execute_batch()
+        self.assertEqual(selector.get_test_result_int(selector.RESULT_IO_SERIAL), result)
+        # Process which lost connection exits, next test doesn't wait for it
+        self.assertEqual(2, len(selector.processes))
+        self.assertEqual(selector.RESULT_SUCCESS, selector.test_result)
+        self.assertLess(time() - start_time, 5)
+        for p in selector.processes:
+            self.assertFalse(p.is_alive())
+
+    def test_execute_batch_invalid_manifest(self):
+        selector = self.selector({'tests' : 'a.bin'})
+        self.assertEqual(selector.get_test_result_int(selector.RESULT_ERROR), selector.execute_batch())
+
+
+if __name__ == '__main__':
+    unittest.main()
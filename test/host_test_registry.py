@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+from mbed_host_tests.host_tests_plugins.host_test_registry import HostTestRegistry
+from mbed_host_tests.host_tests_plugins.host_test_plugins import HostTestPluginBase
+
+
+class PluginMock(HostTestPluginBase):
+
+    def __init__(self, name, type, capabilities, setup_result=True):
+        HostTestPluginBase.__init__(self)
+        self.name = name
+        self.type = type
+        self.capabilities = capabilities
+        self.setup_result = setup_result
+
+    def setup(self, *args, **kwargs):
+        return self.setup_result
+
+    def execute(self, capability, *args, **kwargs):
+        return (self.name, capability, kwargs)
+
+
+class HostTestRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = HostTestRegistry()
+        self.registry.print_error = lambda text: self.errors.append(text)
+        self.errors = []
+
+    def test_call_plugin(self):
+        self.assertTrue(self.registry.register_plugin(PluginMock('Copy', 'CopyMethod', ['shell', 'cp'])))
+        self.assertTrue(self.registry.register_plugin(PluginMock('Reset', 'ResetMethod', ['default'])))
+        self.assertEqual(('Copy', 'cp', {'disk' : 'D:'}), self.registry.call_plugin('CopyMethod', 'cp', disk='D:'))
+        self.assertEqual(('Reset', 'default', {}), self.registry.call_plugin('ResetMethod', 'default'))
+        self.assertFalse(self.registry.call_plugin('ResetMethod', 'cp'))
+        self.assertFalse(self.registry.call_plugin('PowerMethod', 'default'))
+
+    def test_get_plugin_caps(self):
+        self.registry.register_plugin(PluginMock('Shell', 'CopyMethod', ['shell', 'cp']))
+        self.registry.register_plugin(PluginMock('Mbed', 'CopyMethod', ['shutil', 'default']))
+        self.assertEqual(['cp', 'default', 'shell', 'shutil'], self.registry.get_plugin_caps('CopyMethod'))
+        self.assertEqual([], self.registry.get_plugin_caps('ResetMethod'))
+        # Caller can't modify index
+        self.registry.get_plugin_caps('CopyMethod').append('x')
+        self.assertEqual(4, len(self.registry.get_plugin_caps('CopyMethod')))
+
+    def test_capability_conflict(self):
+        self.assertTrue(self.registry.register_plugin(PluginMock('Mbed', 'CopyMethod', ['shutil', 'default'])))
+        # Same capability name of other plugin type is not a conflict
+        self.assertTrue(self.registry.register_plugin(PluginMock('Reset', 'ResetMethod', ['default'])))
+        self.assertFalse(self.registry.register_plugin(PluginMock('Other', 'CopyMethod', ['other', 'default'])))
+        self.assertEqual(1, len(self.errors))
+        self.assertIn("default (Mbed)", self.errors[0])
+        self.assertNotIn('Other', self.registry.PLUGINS)
+        self.assertFalse(self.registry.call_plugin('CopyMethod', 'other'))
+        self.assertEqual('Mbed', self.registry.call_plugin('CopyMethod', 'default')[0])
+
+    def test_failed_plugin_not_indexed(self):
+        self.assertFalse(self.registry.register_plugin(PluginMock('Broken', 'CopyMethod', ['shell'], setup_result=False)))
+        self.assertFalse(self.registry.register_plugin(PluginMock('Broken', 'CopyMethod', ['cp'], setup_result=False)))
+        self.assertEqual([], self.registry.get_plugin_caps('CopyMethod'))
+        self.assertTrue(self.registry.register_plugin(PluginMock('Shell', 'CopyMethod', ['shell'])))
+        self.assertFalse(self.registry.register_plugin(PluginMock('Shell', 'CopyMethod', ['cp'])))
+        self.assertEqual(['shell'], self.registry.get_plugin_caps('CopyMethod'))
+
+    def test_default_registry(self):
+        from mbed_host_tests import host_tests_plugins
+        registry = host_tests_plugins.HOST_TEST_PLUGIN_REGISTRY
+        self.assertIn('shell', host_tests_plugins.get_plugin_caps('CopyMethod'))
+        for (type, capability), plugin in registry.plugins_by_cap.items():
+            self.assertEqual(type, plugin.type)
+            self.assertIn(capability, plugin.capabilities)
+            self.assertIs(plugin, registry.PLUGINS[plugin.name])
+
+
+if __name__ == '__main__':
+    unittest.main()
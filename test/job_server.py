@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from time import time, sleep
+from StringIO import StringIO
+import mbedhtrun_client
+from mbed_host_tests.host_tests_logger import HtrunLogger
+from mbed_host_tests.host_tests_runner.job_server import JobServer
+
+
+def run_job(argv):
+    """! Job handler run in job process """
+    if argv and argv[0] == 'exit':
+        sys.exit(int(argv[1]))
+    if argv and argv[0] == 'raise':
+        raise RuntimeError('job failed')
+    if argv and argv[0] == 'nul':
+        # Output which looked like end of job to NUL byte framing
+        sys.stdout.write("before\0" + "7\n")
+        sys.stdout.flush()
+        print "after"
+        return 3
+    if argv and argv[0] == 'wait':
+        # Job waits until client received its first line
+        sys.stdout.write("\0first\n")
+        sys.stdout.flush()
+        end_time = time() + 5
+        while not os.path.exists('received') and time() < end_time:
+            sleep(0.01)
+        print "second"
+        return 0
+    print "cwd=%s"% os.getcwd()
+    print "argv=%s"% ",".join(argv)
+    # Output of processes started by job goes to client too
+    os.system('echo from child')
+    sys.stderr.write("stderr\0line\n")
+    return len(argv)
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX') and hasattr(os, 'fork'), "POSIX only")
+class JobServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'htrun.sock')
+        self.server = JobServer(self.path, run_job, HtrunLogger('TEST'))
+        self.server.REAP_PERIOD = 0.05
+        # Socket is already listening, so test can connect as soon as setUp returns
+        self.server.listen()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.assertFalse(os.path.exists(self.path))
+        shutil.rmtree(self.tmp_dir)
+
+    def run_client(self, argv):
+        output = StringIO()
+        code = mbedhtrun_client.run_job(self.path, argv, self.tmp_dir, output)
+        return code, output.getvalue()
+
+    def test_job_output_and_result(self):
+        code, output = self.run_client(['-f', 'test.bin', '-p', 'COM4'])
+        self.assertEqual(4, code)
+        lines = output.splitlines()
+        self.assertEqual("cwd=%s"% os.path.realpath(self.tmp_dir), lines[0])
+        self.assertIn("argv=-f,test.bin,-p,COM4", lines)
+        self.assertIn("from child", lines)
+        # NUL byte in job output is not mistaken for end of job
+        self.assertIn("stderr\0line", lines)
+
+    def test_parallel_jobs(self):
+        results = []
+        def client(i):
+            results.append(self.run_client(['x'] * i)[0])
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([0, 1, 2, 3], sorted(results))
+
+    def test_nul_in_output(self):
+        self.assertEqual((3, "before\0" + "7\nafter\n"), self.run_client(['nul']))
+
+    def test_output_streamed(self):
+        class Output(StringIO):
+            # Tells job that output reached client while job is still running
+            def write(output, data):
+                StringIO.write(output, data)
+                if 'first' in output.getvalue():
+                    open(os.path.join(self.tmp_dir, 'received'), 'w').close()
+        output = Output()
+        start_time = time()
+        self.assertEqual(0, mbedhtrun_client.run_job(self.path, ['wait'], self.tmp_dir, output))
+        self.assertLess(time() - start_time, 3)
+        self.assertEqual("\0first\nsecond\n", output.getvalue())
+
+    def test_job_exit(self):
+        self.assertEqual((7, ''), self.run_client(['exit', '7']))
+
+    def test_job_exception(self):
+        code, output = self.run_client(['raise'])
+        self.assertEqual(-2, code)
+        self.assertIn("RuntimeError: job failed", output)
+
+    def test_server_not_running(self):
+        self.assertRaises(socket.error, mbedhtrun_client.run_job, os.path.join(self.tmp_dir, 'missing.sock'), [], '.', StringIO())
+
+
+class SplitConnectOptionTestCase(unittest.TestCase):
+
+    def test_split_connect_option(self):
+        self.assertEqual((None, ['-f', 'a.bin']), mbedhtrun_client.split_connect_option(['-f', 'a.bin']))
+        self.assertEqual(('/tmp/s', ['-f', 'a.bin']), mbedhtrun_client.split_connect_option(['--connect', '/tmp/s', '-f', 'a.bin']))
+        self.assertEqual(('/tmp/s', ['-f', 'a.bin']), mbedhtrun_client.split_connect_option(['-f', '--connect=/tmp/s', 'a.bin']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from mbed_host_tests.host_tests_runner.multi_dut import MultiDutRunner
+
+
+class MultiDutRunnerTestCase(unittest.TestCase):
+
+    class Options(object):
+        def __init__(self, devices):
+            self.devices = devices
+            self.port = None
+            self.disk = '/mnt/default'
+            self.batch = None
+            self.timing_json = None
+
+    class SelectorMock(object):
+        """! Passes test on DUTs which port ends with '0' """
+        executed = []
+        lock = threading.Lock()
+
+        def __init__(self, options):
+            self.options = options
+            self.test_result = None
+            self.conn_prespawned = False
+            self.finished = False
+
+        def prespawn_conn_process(self):
+            self.conn_prespawned = threading.current_thread().name
+
+        def execute(self):
+            with self.lock:
+                self.executed.append((self.options.port, self.options.disk, self.conn_prespawned))
+            self.test_result = 'success' if self.options.port.endswith('0') else 'failure'
+            return 0 if self.test_result == 'success' else 1
+
+        def finish_prespawned_conn_process(self):
+            pass
+
+        def finish(self):
+            pass
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.SelectorMock.executed = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_manifest(self, devices):
+        path = os.path.join(self.tmp_dir, 'devices.json')
+        with open(path, 'w') as f:
+            json.dump(devices, f)
+        return path
+
+    def test_load_devices(self):
+        runner = MultiDutRunner(self.Options(None))
+        path = self.write_manifest({'devices' : [{'port' : 'A'}, {'port' : 'B', 'target_id' : '0240'}]})
+        devices = runner.load_devices(path)
+        self.assertEqual(['dut0', '0240'], [d['name'] for d in devices])
+
+    def test_load_invalid_devices(self):
+        runner = MultiDutRunner(self.Options(None))
+        for devices in ([], [{'disk' : 'D:'}], [{'port' : 'A', 'speed' : 1}], [{'port' : 'A', 'name' : 'x'}, {'port' : 'B', 'name' : 'x'}]):
+            self.assertRaises(ValueError, runner.load_devices, self.write_manifest(devices))
+
+    def test_device_options(self):
+        options = self.Options(None)
+        options.timing_json = 'timing.json'
+        runner = MultiDutRunner(options)
+        dut_options = runner.device_options({'name' : 'k64f', 'port' : '/dev/ttyACM0'})
+        self.assertEqual('/dev/ttyACM0', dut_options.port)
+        self.assertEqual('/mnt/default', dut_options.disk)
+        self.assertEqual('timing-k64f.json', dut_options.timing_json)
+        # Command line options are not modified
+        self.assertEqual(None, options.port)
+        self.assertEqual('timing.json', options.timing_json)
+
+    def test_run(self):
+        path = self.write_manifest([{'name' : 'a', 'port' : 'P0', 'disk' : 'D0'}, {'name' : 'b', 'port' : 'P1'}])
+        runner = MultiDutRunner(self.Options(path), selector_class=self.SelectorMock)
+        self.assertEqual(1, runner.run())
+        self.assertEqual({'a' : 'success', 'b' : 'failure'}, dict((k, v['result']) for k, v in runner.results.iteritems()))
+        # Connection processes are started from main thread before DUT threads
+        main_thread = threading.current_thread().name
+        self.assertEqual(sorted([('P0', 'D0', main_thread), ('P1', '/mnt/default', main_thread)]), sorted(self.SelectorMock.executed))
+
+    def test_run_invalid_manifest(self):
+        runner = MultiDutRunner(self.Options(os.path.join(self.tmp_dir, 'missing.json')), selector_class=self.SelectorMock)
+        self.assertEqual(runner.get_test_result_int(runner.RESULT_ERROR), runner.run())
+        self.assertEqual([], self.SelectorMock.executed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+mbed SDK
+Copyright (c) 2011-2016 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import threading
+import unittest
+from mbed_host_tests.host_tests_logger import HtrunLogger
+from mbed_host_tests.host_tests_runner.pipeline import StagePipeline
+
+
+class StagePipelineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.log = []   # (stage, item)
+        self.done = []
+
+    def stage(self, name, passed=True):
+        def function(item):
+            with self.lock:
+                self.log.append((name, item))
+            return passed if not callable(passed) else passed(item)
+        return function
+
+    def on_done(self, item):
+        with self.lock:
+            self.done.append(item)
+
+    def test_stage_order(self):
+        pipeline = StagePipeline([('a', self.stage('a'), 2), ('b', self.stage('b'), 1), ('c', self.stage('c'), 3)], HtrunLogger('TEST'))
+        for item in range(5):
+            pipeline.submit(item, self.on_done)
+        pipeline.close()
+        self.assertEqual(range(5), sorted(self.done))
+        for item in range(5):
+            self.assertEqual(['a', 'b', 'c'], [stage for stage, i in self.log if i == item])
+        self.assertEqual(['a', 'b', 'c'], sorted(pipeline.stage_time))
+
+    def test_failed_item_skips_to_last_stage(self):
+        def raise_on_two(item):
+            if item == 2:
+                raise RuntimeError('stage failed')
+            return True
+        stages = [('flash', self.stage('flash', lambda item: item != 1), 1),
+                  ('supervise', self.stage('supervise', raise_on_two), 1),
+                  ('report', self.stage('report'), 1),
+                  ('teardown', self.stage('teardown', False), 1)]
+        pipeline = StagePipeline(stages, HtrunLogger('TEST'))
+        for item in range(3):
+            pipeline.submit(item, self.on_done)
+        pipeline.close()
+        self.assertEqual([0, 1, 2], sorted(self.done))
+        self.assertEqual(['flash', 'supervise', 'report', 'teardown'], [s for s, i in self.log if i == 0])
+        self.assertEqual(['flash', 'teardown'], [s for s, i in self.log if i == 1])
+        self.assertEqual(['flash', 'supervise', 'teardown'], [s for s, i in self.log if i == 2])
+
+    def test_slow_stage_does_not_block_other_stages(self):
+        flash_blocked = threading.Event()
+        supervised = threading.Event()
+
+        def flash(item):
+            if item == 'slow':
+                # Second item is supervised while first item's flashing is still running
+                flash_blocked.wait(5)
+            return True
+
+        def supervise(item):
+            if item == 'fast':
+                supervised.set()
+            return True
+
+        pipeline = StagePipeline([('flash', flash, 2), ('supervise', supervise, 1), ('teardown', self.stage('teardown'), 1)], HtrunLogger('TEST'))
+        pipeline.submit('slow', self.on_done)
+        pipeline.submit('fast', self.on_done)
+        self.assertTrue(supervised.wait(5))
+        flash_blocked.set()
+        pipeline.close()
+        self.assertEqual(['fast', 'slow'], self.done)
+
+
+if __name__ == '__main__':
+    unittest.main()